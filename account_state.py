@@ -0,0 +1,115 @@
+import time
+import asyncio
+from typing import NamedTuple
+import MetaTrader5 as mt5
+from event_log import log
+from metrics import metrics
+
+class AccountSnapshot(NamedTuple):
+    """ Estado de la cuenta en un instante. Es inmutable: todos los que lo leen ven los mismos valores. """
+    balance: float
+    equity: float
+    margin: float
+    margin_free: float
+    margin_level: float
+    ts: float # time.monotonic() del momento de la lectura
+
+
+class AccountState:
+    """ Servicio único de balance, equity y margen de la cuenta.
+
+    Una tarea (run) lee mt5.account_info con un intervalo adaptativo y publica el resultado como un AccountSnapshot:
+    - Sin margen usado (no hay posiciones abiertas): cada `idle_interval` segundos.
+    - Con posiciones abiertas: cada `open_interval` segundos.
+    - Con posiciones abiertas y la equity moviéndose más de `move_threshold` (fracción del balance) entre lecturas:
+      cada `active_interval` segundos.
+
+    Los consumidores usan `await account_state.get()`, que devuelve la última lectura sin llamar al broker. Si la
+    lectura tiene más de `max_age` segundos (o nunca se leyó, por ejemplo cuando run no está corriendo) se lee en
+    ese momento; las lecturas simultáneas se comparten. Después de un cambio que mueve el balance (una orden
+    ejecutada o una posición cerrada) se llama a invalidate() para que la próxima consulta lea de nuevo.
+
+    subscribe(callback) registra callback(snapshot, previous), que se llama en el bucle de eventos, sin await,
+    con cada lectura nueva. Si necesita hacer trabajo asíncrono, debe disparar un evento o una tarea.
+    """
+
+    def __init__(self, idle_interval=5.0, open_interval=1.0, active_interval=0.25, move_threshold=0.001, max_age=None):
+        self.idle_interval = idle_interval
+        self.open_interval = open_interval
+        self.active_interval = active_interval
+        self.move_threshold = move_threshold
+        self.max_age = idle_interval if max_age is None else max_age
+        self.snapshot = None
+        self.subscribers = []
+        self._stale = True
+        self._refreshing = None
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def invalidate(self):
+        self._stale = True
+
+    async def get(self) -> AccountSnapshot:
+        """ La última lectura, o una nueva si está vencida. None solo si la cuenta nunca se pudo leer. """
+        snapshot = self.snapshot
+        if snapshot is None or self._stale or time.monotonic() - snapshot.ts > self.max_age:
+            snapshot = await self.refresh()
+        return snapshot
+
+    async def refresh(self) -> AccountSnapshot:
+        """ Lee la cuenta ahora. Si ya hay una lectura en curso, espera esa en vez de hacer otra. """
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._read())
+        # shield: si quien espera se cancela, la lectura sigue para los demás
+        return await asyncio.shield(self._refreshing)
+
+    async def _read(self) -> AccountSnapshot:
+        self._stale = False # Antes de leer: si alguien invalida mientras tanto, la próxima consulta vuelve a leer
+        info = await asyncio.to_thread(mt5.account_info)
+        metrics.inc("bot_account_refresh_total")
+        if info is None:
+            log.error("No se pudo leer la cuenta", error_code=await asyncio.to_thread(mt5.last_error))
+            self._stale = True
+            return self.snapshot # La lectura anterior, o None si nunca se pudo leer
+
+        previous = self.snapshot
+        self.snapshot = AccountSnapshot(info.balance, info.equity, info.margin, info.margin_free, info.margin_level, time.monotonic())
+        for callback in self.subscribers:
+            try:
+                callback(self.snapshot, previous)
+            except Exception as e:
+                log.error("Error en un suscriptor del estado de la cuenta", error=str(e))
+        return self.snapshot
+
+    def next_interval(self, snapshot: AccountSnapshot, previous: AccountSnapshot) -> float:
+        if not snapshot.margin: return self.idle_interval
+        if previous is not None and snapshot.balance and \
+                abs(snapshot.equity - previous.equity) / snapshot.balance > self.move_threshold:
+            return self.active_interval
+        return self.open_interval
+
+    async def run(self):
+        metrics.gauge("bot_account_balance", lambda: self.snapshot.balance if self.snapshot else 0, "Balance de la cuenta")
+        metrics.gauge("bot_account_equity", lambda: self.snapshot.equity if self.snapshot else 0, "Equity de la cuenta")
+        metrics.gauge("bot_account_margin_level", lambda: self.snapshot.margin_level if self.snapshot else 0,
+                      "Nivel de margen de la cuenta (%)")
+        metrics.gauge("bot_account_snapshot_age_seconds", lambda: time.monotonic() - self.snapshot.ts if self.snapshot else -1,
+                      "Antigüedad de la última lectura de la cuenta")
+        try:
+            while True:
+                previous = self.snapshot
+                try:
+                    snapshot = await self.refresh()
+                    interval = self.next_interval(snapshot, previous) if snapshot else self.idle_interval
+                except Exception as e:
+                    log.error("Error al actualizar el estado de la cuenta", error=str(e))
+                    interval = self.idle_interval
+                await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            log.info("Estado de la cuenta detenido.")
+
+
+# Instancia compartida: el cálculo de volumen, el filtro de riesgo y la cobertura deben ver la misma lectura.
+account_state = AccountState()
+metrics.describe("bot_account_refresh_total", "Lecturas de account_info hechas por AccountState")
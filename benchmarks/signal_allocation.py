@@ -0,0 +1,78 @@
+""" Benchmark de memoria y tiempo por señal: representación anterior (dict de strings) vs strategy.Signal.
+
+La representación anterior se reproduce aquí tal como funcionaba el código antes del cambio:
+- catch_order devolvía un dict con los números como strings ("0.0", "0").
+- Por cada mensaje se creaba un Strategy (que copiaba el dict con setattr convirtiendo a float) y un Orders.
+- execute_order volvía a convertir los mismos campos con float().
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.signal_allocation
+"""
+import sys
+import time
+import tracemalloc
+from strategy import Signal
+
+N = 100_000
+PARAMS = {"distance": {"BTCUSD": 0}, "pessimistic_resistance": {"BTCUSD": 0}, "risk": {"BTCUSD": 0.03},
+          "volume": {"BTCUSD": 0.01}, "asset_regex": r"BTCUSD"}
+
+class LegacyOrders:
+    def __init__(self):
+        self.volumen_cobertura = 0
+        self.volumen_total = 0
+        self.cantidad_de_ordenes = 0
+        self.cobertura_activa = False
+        self.ticket_cobertura = 0
+
+class LegacyStrategy:
+    def __init__(self, cover, order, distance, pessimistic_resistance, risk, volume, asset_regex=r"[A-Z0-9]+"):
+        self.cover = cover
+        self.distance = distance
+        self.pessimistic_resistance = pessimistic_resistance
+        self.risk = risk
+        self.volume = volume
+        self.asset_regex = asset_regex
+        self.try_with_min_vol = False
+        for order_feature, order_value in order.items():
+            if order_feature in ("price", "stop_loss"):
+                try:
+                    order_value = float(order_value)
+                except (ValueError, TypeError):
+                    order_value = 0.0
+            setattr(self, order_feature, order_value)
+        self.orders = LegacyOrders() # filter_order creaba un Orders por mensaje
+
+def legacy_signal(i):
+    order = {"order_type": "Buy Limit", "asset": "BTCUSD", "price": f"{100000 + i}.5", "stop_loss": "73700",
+             "take_profit": "0.0", "volume": 0.01}
+    accept_order = LegacyStrategy(None, order, **PARAMS)
+    values = (float(order.get("price", 0.0)), float(order.get("stop_loss", 0.0)),
+              float(order.get("take_profit", 0.0)), float(order.get("volume", 0.0)))
+    return accept_order, values
+
+def typed_signal(i):
+    return Signal("Buy Limit", "BTCUSD", float(f"{100000 + i}.5"), 73700.0, 0.0, 0.01, float(f"{100000 + i}.5"))
+
+def measure(build):
+    tracemalloc.start()
+    kept = [build(i) for i in range(N)] # Conservamos las señales para medir lo que ocupan vivas
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+
+    started = time.perf_counter()
+    for i in range(N):
+        build(i)
+    elapsed = time.perf_counter() - started
+    return current / N, peak / N, elapsed / N * 1e6
+
+def main():
+    print(f"Python {sys.version.split()[0]}, {N} señales\n")
+    print(f"{'representación':<22}{'bytes vivos/señal':>20}{'pico/señal':>14}{'µs/señal':>12}")
+    for name, build in (("dict + Strategy", legacy_signal), ("Signal", typed_signal)):
+        live, peak, micros = measure(build)
+        print(f"{name:<22}{live:>20.0f}{peak:>14.0f}{micros:>12.2f}")
+
+if __name__ == "__main__":
+    main()
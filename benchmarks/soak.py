@@ -0,0 +1,393 @@
+""" Prueba de carga y resistencia de punta a punta del bot, sin Telegram ni MetaTrader 5 reales.
+
+Reemplaza el módulo MetaTrader5 por un broker simulado (con latencia y fallas configurables) y TelegramInput por
+una fuente que genera una mezcla de señales y charla a la tasa pedida. Sobre eso corren, igual que en main(),
+process_messages_loop (con TradingOrder y PendingOperations), monitor_coverage_loop, la cola de modificaciones,
+el estado de la cuenta y el watchdog del bucle. Cada `--report-every` segundos imprime una fila con:
+- procesados/s: mensajes que terminaron de procesarse en la ventana.
+- p50/p90/p99: latencia de punta a punta (desde que el mensaje entra a la cola hasta que el bucle pide el siguiente).
+- cola: mensajes esperando en la cola de Telegram (si crece sin parar, el bot no da abasto a esa tasa).
+- rss/traced: memoria del proceso y, con --tracemalloc, la asignada por Python.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.soak --rate 2000 --duration 60 --mt5-latency 0.002 --failure-rate 0.01
+"""
+import sys
+import time
+import types
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+AccountInfo = namedtuple("AccountInfo", "balance equity margin margin_free margin_level")
+SymbolInfo = namedtuple("SymbolInfo", "volume_min visible")
+Tick = namedtuple("Tick", "ask bid")
+TradeRequest = namedtuple("TradeRequest", "sl tp price volume")
+TradeResult = namedtuple("TradeResult", "retcode order price volume comment request")
+CheckResult = namedtuple("CheckResult", "retcode comment")
+Order = namedtuple("Order", "ticket symbol price_open volume_initial sl tp comment type type_filling type_time magic")
+Position = namedtuple("Position", "ticket symbol price_open volume sl tp comment type")
+
+class FakeMT5(types.ModuleType):
+    """ Broker simulado con la misma interfaz que el módulo MetaTrader5 (solo lo que usa el bot).
+
+    Cada llamada duerme `latency` segundos (± `jitter` como fracción), como la llamada real bloquea su hilo.
+    - failure_rate: Fracción de order_send que el broker rechaza (retcode 10006).
+    - none_rate: Fracción de order_send que devuelven None, como cuando el terminal pierde la conexión.
+    El precio hace una caminata aleatoria en cada consulta y las Buy Limit se ejecutan cuando el ask las alcanza.
+    """
+    TRADE_ACTION_DEAL, TRADE_ACTION_PENDING, TRADE_ACTION_SLTP, TRADE_ACTION_MODIFY, TRADE_ACTION_REMOVE = 1, 5, 6, 7, 8
+    ORDER_TYPE_BUY, ORDER_TYPE_SELL, ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_SELL_STOP = 0, 1, 2, 5
+    ORDER_FILLING_FOK, ORDER_FILLING_IOC, ORDER_TIME_GTC = 0, 1, 0
+    TRADE_RETCODE_DONE, TRADE_RETCODE_REJECT = 10009, 10006
+    DEAL_ENTRY_IN = 0
+
+    def __init__(self, latency=0.002, jitter=0.5, failure_rate=0.0, none_rate=0.0, balance=10_000.0, price=100_000.0, seed=0):
+        super().__init__("MetaTrader5")
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.none_rate = none_rate
+        self.balance = balance
+        self.price = price
+        self.random = random.Random(seed)
+        self.orders = {}
+        self.positions = {}
+        self.calls = 0
+        self._ticket = 0
+        self._lock = threading.Lock()
+
+    def _delay(self):
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency * (1 + self.jitter * (2 * self.random.random() - 1)))
+
+    def _next_ticket(self):
+        self._ticket += 1
+        return self._ticket
+
+    # --- Conexión y cuenta ---
+    def initialize(self): return True
+    def shutdown(self): pass
+    def last_error(self): return (1, "Success")
+
+    def account_info(self):
+        self._delay()
+        with self._lock:
+            floating = sum((self.price - p.price_open) * p.volume * (1 if p.type == 0 else -1) for p in self.positions.values())
+            margin = sum(p.price_open * p.volume / 100 for p in self.positions.values())
+        equity = self.balance + floating
+        return AccountInfo(self.balance, equity, margin, equity - margin, equity / margin * 100 if margin else 0.0)
+
+    def symbol_info(self, symbol):
+        self._delay()
+        return SymbolInfo(0.01, True)
+
+    def symbol_select(self, symbol, enable):
+        self._delay()
+        return True
+
+    def symbol_info_tick(self, symbol):
+        self._delay()
+        with self._lock:
+            self.price = max(1.0, self.price + self.random.gauss(0, 20))
+            bid = round(self.price, 2)
+            ask = round(self.price + 10, 2)
+            for ticket, order in list(self.orders.items()):
+                if order.type == self.ORDER_TYPE_BUY_LIMIT and ask <= order.price_open:
+                    del self.orders[ticket]
+                    self.positions[ticket] = Position(ticket, order.symbol, order.price_open, order.volume_initial,
+                                                      order.sl, order.tp, order.comment, self.ORDER_TYPE_BUY)
+        return Tick(ask, bid)
+
+    # --- Órdenes y posiciones ---
+    def positions_get(self, ticket=None, symbol=None):
+        self._delay()
+        with self._lock:
+            positions = tuple(self.positions.values())
+        return tuple(p for p in positions if (ticket is None or p.ticket == ticket) and (symbol is None or p.symbol == symbol))
+
+    def orders_get(self, ticket=None, symbol=None):
+        self._delay()
+        with self._lock:
+            orders = tuple(self.orders.values())
+        return tuple(o for o in orders if (ticket is None or o.ticket == ticket) and (symbol is None or o.symbol == symbol))
+
+    def history_deals_get(self, *args, **kwargs):
+        self._delay()
+        return ()
+
+    def order_check(self, request):
+        self._delay()
+        if request.get("volume", 0) <= 0: return CheckResult(10014, "Invalid volume")
+        return CheckResult(0, "Done")
+
+    def order_send(self, request):
+        self._delay()
+        draw = self.random.random()
+        if draw < self.none_rate: return None
+        trade_request = TradeRequest(request.get("sl", 0.0), request.get("tp", 0.0), request.get("price", 0.0), request.get("volume", 0.0))
+        if draw < self.none_rate + self.failure_rate:
+            return TradeResult(self.TRADE_RETCODE_REJECT, 0, 0.0, 0.0, "Request rejected", trade_request)
+
+        with self._lock:
+            action = request["action"]
+            ticket = 0
+            price = request.get("price", 0.0)
+            if action == self.TRADE_ACTION_DEAL and "position" in request:
+                position = self.positions.pop(request["position"], None)
+                if position is not None:
+                    direction = 1 if position.type == self.ORDER_TYPE_BUY else -1
+                    self.balance += (self.price - position.price_open) * position.volume * direction
+                ticket, price = request["position"], self.price
+            elif action == self.TRADE_ACTION_DEAL:
+                ticket = self._next_ticket()
+                price = self.price + 10 if request["type"] == self.ORDER_TYPE_BUY else self.price
+                self.positions[ticket] = Position(ticket, request["symbol"], price, request["volume"], request.get("sl", 0.0),
+                                                  request.get("tp", 0.0), request.get("comment", ""), request["type"])
+            elif action == self.TRADE_ACTION_PENDING:
+                ticket = self._next_ticket()
+                self.orders[ticket] = Order(ticket, request["symbol"], price, request["volume"], request.get("sl", 0.0),
+                                            request.get("tp", 0.0), request.get("comment", ""), request["type"],
+                                            request.get("type_filling", 0), request.get("type_time", 0), request.get("magic", 0))
+            elif action == self.TRADE_ACTION_REMOVE:
+                ticket = request["order"]
+                self.orders.pop(ticket, None)
+            elif action == self.TRADE_ACTION_SLTP:
+                ticket = request["position"]
+                if ticket in self.positions:
+                    self.positions[ticket] = self.positions[ticket]._replace(sl=request.get("sl", 0.0), tp=request.get("tp", 0.0))
+            elif action == self.TRADE_ACTION_MODIFY:
+                ticket = request["order"]
+                if ticket in self.orders:
+                    self.orders[ticket] = self.orders[ticket]._replace(price_open=request["price"], sl=request.get("sl", 0.0),
+                                                                       tp=request.get("tp", 0.0))
+        return TradeResult(self.TRADE_RETCODE_DONE, ticket, price, request.get("volume", 0.0), "Request executed", trade_request)
+
+
+class FakeMessage:
+    """ Lo mínimo de un mensaje de Telethon que usa TelegramInput.enqueue_message. """
+    __slots__ = ("chat_id", "id", "raw_text", "date")
+
+    def __init__(self, chat_id, message_id, raw_text):
+        self.chat_id = chat_id
+        self.id = message_id
+        self.raw_text = raw_text
+        self.date = datetime.now(timezone.utc)
+
+    async def get_sender(self):
+        return None
+
+
+CHATTER = ("Buenos días equipo, hoy el mercado viene lateral", "Recuerden respetar la gestión de riesgo 🙏",
+           "Excelente semana para todos!!", "¿Alguien más vio la noticia de la FED?", "Paciencia, el precio está consolidando")
+
+class SignalMix:
+    """ Genera mensajes con el formato del grupo "VIP Trading" alrededor del precio actual del broker simulado. """
+
+    def __init__(self, broker: FakeMT5, asset="BTCUSD", seed=1):
+        self.broker = broker
+        self.asset = asset
+        self.random = random.Random(seed)
+        self.kinds = ("compra", "venta", "buy_limit", "trailing", "cierre", "pendientes", "charla")
+        self.weights = (0.15, 0.05, 0.2, 0.1, 0.05, 0.05, 0.4)
+
+    def next(self) -> str:
+        price = round(self.broker.price)
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind == "compra": return f"Compra {self.asset} ${price} Sl: {price - 800} Tp: {price + 1500}"
+        if kind == "venta": return f"Venta {self.asset} ${price} Sl: {price + 800} Tp: {price - 1500}"
+        if kind == "buy_limit":
+            level = price - self.random.randrange(100, 3000, 50)
+            return f"Buy limit Creada {self.asset} ${level} Sl: {level - 1000}"
+        if kind == "trailing": return f"SL {self.asset} ${price - self.random.randrange(100, 600, 50)}"
+        if kind == "cierre": return f"Cierre {self.asset} ${price}"
+        if kind == "pendientes":
+            levels = [price - step for step in range(500, 3001, 500)]
+            return "ORDENES PENDIENTES\n" + "\n".join(f"Buy Limit {self.asset} {level} Sl: {level - 1000}" for level in levels)
+        return self.random.choice(CHATTER)
+
+
+class TimedQueue(asyncio.Queue):
+    """ Cola que anota en cada mensaje el momento en que entró. """
+
+    def put_nowait(self, item):
+        item["enqueued_at"] = time.perf_counter()
+        super().put_nowait(item)
+
+
+def build_source(base_class):
+    """ Crea la fuente falsa a partir de TelegramInput (se importa después de instalar el MT5 simulado). """
+
+    class FakeTelegramInput(base_class):
+        """ TelegramInput sin cliente de Telegram: los mensajes entran por enqueue_message como en el bot real. """
+
+        def __init__(self, registry, recovery):
+            self.registry = registry
+            self.chats = registry.chat_ids
+            self.recovery = recovery
+            self.queue = TimedQueue()
+            self._recovering = False
+            self._held_messages = []
+            self.latencies = []
+            self.processed = 0
+            self._current = None
+
+        async def get_message(self):
+            # El bucle pide el siguiente mensaje cuando terminó el anterior: ahí medimos la latencia de punta a punta
+            if self._current is not None:
+                self.latencies.append(time.perf_counter() - self._current)
+                self.processed += 1
+            message = await self.queue.get()
+            self._current = message["enqueued_at"]
+            return message
+
+        async def reply(self, chat_id, text):
+            pass
+
+    return FakeTelegramInput
+
+
+async def produce(source, mix, chat_id, rate, duration):
+    """ Encola `rate` mensajes por segundo durante `duration` segundos, en tandas cada 10 ms. """
+    started = time.perf_counter()
+    sent, message_id = 0, 0
+    while (elapsed := time.perf_counter() - started) < duration:
+        due = int(elapsed * rate) - sent
+        for _ in range(due):
+            message_id += 1
+            await source.enqueue_message(FakeMessage(chat_id, message_id, mix.next()))
+        sent += due
+        await asyncio.sleep(0.01)
+    return sent
+
+
+def percentiles(values) -> tuple:
+    if not values: return (float("nan"),) * 3
+    return tuple(np.percentile(np.asarray(values) * 1000, (50, 90, 99)))
+
+
+async def report(source, broker, every, rows, current_rss):
+    print(f"{'t(s)':>6}{'procesados/s':>14}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'cola':>8}"
+          f"{'órdenes':>9}{'posic.':>8}{'rss MB':>9}{'traced MB':>11}")
+    started = time.perf_counter()
+    seen_latencies, seen_processed = 0, 0
+    while True:
+        await asyncio.sleep(every)
+        window = source.latencies[seen_latencies:]
+        seen_latencies = len(source.latencies)
+        processed, seen_processed = source.processed - seen_processed, source.processed
+        p50, p90, p99 = percentiles(window)
+        traced = tracemalloc.get_traced_memory()[0] / 2**20 if tracemalloc.is_tracing() else float("nan")
+        row = {"t": time.perf_counter() - started, "throughput": processed / every, "p50": p50, "p90": p90, "p99": p99,
+               "queue": source.queue.qsize(), "orders": len(broker.orders), "positions": len(broker.positions),
+               "rss": current_rss() / 2**20, "traced": traced}
+        rows.append(row)
+        print(f"{row['t']:>6.0f}{row['throughput']:>14.1f}{p50:>10.1f}{p90:>10.1f}{p99:>10.1f}{row['queue']:>8}"
+              f"{row['orders']:>9}{row['positions']:>8}{row['rss']:>9.1f}{traced:>11.1f}")
+
+
+async def soak(args):
+    broker = FakeMT5(args.mt5_latency, args.jitter, args.failure_rate, args.none_rate, seed=args.seed)
+    sys.modules["MetaTrader5"] = broker # Antes de importar el bot, que hace `import MetaTrader5 as mt5`
+
+    import strategy
+    import telegram
+    from event_log import log
+    from trade_journal import journal
+    from metrics import metrics, instrument_mt5
+    from loop_watchdog import LoopWatchdog
+    from channels import ChannelRegistry, DEFAULT_CHANNELS
+    from gap_recovery import GapRecovery
+    from strategy_config import DEFAULT_CONFIG
+    from modification_queue import modification_queue
+    from account_state import account_state
+    from memory_telemetry import current_rss
+
+    workdir = tempfile.mkdtemp(prefix="soak-")
+    log.directory, log.echo, log.level = workdir, False, log.LEVELS[args.log_level]
+    journal.directory = f"{workdir}/journal"
+    log.start()
+    journal.start()
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(thread_name_prefix="mt5"))
+    instrument_mt5(broker)
+    if args.tracemalloc: tracemalloc.start()
+
+    registry = ChannelRegistry(DEFAULT_CHANNELS)
+    source = build_source(telegram.TelegramInput)(registry, GapRecovery(state_path=f"{workdir}/telegram_state.json"))
+    account = telegram.TradingAccount("USD")
+    cobertura = strategy.Coverage(**{**DEFAULT_CONFIG["cobertura"], "account_type": "USD"}) if args.coverage else None
+    estrategia = DEFAULT_CONFIG["estrategia"]
+    order_obj = telegram.TradingOrder(account, cobertura, estrategia)
+    pending_obj = telegram.PendingOperations(account, cobertura, estrategia)
+    watchdog = LoopWatchdog()
+    if cobertura: account_state.subscribe(cobertura.on_account_change)
+
+    print(f"Tasa {args.rate}/s durante {args.duration}s, latencia MT5 {args.mt5_latency * 1000:g} ms, "
+          f"rechazos {args.failure_rate:.1%}, None {args.none_rate:.1%}, cobertura {'sí' if args.coverage else 'no'}. "
+          f"Registros en {workdir}\n")
+    rows = []
+    started = time.perf_counter()
+    processor = asyncio.create_task(telegram.process_messages_loop(source, order_obj, pending_obj))
+    background = [asyncio.create_task(telegram.monitor_coverage_loop(bool(cobertura), cobertura, args.coverage_every)),
+                  asyncio.create_task(watchdog.run()),
+                  asyncio.create_task(account_state.run()),
+                  asyncio.create_task(report(source, broker, args.report_every, rows, current_rss))]
+    producer = asyncio.create_task(produce(source, SignalMix(broker, seed=args.seed), DEFAULT_CHANNELS[0].chat_id,
+                                           args.rate, args.duration))
+    sent = await producer
+    if args.drain:
+        while source.queue.qsize() and not processor.done():
+            await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    processor_died = processor.done()
+    for task in [processor, *background]:
+        task.cancel()
+    await asyncio.gather(processor, *background, return_exceptions=True)
+
+    p50, p90, p99 = percentiles(source.latencies)
+    accepted = registry.stats()[DEFAULT_CHANNELS[0].name]
+    print(f"\nMensajes generados: {sent} ({sent / args.duration:.0f}/s), descartados por el prefiltro: {accepted['rejected']}")
+    print(f"Procesados: {source.processed} en {elapsed:.1f}s ({source.processed / elapsed:.1f}/s), sin procesar: {source.queue.qsize()}")
+    print(f"Latencia de punta a punta (ms): p50 {p50:.1f}  p90 {p90:.1f}  p99 {p99:.1f}")
+    if rows:
+        print(f"Cola máxima: {max(row['queue'] for row in rows)}  RSS: {rows[0]['rss']:.1f} -> {rows[-1]['rss']:.1f} MB")
+    print(f"Lag máximo del bucle: {watchdog.max_lag * 1000:.1f} ms, bloqueos: {watchdog.blocked_events}")
+    print(f"Llamadas a MT5: {broker.calls}  Modificaciones: {modification_queue.stats()}")
+    print(f"Eventos del registro descartados por buffer lleno: {log.dropped}")
+    decisions = {dict(labels).get("reason"): value for (name, labels), value in metrics.counters.items()
+                 if name == "bot_filter_decisions_total"}
+    print(f"Decisiones del filtro: {decisions}")
+    if processor_died:
+        print("ATENCIÓN: process_messages_loop terminó antes de tiempo; ver el error en", log.path)
+
+    journal.stop()
+    log.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de punta a punta con Telegram y MT5 simulados")
+    parser.add_argument("--rate", type=float, default=1000, help="Mensajes por segundo (default: 1000)")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos generando mensajes (default: 30)")
+    parser.add_argument("--mt5-latency", type=float, default=0.002, help="Segundos por llamada a MT5 (default: 0.002)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Variación de la latencia como fracción (default: 0.5)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fracción de order_send rechazados por el broker")
+    parser.add_argument("--none-rate", type=float, default=0.0, help="Fracción de order_send que devuelven None")
+    parser.add_argument("--coverage", action="store_true", help="Activa la cobertura y su monitor")
+    parser.add_argument("--coverage-every", type=float, default=15, help="Segundos entre revisiones de la cobertura")
+    parser.add_argument("--report-every", type=float, default=5, help="Segundos entre filas del reporte")
+    parser.add_argument("--drain", action="store_true", help="Al terminar de generar, espera a que se vacíe la cola")
+    parser.add_argument("--tracemalloc", action="store_true", help="Reporta también la memoria asignada por Python")
+    parser.add_argument("--log-level", default="WARNING", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(soak(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
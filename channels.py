@@ -0,0 +1,186 @@
+import re
+from typing import NamedTuple
+from event_log import log
+from metrics import metrics
+
+# Formato de los mensajes del grupo "VIP Trading": (tipo_de_orden, plantilla). {asset} se reemplaza por el patrón de activos.
+DEFAULT_ORDER_TEMPLATES = (
+    ("Buy Limit", r"Buy limit Creada ({asset})"),
+    ("Buy Limit ", r"Buy Limit ({asset})"),
+    ("Compra", r"Compra\s({asset})"),
+    ("Venta", r"Venta\s({asset})"),
+    ("Trailing Stop", r"SL\s({asset})"),
+    ("Cierre", r"Cierre\s({asset})"),
+)
+DEFAULT_KEYWORDS = ("buy limit", "compra", "venta", "sl ", "cierre", "ordenes pendientes")
+# Magic de las órdenes que no son de un canal: la cobertura, los cierres y las que se envían sin perfil.
+DEFAULT_MAGIC = 1234
+
+class KeywordPrefilter:
+    """ Autómata de Aho-Corasick que indica si un texto contiene alguna de las palabras clave.
+
+    Recorre el mensaje una sola vez, sin importar cuántas palabras clave haya, y sin distinguir mayúsculas.
+    Sirve para descartar la charla de los canales antes de pasar por la cascada de expresiones regulares.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(keyword.lower() for keyword in keywords if keyword)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [False]
+        for keyword in self.keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    def _add(self, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(False)
+            state = next_state
+        self._output[state] = True
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for state in queue: # La lista crece mientras la recorremos: es un recorrido en anchura
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] or self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> bool:
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]: return True
+        return False
+
+
+REGEX_METACHARACTERS = set("^$.|?*+()[]{}\\")
+
+def template_keywords(templates) -> tuple:
+    """ Palabras clave deducidas de las plantillas: el texto fijo antes del primer espacio regex, grupo o {asset}.
+
+    Solo sirve para plantillas que empiezan con texto literal. Si de alguna no sale una palabra clave utilizable
+    (vacía o con metacaracteres, como en "^Compra" o "(?:Compra|Buy)\\s"), lanza ValueError: el prefiltro
+    descartaría todos los mensajes de ese tipo, así que el canal debe declarar sus "keywords".
+    """
+    keywords = set()
+    for order_type, template in templates:
+        keyword = re.split(r"\\s|\(|\{", template)[0].strip().lower()
+        if not keyword or REGEX_METACHARACTERS.intersection(keyword):
+            raise ValueError(f"No se puede deducir una palabra clave de la plantilla {template!r} ({order_type.strip()})")
+        keywords.add(keyword)
+    return tuple(sorted(keywords))
+
+
+class ChannelProfile(NamedTuple):
+    """ Cómo interpretar los mensajes de un chat.
+
+    - name: Nombre del canal para los registros y métricas.
+    - chat_id: Id del chat de Telegram.
+    - order_templates: Plantillas de cada tipo de orden (ver DEFAULT_ORDER_TEMPLATES).
+    - keywords: Palabras clave del prefiltro. Un mensaje sin ninguna de ellas se descarta sin interpretarlo.
+    - pending_marker: Texto que identifica el listado completo de órdenes pendientes.
+    - control: Si es True, el chat está autorizado a enviar comandos de control y sus mensajes no pasan por el prefiltro.
+    - magic: Magic con el que se envían las órdenes del canal, para saber de qué canal es cada orden pendiente.
+      Con 0, ChannelRegistry.register lo deduce del chat_id (ver default_magic).
+    """
+    name: str
+    chat_id: int
+    order_templates: tuple = DEFAULT_ORDER_TEMPLATES
+    keywords: tuple = DEFAULT_KEYWORDS
+    pending_marker: str = "ORDENES PENDIENTES"
+    control: bool = False
+    magic: int = 0
+
+    def owns(self, order) -> bool:
+        """ True si la orden la envió este canal. La cobertura nunca es de un canal. """
+        return order.magic == self.magic and order.comment != "cobertura"
+
+
+def default_magic(chat_id: int) -> int:
+    """ Magic de un canal que no declara el suyo. Depende solo del chat_id, así no cambia entre reinicios. """
+    return abs(chat_id) % (2**31 - 1)
+
+
+class ChannelRegistry:
+    """ Mapa de chat_id a ChannelProfile, con un prefiltro compilado por canal y contadores de mensajes por canal. """
+
+    def __init__(self, profiles=()):
+        self.profiles = {}
+        self.prefilters = {}
+        self.received = {}
+        self.rejected = {}
+        for profile in profiles:
+            self.register(profile)
+
+    def register(self, profile: ChannelProfile):
+        if not profile.magic: profile = profile._replace(magic=default_magic(profile.chat_id))
+        self.profiles[profile.chat_id] = profile
+        self.prefilters[profile.chat_id] = KeywordPrefilter(profile.keywords)
+        self.received.setdefault(profile.name, 0)
+        self.rejected.setdefault(profile.name, 0)
+
+    @property
+    def chat_ids(self) -> list:
+        return list(self.profiles)
+
+    def get(self, chat_id: int) -> ChannelProfile:
+        return self.profiles.get(chat_id)
+
+    def accepts(self, chat_id: int, text: str) -> bool:
+        """ Cuenta el mensaje y dice si vale la pena interpretarlo. """
+        profile = self.profiles.get(chat_id)
+        if profile is None: return False
+        self.received[profile.name] += 1
+        accepted = profile.control or self.prefilters[chat_id].search(text or "")
+        if not accepted: self.rejected[profile.name] += 1
+        metrics.inc("bot_channel_messages_total", (("channel", profile.name), ("result", "accepted" if accepted else "rejected")))
+        return accepted
+
+    def stats(self) -> dict:
+        """ {canal: {"received": n, "rejected": n, "reject_rate": fracción}} """
+        return {name: {"received": received, "rejected": self.rejected[name],
+                       "reject_rate": round(self.rejected[name] / received, 4) if received else 0.0}
+                for name, received in self.received.items()}
+
+    @classmethod
+    def from_config(cls, canales: list) -> "ChannelRegistry":
+        """ Crea el registro desde la sección "canales" de la configuración. Si está vacía, usa los canales por defecto. """
+        if not canales: return cls(DEFAULT_CHANNELS)
+        profiles = []
+        for canal in canales:
+            templates = tuple(canal["order_templates"].items()) if "order_templates" in canal else DEFAULT_ORDER_TEMPLATES
+            pending_marker = canal.get("pending_marker", "ORDENES PENDIENTES")
+            control = canal.get("control", False)
+            # Los chats de control no pasan por el prefiltro: no hace falta deducir sus palabras clave
+            keywords = canal.get("keywords") or (() if control else template_keywords(templates) + (pending_marker,))
+            profiles.append(ChannelProfile(
+                name=canal.get("name", str(canal["chat_id"])),
+                chat_id=canal["chat_id"],
+                order_templates=templates,
+                keywords=tuple(keywords),
+                pending_marker=pending_marker,
+                control=control,
+                magic=canal.get("magic", 0),
+            ))
+        log.info("Canales registrados", canales=[profile.name for profile in profiles])
+        return cls(profiles)
+
+
+DEFAULT_CHANNELS = (
+    ChannelProfile("VIP Trading", -1003169821641),
+    ChannelProfile("control", 6685390587, control=True),
+)
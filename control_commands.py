@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import asyncio
+import cProfile
+import pstats
+from event_log import log
+from metrics import metrics
+
+HELP = """Comandos disponibles:
+/profile start - Empieza a perfilar el bucle de eventos con cProfile
+/profile stop - Detiene el perfil, lo guarda en un archivo y responde con las funciones más costosas
+/profile dump - Guarda el perfil acumulado hasta ahora sin detenerlo
+/stats - Latencias, contadores y estado de las colas
+/help - Este mensaje"""
+
+class ControlCommands:
+    """ Comandos de diagnóstico que se envían desde un chat de control (ver channels.ChannelProfile.control).
+
+    Permiten perfilar el proceso en producción sin reiniciarlo (y sin perder el estado de la cobertura, la cola de
+    modificaciones, etc.). cProfile mide el hilo del bucle de eventos, que es donde corre el camino de las señales;
+    lo que pasa dentro de asyncio.to_thread aparece como el tiempo de espera del await.
+
+    Argumentos:
+    - reply: Corrutina reply(chat_id, texto) que responde en Telegram.
+    - directory: Carpeta donde se guardan los archivos .prof (se abren con `python -m pstats` o snakeviz).
+    - top: Cantidad de funciones que se incluyen en las respuestas.
+    """
+
+    def __init__(self, reply, directory="profiles", top=15):
+        self.reply = reply
+        self.directory = directory
+        self.top = top
+        self.sources = {} # {nombre: función sin argumentos que devuelve un dict}, para /stats
+        self.profiler = None
+        self.profile_started = None
+        self.saved_profiles = 0
+
+    def add_source(self, name: str, function):
+        """ Agrega una sección a la respuesta de /stats. """
+        self.sources[name] = function
+
+    @staticmethod
+    def is_command(text: str) -> bool:
+        return (text or "").lstrip().startswith("/")
+
+    async def handle(self, text: str, chat_id: int):
+        """ Ejecuta el comando y responde en el mismo chat. """
+        command = " ".join(text.split()).lower()
+        log.info("Comando de control recibido", command=command, chat_id=chat_id)
+        metrics.inc("bot_control_commands_total", (("command", command.split()[0] if command else ""),))
+        try:
+            if command == "/profile start":
+                response = self.start_profile()
+            elif command == "/profile stop":
+                response = await self.stop_profile()
+            elif command == "/profile dump":
+                response = await self.dump_profile()
+            elif command == "/stats":
+                response = self.stats()
+            else:
+                response = HELP
+        except Exception as e:
+            log.error("Error al ejecutar el comando de control", command=command, error=str(e))
+            response = f"Error al ejecutar {command}: {e}"
+        await self.reply(chat_id, response[:4000]) # Telegram no acepta mensajes de más de 4096 caracteres
+
+    def start_profile(self) -> str:
+        if self.profiler is not None: return "El perfil ya está corriendo."
+        self.profiler = cProfile.Profile()
+        self.profile_started = time.monotonic()
+        self.profiler.enable() # Debe llamarse desde el hilo del bucle, que es el que queremos medir
+        return "Perfil iniciado."
+
+    async def stop_profile(self) -> str:
+        if self.profiler is None: return "No hay un perfil corriendo."
+        profiler, self.profiler = self.profiler, None
+        profiler.disable()
+        return await self._save(profiler, stopped=True)
+
+    async def dump_profile(self) -> str:
+        if self.profiler is None: return "No hay un perfil corriendo."
+        self.profiler.disable()
+        try:
+            stats = pstats.Stats(self.profiler)
+        finally:
+            self.profiler.enable()
+        return await self._save(stats, stopped=False)
+
+    async def _save(self, profiler_or_stats, stopped: bool) -> str:
+        stats = profiler_or_stats if isinstance(profiler_or_stats, pstats.Stats) else pstats.Stats(profiler_or_stats)
+        self.saved_profiles += 1
+        path = os.path.join(self.directory, time.strftime("perfil-%Y%m%d-%H%M%S") + f"-{self.saved_profiles}.prof")
+        await asyncio.to_thread(self._write, stats, path)
+        elapsed = time.monotonic() - self.profile_started
+        log.info("Perfil guardado", path=path, seconds=round(elapsed, 1), stopped=stopped)
+        state = "detenido" if stopped else "sigue corriendo"
+        return f"Perfil de {elapsed:.1f} s guardado en {path} ({state}).\n\n" + self.top_functions(stats)
+
+    def _write(self, stats, path):
+        os.makedirs(self.directory, exist_ok=True)
+        stats.dump_stats(path)
+
+    def top_functions(self, stats: pstats.Stats) -> str:
+        """ Las funciones con mayor tiempo acumulado: acumulado, propio, llamadas y ubicación. """
+        lines = ["acum(s) propio(s) llamadas función"]
+        ranking = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+        for (filename, lineno, name), (_, calls, own_time, cumulative_time, _) in ranking:
+            lines.append(f"{cumulative_time:.3f} {own_time:.3f} {calls} {os.path.basename(filename)}:{lineno}({name})")
+        return "\n".join(lines)
+
+    def stats(self) -> str:
+        summary = metrics.summary()
+        lines = []
+        for name, function in self.sources.items():
+            try:
+                lines.append(f"{name}: {json.dumps(function(), default=str, ensure_ascii=False)}")
+            except Exception as e:
+                lines.append(f"{name}: error ({e})")
+        lines.append("\nLatencias (ms, n / p50 / p90 / p99):")
+        for name, values in sorted(summary["latencies"].items()):
+            lines.append(f"{name} {values['count']} / {values['p50'] * 1000:g} / {values['p90'] * 1000:g} / {values['p99'] * 1000:g}")
+        lines.append("\nContadores:")
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines)
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+class EventLogger:
+    """ Registro estructurado de eventos que no bloquea el bucle de asyncio.
+
+    Cada llamada a log() solo agrega una tupla a un buffer circular en memoria (deque con maxlen),
+    operación atómica y sin I/O. Un hilo en segundo plano vacía el buffer, escribe cada evento como
+    una línea JSON en un archivo rotativo y, opcionalmente, lo muestra por consola.
+
+    Argumentos:
+    - directory: Carpeta donde se guardan los archivos de registro.
+    - base_name: Nombre base del archivo. El archivo activo es <base_name>.jsonl y los rotados <base_name>.jsonl.1, .2, ...
+    - max_bytes: Tamaño máximo del archivo activo antes de rotarlo.
+    - backup_count: Cantidad de archivos rotados que conservamos.
+    - capacity: Cantidad máxima de eventos en el buffer. Si el escritor no alcanza a vaciarlo, se descartan los más antiguos.
+    - level: Nivel mínimo que se registra (DEBUG, INFO, WARNING, ERROR).
+    - echo: Si es True, el hilo escritor también imprime los eventos en la terminal.
+    - flush_interval: Cada cuántos segundos despierta el escritor si nadie lo avisa antes.
+    """
+
+    LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+    def __init__(self, directory="logs", base_name="eventos", max_bytes=5_000_000, backup_count=5,
+                 capacity=10_000, level="INFO", echo=True, flush_interval=0.5):
+        self.directory = directory
+        self.base_name = base_name
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.level = self.LEVELS[level]
+        self.echo = echo
+        self.flush_interval = flush_interval
+        self.buffer = deque(maxlen=capacity)
+        self.dropped = 0 # Eventos perdidos porque el buffer estaba lleno
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"{self.base_name}.jsonl")
+
+    # --- Lado productor (bucle de eventos) ---
+
+    def log(self, level: str, message: str, /, **fields):
+        """ Encola un evento. No hace I/O ni serializa: eso queda para el hilo escritor. """
+        if self.LEVELS[level] < self.level: return
+        if len(self.buffer) == self.buffer.maxlen: self.dropped += 1
+        self.buffer.append((time.time(), level, message, fields))
+
+    def debug(self, message: str, /, **fields):
+        self.log("DEBUG", message, **fields)
+
+    def info(self, message: str, /, **fields):
+        self.log("INFO", message, **fields)
+
+    def warning(self, message: str, /, **fields):
+        self.log("WARNING", message, **fields)
+
+    def error(self, message: str, /, **fields):
+        self.log("ERROR", message, **fields)
+
+    # --- Lado consumidor (hilo escritor) ---
+
+    def start(self):
+        """ Inicia el hilo escritor. Es idempotente. """
+        if self._thread is not None and self._thread.is_alive(): return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """ Detiene el hilo escritor después de vaciar lo que quede en el buffer. """
+        if self._thread is None: return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def flush(self):
+        """ Pide al escritor que vacíe el buffer ahora, sin esperar al intervalo. """
+        self._wakeup.set()
+
+    def _run(self):
+        try:
+            self._file = open(self.path, "a", encoding="utf-8")
+            while not self._stop.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self._drain()
+            self._drain()
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _drain(self):
+        lines = []
+        while True:
+            try:
+                timestamp, level, message, fields = self.buffer.popleft()
+            except IndexError:
+                break
+            record = {"ts": round(timestamp, 6), "level": level, "msg": message}
+            if fields:
+                record.update({key: _to_serializable(value) for key, value in fields.items()})
+            lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            if self.echo:
+                self._echo(timestamp, level, message, fields)
+        if not lines: return
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _echo(self, timestamp, level, message, fields):
+        hora = time.strftime("%H:%M:%S", time.localtime(timestamp))
+        detalle = " ".join(f"{key}={_to_serializable(value)}" for key, value in fields.items())
+        print(f"[{hora}] {level:<7} {message} {detalle}".rstrip())
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+
+def _to_serializable(value):
+    """ Convierte los namedtuple de MT5 (TradeResult, TradeRequest, ...) en diccionarios anidados.
+    Se ejecuta en el hilo escritor, de modo que el bucle de eventos solo guarda la referencia al objeto.
+    """
+    if hasattr(value, "_asdict"):
+        return {key: _to_serializable(item) for key, item in value._asdict().items()}
+    if isinstance(value, dict):
+        return {key: _to_serializable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_serializable(item) for item in value]
+    return value
+
+
+# Instancia compartida por todos los módulos del bot. main() la inicia y la detiene.
+log = EventLogger()
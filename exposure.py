@@ -0,0 +1,67 @@
+class Exposure:
+    """ Sumas acumuladas por activo de las órdenes activas y pendientes: Σ(precio·volumen), Σvolumen y cantidad.
+
+    Cada orden se registra por ticket, así que agregar, quitar o modificar una orden cuesta O(1) y las consultas
+    de stop out, cobertura y riesgo también son O(1), sin recorrer la grilla. sync() reconcilia las sumas con la
+    lista completa que devuelve el broker tocando solo los tickets que cambiaron.
+
+    Todas las consultas aceptan una orden hipotética (price, volume) para responder "¿cómo queda si agrego esta?".
+    Se asume, como en la cobertura, que las órdenes son compras.
+    """
+
+    def __init__(self):
+        self.tickets = {} # {ticket: (activo, precio, volumen)}
+        self.assets = {} # {activo: [Σ precio·volumen, Σ volumen, cantidad]}
+
+    def add(self, ticket, asset: str, price: float, volume: float):
+        if ticket in self.tickets: self.remove(ticket)
+        self.tickets[ticket] = (asset, price, volume)
+        totals = self.assets.setdefault(asset, [0.0, 0.0, 0])
+        totals[0] += price * volume
+        totals[1] += volume
+        totals[2] += 1
+
+    def remove(self, ticket):
+        entry = self.tickets.pop(ticket, None)
+        if entry is None: return
+        asset, price, volume = entry
+        totals = self.assets[asset]
+        totals[2] -= 1
+        if totals[2] == 0:
+            del self.assets[asset] # Sin órdenes volvemos a cero exacto, sin arrastrar error de redondeo
+            return
+        totals[0] -= price * volume
+        totals[1] -= volume
+
+    def sync(self, entries):
+        """ entries: iterable de (ticket, activo, precio, volumen) con todas las órdenes vigentes. """
+        seen = set()
+        for ticket, asset, price, volume in entries:
+            seen.add(ticket)
+            if self.tickets.get(ticket) != (asset, price, volume):
+                self.add(ticket, asset, price, volume)
+        for ticket in self.tickets.keys() - seen:
+            self.remove(ticket)
+
+    def totals(self, asset: str) -> tuple:
+        """ (Σ precio·volumen, Σ volumen, cantidad) del activo. """
+        totals = self.assets.get(asset)
+        return tuple(totals) if totals else (0.0, 0.0, 0)
+
+    def stop_out(self, asset: str, balance: float, price: float = 0.0, volume: float = 0.0) -> float:
+        """ Precio al que el balance se consume por completo: precio_promedio - balance / Σvolumen. 0 si no hay volumen. """
+        sum_pv, sum_v, _ = self.totals(asset)
+        sum_pv += price * volume
+        sum_v += volume
+        if sum_v == 0: return 0
+        return round(sum_pv / sum_v - balance / sum_v, 2)
+
+    def hedge_price(self, asset: str, balance: float, margin: float, price: float = 0.0, volume: float = 0.0) -> float:
+        """ Precio de la cobertura: el stop out más `margin` por cada orden (incluida la hipotética). """
+        count = self.totals(asset)[2] + (1 if volume else 0)
+        return self.stop_out(asset, balance, price, volume) + count * margin
+
+    def remaining_balance(self, asset: str, balance: float, resistance: float, price: float = 0.0, volume: float = 0.0) -> float:
+        """ Balance que quedaría si el precio baja hasta `resistance` con todas las órdenes ejecutadas. """
+        sum_pv, sum_v, _ = self.totals(asset)
+        return balance - (sum_pv + price * volume - resistance * (sum_v + volume))
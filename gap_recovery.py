@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime, timezone
+from event_log import log
+from metrics import metrics
+from strategy_config import compile_order_patterns
+
+# Tipos de orden a mercado: si llegan tarde, el precio ya no es el del mensaje y no se deben ejecutar.
+MARKET_ORDER_TYPES = ("Compra", "Venta")
+
+class GapRecovery:
+    """ Recupera los mensajes que se perdieron mientras la conexión con Telegram estuvo caída.
+
+    Guarda el id del último mensaje procesado de cada chat (también en disco, para cubrir reinicios). Un mensaje
+    cuenta como procesado cuando process_messages_loop terminó con él (done), no cuando entra a la cola: si el bot
+    se cae con mensajes en la cola, esos mensajes se recuperan al volver. Al reconectar
+    descarga en lotes los mensajes posteriores y los reenvía en orden. Cada mensaje se clasifica con el
+    ChannelProfile de su chat (plantillas y pending_marker del canal):
+    - Las señales a mercado (Compra/Venta) más antiguas que `max_signal_age` segundos se descartan.
+    - De los listados de órdenes pendientes solo se aplica el último de cada chat, que ya contiene el estado completo.
+    - Los chats de control no se recuperan: sus comandos (quit, /profile...) no se repiten.
+
+    Argumentos:
+    - state_path: Archivo JSON donde se persisten los últimos ids por chat.
+    - max_signal_age: Antigüedad máxima, en segundos, de una señal a mercado para seguir siendo válida.
+    """
+
+    def __init__(self, state_path="telegram_state.json", max_signal_age=120):
+        self.state_path = state_path
+        self.max_signal_age = max_signal_age
+        self.last_ids = self._load() # {chat_id: id} hasta el que todo está procesado; es lo que se guarda en disco
+        self.received = {} # {chat_id: mayor id recibido}, para descartar duplicados
+        self.in_flight = {} # {chat_id: ids en la cola o procesándose}
+        self.last_recovery = None # Resumen de la última recuperación
+        self._dirty = False
+        self._saved_at = 0.0
+
+    def _load(self) -> dict:
+        try:
+            with open(self.state_path, encoding="utf-8") as file:
+                return {int(chat_id): message_id for chat_id, message_id in json.load(file).items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as e:
+            log.warning("No se pudo leer el estado de Telegram, se parte desde cero", path=self.state_path, error=str(e))
+            return {}
+
+    def _take_snapshot(self) -> dict:
+        """ Copia de los últimos ids. Se toma en el bucle, donde seen() modifica el diccionario, y marca el estado
+        como guardado: si llega un mensaje mientras se escribe la copia, vuelve a quedar pendiente de guardar. """
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        return dict(self.last_ids)
+
+    def _write(self, last_ids: dict):
+        temporary = self.state_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({str(chat_id): message_id for chat_id, message_id in last_ids.items()}, file)
+        os.replace(temporary, self.state_path)
+
+    def save(self):
+        """ Escribe los últimos ids en disco desde el hilo actual. Para el cierre; en el bucle usar save_async. """
+        self._write(self._take_snapshot())
+
+    async def save_async(self):
+        """ Copia los ids en el bucle y escribe la copia en disco con asyncio.to_thread. """
+        last_ids = self._take_snapshot()
+        try:
+            await asyncio.to_thread(self._write, last_ids)
+        except OSError as e:
+            self._dirty = True # Se reintenta en el próximo needs_save
+            log.error("No se pudo guardar el estado de Telegram", path=self.state_path, error=str(e))
+
+    def needs_save(self, every=5.0) -> bool:
+        return self._dirty and time.monotonic() - self._saved_at >= every
+
+    def seen(self, chat_id: int, message_id: int) -> bool:
+        """ True si el mensaje ya se recibió (procesado o todavía en la cola). Si no, lo registra como recibido.
+        Solo sirve para descartar duplicados: el mensaje no cuenta como procesado hasta llamar a done(). """
+        if message_id <= max(self.last_ids.get(chat_id, 0), self.received.get(chat_id, 0)): return True
+        self.received[chat_id] = message_id
+        return False
+
+    def hold(self, chat_id: int, message_id: int):
+        """ Marca un mensaje como pendiente: entró a la cola y falta procesarlo. """
+        self.in_flight.setdefault(chat_id, set()).add(message_id)
+
+    def done(self, chat_id: int, message_id: int):
+        """ El mensaje terminó de procesarse (o se descartó sin encolarlo). Avanza el último id del chat hasta donde
+        todo lo recibido está procesado: si quedan pendientes, hasta el anterior al más antiguo de ellos. """
+        pending = self.in_flight.get(chat_id)
+        if pending: pending.discard(message_id)
+        processed = min(pending) - 1 if pending else self.received.get(chat_id, message_id)
+        if processed > self.last_ids.get(chat_id, 0):
+            self.last_ids[chat_id] = processed
+            self._dirty = True
+
+    async def catch_up(self, client, registry, on_message):
+        """ Descarga los mensajes posteriores al último procesado de cada chat del registro (channels.ChannelRegistry)
+        y entrega a on_message los vigentes, en orden. """
+        started = time.perf_counter()
+        missed = []
+        for chat_id, profile in registry.profiles.items():
+            if profile.control: continue
+            last_id = self.last_ids.get(chat_id)
+            if last_id is None: continue # Primera vez que escuchamos este chat: no hay hueco que recuperar
+            # iter_messages descarga el historial en lotes de 100 mensajes (el máximo de la API) y en orden cronológico
+            async for message in client.iter_messages(chat_id, min_id=last_id, reverse=True):
+                missed.append(message)
+        if not missed: return
+
+        replay, dropped = self.select(missed, registry)
+        for message in replay:
+            await on_message(message)
+        # Los descartados también cuentan como procesados, para no volver a descargarlos
+        for message in dropped:
+            self.seen(message.chat_id, message.id)
+            self.done(message.chat_id, message.id)
+
+        elapsed = time.perf_counter() - started
+        self.last_recovery = {"missed": len(missed), "replayed": len(replay), "dropped": len(dropped), "seconds": round(elapsed, 3)}
+        metrics.observe("bot_telegram_recovery_seconds", elapsed)
+        metrics.inc("bot_telegram_recovered_messages_total", (("result", "replayed"),), len(replay))
+        metrics.inc("bot_telegram_recovered_messages_total", (("result", "dropped"),), len(dropped))
+        log.info("Mensajes perdidos recuperados", **self.last_recovery)
+
+    def select(self, messages: list, registry) -> tuple:
+        """ Separa los mensajes recuperados en (a_repetir, descartados), con los primeros ordenados por fecha e id. """
+        messages = sorted(messages, key=lambda message: (message.date, message.id))
+        now = datetime.now(timezone.utc)
+        latest_snapshot = {}
+        for message in messages:
+            profile = registry.get(message.chat_id)
+            if profile and profile.pending_marker in (message.raw_text or ""):
+                latest_snapshot[message.chat_id] = message.id
+
+        replay, dropped = [], []
+        for message in messages:
+            text = message.raw_text or ""
+            profile = registry.get(message.chat_id)
+            if profile is None or profile.control:
+                keep = False
+            elif profile.pending_marker in text:
+                keep = latest_snapshot[message.chat_id] == message.id
+            elif self.is_market_signal(profile, text):
+                keep = (now - message.date).total_seconds() <= self.max_signal_age
+            else:
+                keep = True
+            (replay if keep else dropped).append(message)
+        return replay, dropped
+
+    @staticmethod
+    def is_market_signal(profile, text: str) -> bool:
+        """ True si el texto es una orden a mercado según las plantillas del canal. """
+        return any(order_match.search(text) for order_type, order_match in compile_order_patterns(templates=profile.order_templates)
+                   if order_type.strip() in MARKET_ORDER_TYPES)
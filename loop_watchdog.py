@@ -0,0 +1,90 @@
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from event_log import log
+from metrics import metrics
+
+class LoopWatchdog:
+    """ Vigila que el bucle de eventos no se bloquee.
+
+    - Una tarea del bucle duerme `interval` segundos y mide cuánto tarda en despertar de más (lag del bucle).
+    - Un hilo aparte revisa el último latido de esa tarea. Si pasa más de `threshold` segundos sin latir,
+      el bucle está ocupado en un callback bloqueante: tomamos el stack del hilo del bucle en ese momento
+      y lo dejamos en el registro de eventos.
+    - Marca el hilo del bucle en las métricas, de modo que las llamadas a MT5 instrumentadas que se ejecuten
+      en él (y no en asyncio.to_thread) queden contadas en bot_mt5_calls_on_loop_total.
+
+    Argumentos:
+    - interval: Cada cuántos segundos medimos el lag.
+    - threshold: Segundos sin latido a partir de los cuales consideramos que el bucle está bloqueado.
+    - report_every: Cada cuántos segundos resumimos en el registro las llamadas a MT5 hechas en el bucle.
+    """
+
+    def __init__(self, interval=0.1, threshold=0.25, report_every=300):
+        self.interval = interval
+        self.threshold = threshold
+        self.report_every = report_every
+        self.max_lag = 0.0
+        self.blocked_events = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._reported_calls = {}
+
+    async def run(self):
+        self._loop_thread_id = threading.get_ident()
+        metrics.loop_thread_id = self._loop_thread_id
+        metrics.gauge("bot_loop_max_lag_seconds", lambda: self.max_lag, "Mayor lag del bucle de eventos observado")
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        sampler = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        sampler.start()
+        last_report = time.monotonic()
+
+        try:
+            while True:
+                before = time.monotonic()
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = max(0.0, now - before - self.interval)
+                self._heartbeat = now
+                self.max_lag = max(self.max_lag, lag)
+                metrics.observe("bot_loop_lag_seconds", lag)
+
+                if now - last_report >= self.report_every:
+                    last_report = now
+                    self.report_loop_calls()
+        except asyncio.CancelledError:
+            log.info("Watchdog del bucle de eventos detenido.")
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        """ Hilo que detecta bloqueos mientras ocurren y captura el stack del código responsable. """
+        stalled_since = None
+        while not self._stop.wait(self.threshold / 2):
+            silence = time.monotonic() - self._heartbeat - self.interval
+            if silence < self.threshold:
+                stalled_since = None
+                continue
+            if stalled_since == self._heartbeat: continue # Este bloqueo ya fue reportado
+            stalled_since = self._heartbeat
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<stack no disponible>"
+            self.blocked_events += 1
+            metrics.inc("bot_loop_blocked_total")
+            log.warning("Bucle de eventos bloqueado", blocked_seconds=round(silence, 3), stack=stack)
+
+    def loop_calls(self) -> dict:
+        """ Devuelve {función_mt5: cantidad} de las llamadas a MT5 ejecutadas en el hilo del bucle. """
+        return {dict(labels)["function"]: value for (name, labels), value in list(metrics.counters.items())
+                if name == "bot_mt5_calls_on_loop_total"}
+
+    def report_loop_calls(self):
+        calls = self.loop_calls()
+        if calls == self._reported_calls: return
+        self._reported_calls = calls
+        log.warning("Llamadas a MT5 ejecutadas en el hilo del bucle de eventos", calls=calls)
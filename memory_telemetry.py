@@ -0,0 +1,158 @@
+import gc
+import os
+import time
+import asyncio
+import tracemalloc
+from collections import Counter, deque
+from event_log import log
+from metrics import metrics
+
+try:
+    import psutil # Opcional: si no está, leemos /proc/self/statm (Linux) o no reportamos RSS
+except ImportError:
+    psutil = None
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+def current_rss() -> int:
+    """ Memoria residente del proceso en bytes, o 0 si no se puede medir. """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class MemoryTelemetry:
+    """ Telemetría de memoria para sesiones largas.
+
+    Cada `interval` segundos toma una instantánea de tracemalloc, el RSS del proceso y la cantidad de objetos vivos
+    por tipo. Compara la instantánea con la anterior para obtener los lugares del código que más memoria sumaron y
+    guarda un resumen en un historial acotado. Las primeras `warmup` muestras (cachés, conexiones y colas que se
+    llenan al arrancar) no se comparan: la referencia es la muestra más antigua del historial tomada después del
+    arranque. Si el RSS, la memoria rastreada o la cantidad de objetos de un tipo crecen más de `growth_threshold`
+    respecto de ella, lo avisa en el registro junto con los mayores asignadores desde el fin del arranque.
+
+    Costo: la muestra corre con asyncio.to_thread, pero take_snapshot, compare_to y gc.get_objects retienen el GIL
+    mientras recorren el heap, así que el bucle de eventos queda detenido lo que dure la muestra. Ese tiempo crece
+    con la cantidad de bloques rastreados y de objetos vivos (del orden de decenas a cientos de ms en un heap de
+    algunos cientos de miles de objetos) y queda en bot_memory_sample_seconds y en el campo "seconds" del resumen.
+    Además, mientras tracemalloc está activo cada asignación de Python es más lenta y ocupa memoria extra para su
+    traza (más con más `frames`). Por eso es opcional y con un intervalo largo.
+
+    Argumentos:
+    - interval: Segundos entre muestras.
+    - history: Cantidad de resúmenes que se conservan (144 muestras de 10 minutos = 24 horas).
+    - top: Cantidad de asignadores y tipos que se guardan en cada resumen.
+    - growth_threshold: Crecimiento relativo (0.2 = 20 %) a partir del cual se avisa.
+    - min_objects: Cantidad mínima de objetos de un tipo para considerar su crecimiento (evita avisos por tipos raros).
+    - frames: Profundidad del stack que guarda tracemalloc por asignación. Más frames, más costo.
+    - warmup: Cantidad de muestras iniciales que no se usan como referencia (3 muestras de 10 minutos = 30 minutos).
+    """
+
+    def __init__(self, interval=600, history=144, top=10, growth_threshold=0.2, min_objects=5000, frames=1, warmup=3):
+        self.interval = interval
+        self.warmup = warmup
+        self.top = top
+        self.growth_threshold = growth_threshold
+        self.min_objects = min_objects
+        self.frames = frames
+        self.history = deque(maxlen=history)
+        self.warnings = 0
+        self.samples = 0
+        self._baseline = None
+        self._previous = None
+        self._started_tracing = False
+
+    async def run(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        metrics.gauge("bot_memory_rss_bytes", lambda: self.history[-1]["rss"] if self.history else 0,
+                      "Memoria residente del proceso en la última muestra")
+        metrics.gauge("bot_memory_traced_bytes", lambda: self.history[-1]["traced"] if self.history else 0,
+                      "Memoria asignada por Python según tracemalloc en la última muestra")
+        try:
+            while True:
+                await asyncio.to_thread(self.sample)
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            log.info("Telemetría de memoria detenida.", samples=len(self.history), warnings=self.warnings)
+        finally:
+            self._baseline = self._previous = None
+            self.samples = 0
+            if self._started_tracing: tracemalloc.stop()
+
+    def sample(self) -> dict:
+        """ Toma una muestra, la agrega al historial y revisa el crecimiento (síncrona; ver el costo en la clase). """
+        started = time.perf_counter()
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        traced, peak = tracemalloc.get_traced_memory()
+        types = Counter(type(obj).__name__ for obj in gc.get_objects())
+
+        top_allocators = []
+        if self._previous is not None:
+            for stat in snapshot.compare_to(self._previous, "lineno")[:self.top]:
+                frame = stat.traceback[0]
+                top_allocators.append({"where": f"{frame.filename}:{frame.lineno}", "size_diff": stat.size_diff,
+                                       "count_diff": stat.count_diff, "size": stat.size})
+        self.samples += 1
+        warmup = self.samples <= self.warmup
+        if self._baseline is None and not warmup: self._baseline = snapshot # Referencia de top_since_start
+        self._previous = snapshot
+
+        summary = {
+            "ts": time.time(),
+            "rss": current_rss(),
+            "traced": traced,
+            "traced_peak": peak,
+            "objects": sum(types.values()),
+            "types": dict(types.most_common(self.top)),
+            "_all_types": types, # Se usa para comparar tipos fuera del top; no se registra
+            "top_allocators": top_allocators,
+            "warmup": warmup,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        metrics.observe("bot_memory_sample_seconds", summary["seconds"])
+        self.history.append(summary)
+        self.check_growth(summary)
+        return summary
+
+    def check_growth(self, summary: dict) -> list:
+        """ Compara la muestra con la más antigua del historial posterior al arranque y avisa lo que creció más del umbral. """
+        oldest = next((item for item in self.history if not item["warmup"]), None)
+        if oldest is None or oldest is summary: return []
+        grown = []
+        for key in ("rss", "traced", "objects"):
+            if oldest[key] and (summary[key] - oldest[key]) / oldest[key] > self.growth_threshold:
+                grown.append((key, oldest[key], summary[key]))
+        for name, count in summary["_all_types"].most_common():
+            if count < self.min_objects: break
+            before = oldest["_all_types"].get(name, 0)
+            if before and (count - before) / before > self.growth_threshold:
+                grown.append((f"type:{name}", before, count))
+        if grown:
+            self.warnings += 1
+            metrics.inc("bot_memory_growth_warnings_total")
+            log.warning("La memoria del bot sigue creciendo", window_seconds=round(summary["ts"] - oldest["ts"]),
+                        grown={key: {"before": before, "now": now} for key, before, now in grown},
+                        top_since_start=self.top_since_start())
+        return grown
+
+    def top_since_start(self) -> list:
+        """ Los lugares del código que más memoria sumaron desde la primera muestra posterior al arranque. """
+        if self._baseline is None or self._previous is None: return []
+        return [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size_diff / 1024:+.1f} KiB"
+                for stat in self._previous.compare_to(self._baseline, "lineno")[:self.top]]
+
+    def stats(self) -> dict:
+        """ Resumen de la última muestra, para consultas puntuales. """
+        if not self.history: return {}
+        last = self.history[-1]
+        return {key: value for key, value in last.items() if not key.startswith("_")}
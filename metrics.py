@@ -0,0 +1,205 @@
+import time
+import asyncio
+import functools
+import threading
+from bisect import bisect_left
+from event_log import log
+
+# Límites (en segundos) de los histogramas de latencia. Cubren desde llamadas locales a MT5 hasta envíos lentos al broker.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Funciones de MT5 que instrumentamos. Dejamos fuera las constantes y las de conexión (initialize, shutdown).
+MT5_FUNCTIONS = ("account_info", "symbol_info", "symbol_info_tick", "symbol_select", "positions_get",
+                 "orders_get", "order_send", "order_check", "history_deals_get", "history_orders_get", "last_error")
+
+class Metrics:
+    """ Registro de métricas en memoria expuesto en formato de texto de Prometheus.
+
+    Las actualizaciones no usan locks: cada métrica es una entrada de diccionario (o una lista de buckets)
+    que se incrementa en el lugar. Desde el bucle de eventos esto es exacto; desde los hilos de asyncio.to_thread
+    se podría perder algún incremento en una carrera, algo aceptable para monitoreo a cambio de no bloquear nunca.
+
+    - counters: {(nombre, etiquetas): valor}
+    - histograms: {(nombre, etiquetas): [cuentas_por_bucket, suma, total]}
+    - gauges: {nombre: función sin argumentos que devuelve el valor al momento de consultar}
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+        self.loop_thread_id = None # Lo fija el watchdog para saber qué llamadas ocurren en el hilo del bucle
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+        histogram[0][bisect_left(self.buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def gauge(self, name: str, function, help_text: str = ""):
+        """ Registra una métrica cuyo valor se calcula solo cuando alguien la consulta. """
+        self.gauges[name] = function
+        if help_text: self.help[name] = help_text
+
+    def describe(self, name: str, help_text: str):
+        self.help[name] = help_text
+
+    def render(self) -> str:
+        """ Genera el texto en formato de exposición de Prometheus (versión 0.0.4). """
+        lines = []
+        for name, items in _group(self.counters).items():
+            self._header(lines, name, "counter")
+            for labels, value in items:
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        for name, items in _group(self.histograms).items():
+            self._header(lines, name, "histogram")
+            for labels, (counts, total_sum, total_count) in items:
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {total_count}")
+                lines.append(f"{name}_sum{_labels(labels)} {total_sum}")
+                lines.append(f"{name}_count{_labels(labels)} {total_count}")
+
+        for name, function in list(self.gauges.items()):
+            try:
+                value = function()
+            except Exception as e:
+                log.warning("No se pudo calcular la métrica", metric=name, error=str(e))
+                continue
+            self._header(lines, name, "gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """ Vista compacta para leer a mano: contadores y, por histograma, cantidad, promedio y percentiles 50/90/99.
+
+        Los percentiles se estiman con el límite superior del bucket donde caen, así que son cotas, no valores exactos.
+        """
+        counters = {f"{name}{_labels(labels)}": value for (name, labels), value in list(self.counters.items())}
+        latencies = {}
+        for (name, labels), (counts, total_sum, total_count) in list(self.histograms.items()):
+            if not total_count: continue
+            latencies[f"{name}{_labels(labels)}"] = {"count": total_count, "mean": total_sum / total_count,
+                                                      **{f"p{int(q * 100)}": self._bucket_quantile(counts, total_count, q)
+                                                         for q in (0.5, 0.9, 0.99)}}
+        return {"counters": counters, "latencies": latencies}
+
+    def _bucket_quantile(self, counts, total_count, q):
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= q * total_count: return bound
+        return float("inf")
+
+    def _header(self, lines, name, metric_type):
+        if name in self.help:
+            lines.append(f"# HELP {name} {self.help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    async def serve(self, host="127.0.0.1", port=9108):
+        """ Sirve /metrics por HTTP en la interfaz local. Corre hasta que se cancele la tarea. """
+        server = await asyncio.start_server(self._handle_http, host, port)
+        log.info("Métricas disponibles", url=f"http://{host}:{port}/metrics")
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            log.info("Servidor de métricas detenido.")
+
+    async def _handle_http(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass # Descartamos las cabeceras
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+                body = self.render().encode("utf-8")
+                status = "200 OK"
+            else:
+                body = b"Not Found\n"
+                status = "404 Not Found"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+def _group(series: dict) -> dict:
+    grouped = {}
+    for (name, labels), value in list(series.items()):
+        grouped.setdefault(name, []).append((labels, value))
+    return grouped
+
+def _labels(labels: tuple) -> str:
+    if not labels: return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def instrument_mt5(mt5_module, registry=None):
+    """ Reemplaza las funciones de MT5 del módulo por versiones que miden cantidad de llamadas y latencia.
+
+    Como el resto del código llama a mt5.<función> a través del módulo, basta con hacerlo una vez al inicio.
+    También contamos la distribución de retcode de order_send y las llamadas que ocurren en el hilo del bucle de eventos.
+    """
+    registry = registry or metrics
+    for function_name in MT5_FUNCTIONS:
+        original = getattr(mt5_module, function_name, None)
+        if original is None or getattr(original, "__wrapped__", None) is not None: continue
+        setattr(mt5_module, function_name, _timed(original, function_name, registry))
+
+def _timed(function, function_name, registry):
+    labels = (("function", function_name),)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if threading.get_ident() == registry.loop_thread_id:
+            registry.inc("bot_mt5_calls_on_loop_total", labels)
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            registry.observe("bot_mt5_call_seconds", time.perf_counter() - start, labels)
+            registry.inc("bot_mt5_calls_total", labels)
+        if function_name == "order_send":
+            retcode = "none" if result is None else result.retcode
+            registry.inc("bot_order_send_retcode_total", (("retcode", retcode),))
+        return result
+    return wrapper
+
+
+def executor_gauges(executor, registry=None):
+    """ Expone la saturación del ThreadPoolExecutor por defecto del bucle (el que usa asyncio.to_thread). """
+    registry = registry or metrics
+    registry.gauge("bot_executor_max_workers", lambda: executor._max_workers, "Hilos máximos del executor por defecto")
+    registry.gauge("bot_executor_threads", lambda: len(executor._threads), "Hilos creados en el executor por defecto")
+    registry.gauge("bot_executor_queued", lambda: executor._work_queue.qsize(), "Tareas esperando un hilo libre")
+
+
+# Instancia compartida por todos los módulos del bot.
+metrics = Metrics()
+metrics.describe("bot_mt5_calls_total", "Llamadas a funciones de MetaTrader5")
+metrics.describe("bot_mt5_call_seconds", "Latencia de las llamadas a MetaTrader5")
+metrics.describe("bot_order_send_retcode_total", "Distribución de retcode devueltos por order_send")
+metrics.describe("bot_mt5_calls_on_loop_total", "Llamadas a MetaTrader5 ejecutadas en el hilo del bucle de eventos")
+metrics.describe("bot_loop_lag_seconds", "Retraso del bucle de eventos respecto de lo programado")
+metrics.describe("bot_loop_blocked_total", "Veces que el bucle de eventos estuvo bloqueado más del umbral")
+metrics.describe("bot_filter_decisions_total", "Decisiones de Strategy.filter_order por resultado y motivo")
+metrics.describe("bot_coverage_recalculations_total", "Recálculos del precio de cobertura")
+metrics.describe("bot_channel_messages_total", "Mensajes recibidos por canal, aceptados o descartados por el prefiltro")
+metrics.describe("bot_execute_stage_seconds", "Duración de cada etapa de execute_order (overlap_saved: tiempo ahorrado al validar en paralelo)")
+metrics.describe("bot_memory_growth_warnings_total", "Avisos de crecimiento de memoria de MemoryTelemetry")
+metrics.describe("bot_memory_sample_seconds", "Duración de cada muestra de MemoryTelemetry (el bucle queda detenido mientras tanto)")
+metrics.describe("bot_control_commands_total", "Comandos de control recibidos desde los chats de control")
@@ -0,0 +1,112 @@
+import time
+import asyncio
+import MetaTrader5 as mt5
+from event_log import log
+from metrics import metrics
+
+class TokenBucket:
+    """ Limitador de tasa: permite `rate` envíos por segundo con ráfagas de hasta `burst` envíos. """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ModificationQueue:
+    """ Cola de modificaciones de SL, TP y precio (TRADE_ACTION_SLTP y TRADE_ACTION_MODIFY) que se fusionan por ticket.
+
+    Si llegan varias modificaciones del mismo ticket antes de que la primera salga hacia el broker, solo se envía
+    una, con los últimos valores de cada campo. Los envíos pasan por un TokenBucket para no superar el límite
+    de solicitudes del broker.
+
+    submit() devuelve un Future que se resuelve con el TradeResult del envío que finalmente incluyó esa modificación
+    (o None si order_send falló antes de llegar a MT5). Todas las modificaciones fusionadas reciben el mismo resultado.
+
+    Argumentos:
+    - rate: Envíos por segundo permitidos.
+    - burst: Envíos seguidos permitidos antes de empezar a limitar.
+    """
+
+    def __init__(self, rate: float = 5.0, burst: int = 5):
+        self.bucket = TokenBucket(rate, burst)
+        self.pending = {} # {(tipo, ticket): (request, [futures])}, en orden de llegada
+        self.submitted = 0
+        self.sent = 0
+        self._wakeup = None
+        self._worker = None
+
+    @property
+    def saved(self) -> int:
+        """ Envíos al broker que nos ahorramos gracias a la fusión. """
+        return self.submitted - self.sent - len(self.pending)
+
+    def submit(self, request: dict) -> asyncio.Future:
+        if request["action"] == mt5.TRADE_ACTION_MODIFY:
+            key = ("order", request["order"])
+        else:
+            key = ("position", request["position"])
+
+        future = asyncio.get_running_loop().create_future()
+        entry = self.pending.get(key)
+        if entry is None:
+            self.pending[key] = (dict(request), [future])
+        else:
+            entry[0].update(request) # Los valores más recientes reemplazan a los anteriores
+            entry[1].append(future)
+            metrics.inc("bot_modifications_coalesced_total")
+        self.submitted += 1
+        metrics.inc("bot_modifications_submitted_total")
+
+        self._ensure_worker()
+        self._wakeup.set()
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and not self._worker.done(): return
+        if self._wakeup is None: self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                if not self.pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                await self.bucket.acquire()
+                key = next(iter(self.pending))
+                request, futures = self.pending.pop(key)
+                try:
+                    result = await asyncio.to_thread(mt5.order_send, request)
+                except Exception as e:
+                    log.error("Error al enviar la modificación", ticket=key[1], error=str(e))
+                    result = None
+                self.sent += 1
+                metrics.inc("bot_modifications_sent_total")
+                for future in futures:
+                    if not future.done(): future.set_result(result)
+        except asyncio.CancelledError:
+            for _, futures in self.pending.values():
+                for future in futures: future.cancel()
+            log.info("Cola de modificaciones detenida.", submitted=self.submitted, sent=self.sent, saved=self.saved)
+            raise
+
+    def stats(self) -> dict:
+        return {"submitted": self.submitted, "sent": self.sent, "pending": len(self.pending), "saved": self.saved}
+
+
+# Instancia compartida: la cobertura y el trailing stop deben pasar por la misma cola para que se fusionen entre sí.
+modification_queue = ModificationQueue()
+metrics.gauge("bot_modifications_saved", lambda: modification_queue.saved, "Envíos de modificaciones ahorrados por la fusión")
@@ -0,0 +1,134 @@
+""" Reporte de deslizamiento (slippage) y demora entre la señal de Telegram y la ejecución en MT5.
+
+Cruza la bitácora de decisiones (trade_journal) con el historial de deals de MT5 (history_deals_get) usando el
+ticket de la orden, y calcula por canal, activo y hora del día la distribución de:
+
+- slippage: diferencia entre el precio de ejecución y el precio escrito en Telegram, con signo tal que un valor
+  positivo siempre es en contra nuestra (pagamos más en una compra o recibimos menos en una venta).
+- delay: segundos entre la fecha del mensaje de Telegram y la del deal. Solo para órdenes a mercado (Compra/Venta):
+  en un Buy Limit ese tiempo es lo que tardó el precio en llegar al nivel, no la demora de la señal, así que
+  queda vacío (NaN) y no entra en la cantidad ni en los cuantiles de delay.
+
+MT5 informa las fechas de los deals en la hora del servidor de trading (normalmente UTC+2 o UTC+3), no en UTC.
+El desfase se pasa con --server-utc-offset (horas); si se omite, se estima comparando la hora del último tick
+del activo más operado con el reloj local; si el mercado está cerrado (el último tick es viejo) la estimación
+queda fuera de ±14 horas y hay que indicar el desfase a mano.
+
+Todo el cálculo es vectorizado con pandas, por lo que un año de historial se procesa en segundos.
+
+Uso:
+    python slippage_report.py --days 365 --csv reporte_slippage.csv
+    python slippage_report.py --days 30 --server-utc-offset 3
+"""
+import time
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import MetaTrader5 as mt5
+from trade_journal import journal as default_journal, BUY_ORDER_TYPES
+
+QUANTILES = (0.5, 0.9, 0.99)
+MARKET_ORDER_TYPES = ("Compra", "Venta") # Las únicas cuya demora entre el mensaje y el deal es demora de la señal
+MAX_SERVER_OFFSET = 14 # Horas. Los husos horarios van de UTC-12 a UTC+14
+
+def load_signals(journal, since: float, until: float) -> pd.DataFrame:
+    """ Señales aceptadas y enviadas a MT5 (con ticket) dentro del rango de fechas. """
+    rows = journal.query(accepted=True, since=since, until=until)
+    rows = rows[rows["ticket"] > 0]
+    signals = pd.DataFrame({
+        "ticket": rows["ticket"],
+        "chat_id": rows["chat_id"],
+        "asset": np.char.decode(rows["asset"]),
+        "order_type": np.char.decode(rows["order_type"]),
+        "signal_price": rows["signal_price"],
+        "message_ts": rows["message_ts"],
+        "is_buy": np.isin(rows["order_type"], BUY_ORDER_TYPES),
+    })
+    return signals.drop_duplicates("ticket", keep="last")
+
+def estimate_server_offset(asset: str) -> float:
+    """ Desfase en horas de la hora del servidor respecto de UTC, redondeado a la media hora.
+    None si no hay tick o si el resultado no es un huso horario posible (el último tick es de cuando cerró el mercado). """
+    tick = mt5.symbol_info_tick(asset)
+    if tick is None or not tick.time: return None
+    offset = round((tick.time - time.time()) / 1800) / 2
+    return offset if abs(offset) <= MAX_SERVER_OFFSET else None
+
+def load_deals(since: float, until: float, server_offset: float = 0.0) -> pd.DataFrame:
+    """ Deals de entrada del historial de MT5 dentro del rango de fechas (UTC). server_offset: horas del servidor respecto de UTC. """
+    shift = server_offset * 3600 # El historial se consulta y se fecha en hora del servidor
+    deals = mt5.history_deals_get(datetime.fromtimestamp(since + shift, timezone.utc), datetime.fromtimestamp(until + shift, timezone.utc))
+    if deals is None or len(deals) == 0:
+        return pd.DataFrame(columns=["order", "price", "volume", "time_msc", "entry"])
+    deals = pd.DataFrame(list(deals), columns=deals[0]._asdict().keys())
+    return deals[deals["entry"] == mt5.DEAL_ENTRY_IN]
+
+def build_report(signals: pd.DataFrame, deals: pd.DataFrame, server_offset: float = 0.0) -> pd.DataFrame:
+    """ Une señales y deals por ticket de orden y calcula slippage y demora por fila.
+    server_offset: horas de la hora del servidor de MT5 (la de time_msc) respecto de UTC. """
+    deals = deals[["order", "price", "volume", "time_msc"]].rename(columns={"order": "ticket", "price": "fill_price"})
+    # Una orden puede llenarse en varios deals: usamos el precio promedio ponderado y el primer instante de llenado
+    deals = deals.assign(notional=deals["fill_price"] * deals["volume"])
+    fills = deals.groupby("ticket").agg(notional=("notional", "sum"), volume=("volume", "sum"), time_msc=("time_msc", "min"))
+    fills["fill_price"] = fills["notional"] / fills["volume"]
+
+    report = signals.merge(fills[["fill_price", "time_msc"]], left_on="ticket", right_index=True, how="inner")
+    direction = np.where(report["is_buy"], 1.0, -1.0)
+    report["slippage"] = (report["fill_price"] - report["signal_price"]) * direction
+    delay = report["time_msc"] / 1000.0 - server_offset * 3600 - report["message_ts"]
+    report["delay"] = delay.where(report["order_type"].isin(MARKET_ORDER_TYPES))
+    report["hour"] = pd.to_datetime(report["message_ts"], unit="s", utc=True).dt.hour
+    return report
+
+def summarize(report: pd.DataFrame, by) -> pd.DataFrame:
+    """ Cantidad, media y cuantiles de slippage y demora agrupados por la(s) columna(s) indicada(s). """
+    grouped = report.groupby(by)[["slippage", "delay"]]
+    summary = grouped.agg(["count", "mean"])
+    quantiles = grouped.quantile(list(QUANTILES)).unstack()
+    quantiles.columns = pd.MultiIndex.from_tuples([(metric, f"p{int(q * 100)}") for metric, q in quantiles.columns])
+    return summary.join(quantiles).sort_index(axis=1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reporte de slippage y demora entre Telegram y MT5.")
+    parser.add_argument("--days", type=float, default=30, help="Días hacia atrás a analizar")
+    parser.add_argument("--csv", help="Guarda el detalle por orden en este archivo CSV")
+    parser.add_argument("--server-utc-offset", type=float, default=None,
+                        help="Horas de la hora del servidor de MT5 respecto de UTC (por defecto se estima con el último tick)")
+    args = parser.parse_args()
+
+    if not mt5.initialize():
+        print("initialize() falló, error code =", mt5.last_error())
+        return
+    try:
+        until = time.time()
+        since = until - args.days * 86400
+        started = time.perf_counter()
+        signals = load_signals(default_journal, since, until)
+        server_offset = args.server_utc_offset
+        if server_offset is None and signals.empty:
+            server_offset = 0.0 # No hay nada que cruzar
+        elif server_offset is None:
+            server_offset = estimate_server_offset(signals["asset"].mode()[0])
+            if server_offset is None:
+                print("No se pudo estimar la hora del servidor (¿mercado cerrado?). Indícala con --server-utc-offset.")
+                return
+            else:
+                print(f"Hora del servidor estimada: UTC{server_offset:+g}")
+        report = build_report(signals, load_deals(since, until, server_offset), server_offset)
+        elapsed = time.perf_counter() - started
+    finally:
+        mt5.shutdown()
+
+    print(f"{len(report)} órdenes cruzadas en {elapsed:.2f} s\n")
+    if report.empty: return
+    pd.set_option("display.width", 200)
+    for title, by in (("Por canal", "chat_id"), ("Por activo", "asset"), ("Por hora (UTC)", "hour")):
+        print(f"--- {title} ---")
+        print(summarize(report, by).round(4), "\n")
+    if args.csv:
+        report.to_csv(args.csv, index=False)
+        print(f"Detalle guardado en {args.csv}")
+
+if __name__ == "__main__":
+    main()
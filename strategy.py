@@ -3,12 +3,40 @@ from collections import defaultdict
 import numpy as np
 import re
 import asyncio
+from typing import NamedTuple
+from event_log import log
+from metrics import metrics
+from modification_queue import modification_queue
+from account_state import account_state
+from channels import DEFAULT_MAGIC
+from exposure import Exposure
+
+class Signal(NamedTuple):
+    """ Señal de trading interpretada desde un mensaje de Telegram.
+
+    Se crea una sola vez en TradingOrder.catch_order, con los números ya convertidos a float, y se pasa por
+    referencia al filtro, al cálculo de volumen y a la ejecución. Es inmutable: si una etapa necesita otro
+    valor (por ejemplo, el volumen mínimo), devuelve una copia con signal._replace(...).
+    """
+    order_type: str
+    asset: str
+    price: float = 0.0         # Precio de la orden (ask/bid en órdenes a mercado)
+    stop_loss: float = 0.0
+    take_profit: float = 0.0
+    volume: float = 0.0
+    signal_price: float = float("nan") # Precio tal como viene en Telegram
+
+class Decision(NamedTuple):
+    """ Veredicto de Strategy.filter_order. volume es el volumen con el que se debe enviar la orden. """
+    accepted: bool
+    reason: str
+    volume: float
 
 class Strategy:
     """ Filtramos por ciertos criterios definidos por el usuario.
+    Se crea una vez por configuración y se reutiliza para todas las señales.
     En la presente versión, los filtros son:
     - cobertura: Es el objeto de cobertura, que nos será util para extraer balance, cálculo de stop out, entre otros.
-    - order: Es un diccionario con las características de la orden que viene de Telegram. 
     - asset_regex: Qué activo quiere operar el usuario. Por defecto es [A-Z0-9]+
     - distance: Distancia en precio del activo a otra ya creada. Si es menor a x número, lo desechamos la operación.
         * Es un dict en la forma de {"asset":"distancia_minima}
@@ -20,103 +48,198 @@ class Strategy:
     - risk: Es un diccionario cuya llave es el activo de la orden y el valor del riesgo que el usuario quiere tomar
     """
 
-    def __init__(self, cover, order, distance:dict, pessimistic_resistance:dict, risk:dict, volume:dict, asset_regex=r"[A-Z0-9]+"):
+    def __init__(self, cover, distance:dict, pessimistic_resistance:dict, risk:dict, volume:dict, asset_regex=r"[A-Z0-9]+"):
         self.cover = cover
         self.distance = distance
         self.pessimistic_resistance = pessimistic_resistance
         self.risk = risk # Riesgo por operación
         self.volume = volume # Volumen por defecto. Si es igual o menor a cero, calculamos el volumen en base al riesgo.
-        self.asset_regex = asset_regex
-        self.try_with_min_vol = False
-
-        numeric_data = ["price", "stop_loss"]
-        
-        for order_feature, order_value in order.items():
-            # {"order_type": "Orden del movimiento", "asset": "Nemo", "price": "Precio de apertura", "stop_loss": "Stop Loss"}
-            if order_feature in numeric_data:
-                try:
-                    order_value = float(order_value)
-                except (ValueError, TypeError):
-                    order_value = 0.0
-            
-            setattr(self, order_feature, order_value)
+        self.asset_regex = re.compile(asset_regex)
+        self.orders = Orders() # Solo lo usamos para leer las órdenes; sus contadores no se consultan aquí
     
-    async def filter_order(self)->bool:
+    async def filter_order(self, signal: Signal) -> Decision:
         """ 
         Vemos si una orden está lo suficientemente alejada de las otras ordenes activas y pendientes.
-        Si está suficientemente alejada bajo el criterio del usuario, retornará True. De lo contrario, False
+        Si está suficientemente alejada bajo el criterio del usuario, la decisión será aceptada.
         """
-        # Instanciamos la clase orders
-        orders = Orders()
-        all_orders = await orders.get_all_orders()
-        trailing_stop_order = self.order_type == "Trailing Stop" # No filtraremos los trailing stop, dado que no son ordenes persé
-        not_a_asset_match   = not re.search(self.asset_regex, self.asset) # Si el activo de la orden no es el que queremos, no la ejecutaremos
-
-        if not_a_asset_match: 
-            print(f"Activo {self.asset} no considerado por el usuario para realizar ordenes.")
-            return False
-        if trailing_stop_order: return True
-
-        for asset, orders_list in all_orders.items():
-            if self.asset == asset:
-
-                proper_distance = self.__check_proper_distance(orders_list)
-                if proper_distance == False: return proper_distance
-                proper_risk_exposure = await self.__check_risk_exposure(orders_list, self.volume)
-                return proper_risk_exposure
-        return True # Si no hay ordenes pendientes o activas, retornamos True
-
-    def __check_proper_distance(self, orders_list: dict)->bool:
+        decision = await self.__evaluate(signal)
+        result = "accepted" if decision.accepted else "rejected"
+        metrics.inc("bot_filter_decisions_total", (("result", result), ("reason", decision.reason)))
+        return decision
+
+    async def __evaluate(self, signal: Signal) -> Decision:
+        if not self.asset_regex.search(signal.asset): # Si el activo de la orden no es el que queremos, no la ejecutaremos
+            log.warning(f"Activo {signal.asset} no considerado por el usuario para realizar ordenes.")
+            return Decision(False, "asset_regex", signal.volume)
+        if signal.order_type == "Trailing Stop": # No filtraremos los trailing stop, dado que no son ordenes persé
+            return Decision(True, "trailing_stop", signal.volume)
+
+        self.orders.reset_counters()
+        all_orders = await self.orders.get_all_orders()
+        orders_list = all_orders.get(signal.asset)
+        if not orders_list: return Decision(True, "no_orders", signal.volume) # Si no hay ordenes pendientes o activas, aceptamos
+
+        if not self.__check_proper_distance(signal, orders_list):
+            return Decision(False, "distance", signal.volume)
+        return await self.__check_risk_exposure(signal, signal.volume)
+
+    def __check_proper_distance(self, signal: Signal, orders_list: list)->bool:
         """
         Verifica si la distancia entre el precio de la orden y sus colindantes en la lista 
         ordenada es mayor a 'min_distance' en ambos casos. (Síncrona - solo cálculos)
         """
-        prices = [price for price, _ in orders_list]
-        min_distance = self.distance[self.asset]
-        proper_distance = all([abs(price - self.price) > min_distance for price in prices])
+        min_distance = self.distance[signal.asset]
+        proper_distance = all(abs(price - signal.price) > min_distance for price, _ in orders_list)
 
         if proper_distance == False:
-            print(f"El precio {self.price} del activo {self.asset} está a menos de {min_distance} USD entre sus colindantes. No se realiza la operación.")
+            log.warning(f"El precio {signal.price} del activo {signal.asset} está a menos de {min_distance} USD entre sus colindantes. No se realiza la operación.")
         return proper_distance
     
-    async def __check_risk_exposure(self, orders_list: dict, op_volume:float)->bool:
+    async def __check_risk_exposure(self, signal: Signal, op_volume:float) -> Decision:
         """
         Verifica si con la operación que estamos por ejecutar, aguantamos hasta la resistencia pesimista.
+        Las órdenes existentes se leen de self.orders.exposure, ya sincronizado en __evaluate.
         (Asíncrona porque consulta el balance de la cuenta)
         """
 
-        if self.pessimistic_resistance == None and self.cover == None: return True # El usuario quiere ir con todo
-        new_operation = (self.price, op_volume)
-        orders_list.append(new_operation)
-        pessimistic_resistance = self.pessimistic_resistance[self.asset]
-        if pessimistic_resistance == 0: pessimistic_resistance = self.stop_loss
-        
-        info = mt5.symbol_info(self.asset)
+        if self.pessimistic_resistance == None and self.cover == None: return Decision(True, "filters_passed", op_volume) # El usuario quiere ir con todo
+        exposure = self.orders.exposure
+
+        info = await asyncio.to_thread(mt5.symbol_info, signal.asset)
         vol_min = info.volume_min
         
-        account_info = await asyncio.to_thread(mt5.account_info)
-        balance = account_info.balance
+        account = await account_state.get()
+        balance = account.balance if account else 0.0
 
         if self.cover == None: # El usuario no quiere utilizar una estrategia de cobertura, si no de stop loss.        
-            for price, volume in orders_list:
-                balance -= (price - pessimistic_resistance) * volume
-                if balance <= 0:
-                    if op_volume != vol_min:
-                        # Si la operación nos deja con un riesgo de SO, probamos con lotaje mínimo
-                        print("Probamos con lotaje mínimo para menor exposición de riesgo...")
-                        self.try_with_min_vol = await self.__check_risk_exposure(orders_list[:-1], vol_min)
-                        return self.try_with_min_vol
-                    else:
-                        print(f"Orden rechazada: La orden \"{self.order_type}\" del activo {self.asset} con precio {self.price} deja una exposición mayor a la permitida.")
-                        return False
+            pessimistic_resistance = self.pessimistic_resistance[signal.asset]
+            if pessimistic_resistance == 0: pessimistic_resistance = signal.stop_loss
+            if exposure.remaining_balance(signal.asset, balance, pessimistic_resistance, signal.price, op_volume) <= 0:
+                if op_volume != vol_min:
+                    # Si la operación nos deja con un riesgo de SO, probamos con lotaje mínimo
+                    log.warning("Probamos con lotaje mínimo para menor exposición de riesgo...")
+                    decision = await self.__check_risk_exposure(signal, vol_min)
+                    return decision._replace(reason="min_volume") if decision.accepted else decision
+                else:
+                    log.warning(f"Orden rechazada: La orden \"{signal.order_type}\" del activo {signal.asset} con precio {signal.price} deja una exposición mayor a la permitida.")
+                    return Decision(False, "risk_exposure", op_volume)
         else:
-            precio_cobertura = self.cover.calcular_cobertura(orders_list, balance)
+            precio_cobertura = self.cover.calcular_cobertura(balance, exposure, signal.asset, signal.price, op_volume)
             # Si la distancia entre el precio de la orden y el precio de cobertura es mayor al margen de la cobertura, se acepta la orden
-            es_valida = self.price - precio_cobertura > self.cover.margen_cobertura
+            es_valida = signal.price - precio_cobertura > self.cover.margen_cobertura
             if not es_valida:
-                print(f"Orden rechazada: El precio de la orden ({self.price}) está por debajo o muy cerca de la cobertura actualizada ({precio_cobertura:.2f}).")
-                return False
-        return True # Todos los filtros pasaron exitosamente
+                log.warning(f"Orden rechazada: El precio de la orden ({signal.price}) está por debajo o muy cerca de la cobertura actualizada ({precio_cobertura:.2f}).")
+                return Decision(False, "coverage", op_volume)
+        return Decision(True, "filters_passed", op_volume) # Todos los filtros pasaron exitosamente
+
+    async def filter_batch(self, signals: list) -> list:
+        """
+        Evalúa juntos todos los niveles nuevos de una grilla de "ORDENES PENDIENTES" y devuelve un Decision por
+        señal, en el mismo orden en que llegaron. Las órdenes, el balance y el símbolo se leen una sola vez.
+
+        El resultado no depende del orden de las líneas del mensaje: los niveles se priorizan de mayor a menor
+        precio (los primeros que se ejecutarían) y el volumen de cada uno se calcula aquí, ignorando el de la señal.
+        Ver __allocate.
+        """
+        decisions = [None] * len(signals)
+        by_asset = defaultdict(list)
+        for i, signal in enumerate(signals):
+            if self.asset_regex.search(signal.asset):
+                by_asset[signal.asset].append(i)
+            else:
+                decisions[i] = Decision(False, "asset_regex", signal.volume)
+
+        if by_asset:
+            self.orders.reset_counters()
+            all_orders, account = await asyncio.gather(self.orders.get_all_orders(), account_state.get())
+            balance = account.balance if account else 0.0
+            for asset, indexes in by_asset.items():
+                info = await asyncio.to_thread(mt5.symbol_info, asset)
+                if info is None: # Sin el volumen mínimo del símbolo no podemos dimensionar ni enviar los niveles
+                    log.warning(f"No se pudo obtener la información del símbolo {asset}. Se rechazan sus órdenes.")
+                    for i in indexes:
+                        decisions[i] = Decision(False, "symbol_info", signals[i].volume)
+                    continue
+                allocation = self.__allocate([signals[i] for i in indexes], all_orders.get(asset, []), balance, info.volume_min)
+                for i, decision in zip(indexes, allocation):
+                    decisions[i] = decision
+
+        for decision in decisions:
+            result = "accepted" if decision.accepted else "rejected"
+            metrics.inc("bot_filter_decisions_total", (("result", result), ("reason", decision.reason)))
+        return decisions
+
+    def __allocate(self, signals: list, orders_list: list, balance: float, vol_min: float) -> list:
+        """
+        Dimensiona en conjunto los niveles de un activo con sumas acumuladas (síncrona - solo cálculos):
+        - Volumen: el de la configuración, o el que arriesga `risk` del balance hasta el stop loss. Si queda bajo el
+          mínimo del símbolo, el nivel se rechaza.
+        - Distancia: cada nivel debe estar alejado de las órdenes existentes y del nivel aceptado anterior.
+        - Riesgo: se aceptan con su volumen los niveles mientras el balance aguante hasta la resistencia pesimista;
+          desde el primero que no entra se prueba con el volumen mínimo, y desde el primero que tampoco entra se rechazan.
+        - Cobertura: se aceptan los niveles mientras queden a más de margen_cobertura de la cobertura recalculada.
+        """
+        asset = signals[0].asset
+        priority = np.argsort([-signal.price for signal in signals], kind="stable")
+        prices = np.array([signals[i].price for i in priority], dtype=float)
+        stop_losses = np.array([signals[i].stop_loss for i in priority], dtype=float)
+
+        if self.volume[asset] > 0:
+            volumes = np.full(len(prices), float(self.volume[asset]))
+        else:
+            with np.errstate(divide="ignore"):
+                volumes = np.round(self.risk[asset] * balance / np.abs(prices - stop_losses), 2)
+            volumes[~np.isfinite(volumes) | (volumes < vol_min)] = 0.0
+        accepted = volumes > 0
+        reasons = np.where(accepted, "filters_passed", "volume").astype(object)
+
+        existing_prices = np.array([price for price, _ in orders_list], dtype=float)
+        min_distance = self.distance[asset]
+        if existing_prices.size:
+            far = (np.abs(prices[:, None] - existing_prices[None, :]) > min_distance).all(axis=1)
+            reasons[accepted & ~far] = "distance"
+            accepted &= far
+        last_price = None
+        for k in np.flatnonzero(accepted): # Los niveles ya están ordenados: basta compararlos con el anterior aceptado
+            if last_price is not None and abs(last_price - prices[k]) <= min_distance:
+                accepted[k] = False
+                reasons[k] = "distance"
+            else:
+                last_price = prices[k]
+
+        candidates = np.flatnonzero(accepted)
+        if candidates.size and (self.pessimistic_resistance is not None or self.cover is not None):
+            p, v = prices[candidates], volumes[candidates]
+            base_pv, base_v, base_count = self.orders.exposure.totals(asset)
+
+            if self.cover is None:
+                resistance = self.pessimistic_resistance[asset]
+                r = stop_losses[candidates] if resistance == 0 else np.full(p.size, float(resistance))
+                def fits(vols):
+                    remaining = balance - (base_pv - r * base_v) - (np.cumsum(p * vols) - r * np.cumsum(vols))
+                    return np.logical_and.accumulate(remaining > 0)
+
+                full = fits(v)
+                reduced_volumes = np.where(full, v, vol_min)
+                reduced = fits(reduced_volumes) & ~full
+                volumes[candidates] = reduced_volumes
+                reasons[candidates[reduced]] = "min_volume"
+                rejected = ~(full | reduced)
+                volumes[candidates[rejected]] = v[rejected]
+                reasons[candidates[rejected]] = "risk_exposure"
+            else:
+                cumulative_v = base_v + np.cumsum(v)
+                stop_out = np.round((base_pv + np.cumsum(p * v)) / cumulative_v - balance / cumulative_v, 2)
+                coverage = stop_out + (base_count + np.arange(1, p.size + 1)) * self.cover.margen_cobertura
+                metrics.inc("bot_coverage_recalculations_total")
+                rejected = ~np.logical_and.accumulate(p - coverage > self.cover.margen_cobertura)
+                reasons[candidates[rejected]] = "coverage"
+            accepted[candidates[rejected]] = False
+
+        decisions = [None] * len(signals)
+        for k, i in enumerate(priority):
+            decisions[i] = Decision(bool(accepted[k]), reasons[k], float(volumes[k]))
+        return decisions
 
 class Coverage:
 
@@ -151,19 +274,31 @@ class Coverage:
         self.ultimo_precio_cobertura = 0
         # Instanciamos la clase Orders
         self.orders = Orders() 
+        self.balance_changed = asyncio.Event() # Lo activa on_account_change para no esperar al próximo ciclo del monitor
         
 
+    def apply_config(self, config: dict):
+        """ Actualiza los márgenes de la cobertura con la configuración recargada. El activo y el tipo de cuenta no cambian en caliente. """
+        cobertura = config["cobertura"]
+        self.margen_cobertura = cobertura["margen_cobertura"]
+        self.break_even = cobertura["break_even"]
+        self.trailing_stop = cobertura["trailing_stop"]
+
+    def on_account_change(self, snapshot, previous):
+        """ Suscriptor de AccountState: si el balance cambió, la cobertura pendiente debe recalcularse. """
+        if snapshot.balance != self.balance:
+            self.balance_changed.set()
+
     async def gestionar_cobertura(self):
 
         
 
         # Reseteamos los valores antes de recalcular
-        self.orders.volumen_total = 0
-        self.orders.cantidad_de_ordenes = 0
-        self.orders.volumen_cobertura = 0
+        self.orders.reset_counters()
 
-        account_info = await asyncio.to_thread(mt5.account_info)
-        balance_actual = account_info.balance
+        account = await account_state.get()
+        if account is None: return None
+        balance_actual = account.balance
         orders_list = await self.orders.get_all_orders()
         try:
             orders_list = orders_list[self.asset]
@@ -181,15 +316,15 @@ class Coverage:
                 await self.eliminar_cobertura_pendiente(order_info_tuple[0])
 
             elif self.balance != balance_actual and self.orders.volumen_total == self.orders.volumen_cobertura:
-                await self.modificar_cobertura_pendiente(orders_list, balance_actual)
+                await self.modificar_cobertura_pendiente(balance_actual)
 
             elif self.orders.volumen_total > 0 and self.orders.volumen_cobertura:
-                await self.crear_cobertura(orders_list, balance_actual)
+                await self.crear_cobertura(balance_actual)
         
         self.balance = balance_actual
 
-    async def crear_cobertura(self, orders_list, balance):
-        precio_cobertura = self.calcular_cobertura(orders_list, balance)
+    async def crear_cobertura(self, balance):
+        precio_cobertura = self.calcular_cobertura(balance)
         precio_bid = await self.obtener_precio_bid()
         if precio_bid == 0: return None
 
@@ -203,7 +338,7 @@ class Coverage:
             "volume": self.orders.volumen_total,
             "type": mt5.ORDER_TYPE_SELL_STOP,
             "price": precio_cobertura,
-            "sl": 0.0, "tp": 0.0, "magic": 1234,
+            "sl": 0.0, "tp": 0.0, "magic": DEFAULT_MAGIC,
             "comment": "cobertura",
             "type_time": mt5.ORDER_TIME_GTC,
             "type_filling": filling_mode,
@@ -213,10 +348,10 @@ class Coverage:
 
         if result == None or result.retcode != mt5.TRADE_RETCODE_DONE:
             last_error = await asyncio.to_thread(mt5.last_error)
-            print(f"Detalle del último error de MT5: {last_error}")
+            log.error(f"Detalle del último error de MT5: {last_error}")
         else:
             self.orders.ticket_cobertura = result.order
-            print("¡Cobertura creada con éxito!")
+            log.info("¡Cobertura creada con éxito!")
 
     async def eliminar_cobertura_pendiente(self, order_info):
         request = {
@@ -227,8 +362,7 @@ class Coverage:
         result = await asyncio.to_thread(mt5.order_send, request)
         
         if result == None or result.retcode != mt5.TRADE_RETCODE_DONE:
-            print("Error al intentar eliminar la cobertura para crear otra nueva")
-            print(f"Detalle del último error de MT5: {await asyncio.to_thread(mt5.last_error)}")
+            log.error("Error al intentar eliminar la cobertura para crear otra nueva", error_code=await asyncio.to_thread(mt5.last_error))
             return False
         else:
             return True
@@ -236,47 +370,38 @@ class Coverage:
     async def obtener_precio_bid(self):
         tick = await asyncio.to_thread(mt5.symbol_info_tick, self.asset)
         if tick is None:
-            print(f"No se pudo obtener el tick para {self.asset}")
+            log.error(f"No se pudo obtener el tick para {self.asset}")
             return 0
         return tick.bid
 
     async def obtener_precio_cobertura_activa(self):
         tick = await asyncio.to_thread(mt5.symbol_info_tick, self.asset)
         if tick is None:
-            print(f"No se pudo obtener el tick para {self.asset}")
+            log.error(f"No se pudo obtener el tick para {self.asset}")
             return 0
         return tick.bid  
 
-    def calcular_stop_out(self, orders_list, balance):
-        # Esta función es solo matemática, no necesita ser async
+    def calcular_stop_out(self, balance, exposure=None, asset=None, price=0.0, volume=0.0):
+        """ Stop out del activo con las sumas de `exposure` (por defecto, las de self.orders), opcionalmente
+        agregando una orden (price, volume) que todavía no existe. O(1): no recorre las órdenes. """
+        exposure = exposure or self.orders.exposure
+        return exposure.stop_out(asset or self.asset, balance, price, volume)
 
-        if not orders_list: return 0 # Evitar división por cero si la lista está vacía
-        
-        weighted_prices = sum(price * volume for price, volume in orders_list)
-        suma_volumen = sum(volume for _, volume in orders_list)
-        
-        if suma_volumen == 0: return 0 # Evitar división por cero
-        
-        weighted_price = weighted_prices / suma_volumen
-        stop_out = round(weighted_price - (balance / suma_volumen), 2)
-        return stop_out
-
-    def calcular_cobertura(self, orders_list, balance):
-        # Esta función es solo matemática, no necesita ser async
-        stop_out = self.calcular_stop_out(orders_list, balance)
-        margen_total = self.orders.cantidad_de_ordenes * self.margen_cobertura
-        cobertura = stop_out + margen_total
-        return cobertura    
-
-    async def modificar_cobertura_pendiente(self, orders_list, balance):
+    def calcular_cobertura(self, balance, exposure=None, asset=None, price=0.0, volume=0.0):
+        """ Precio de la cobertura: stop out + margen_cobertura por cada orden. Mismos argumentos que calcular_stop_out. """
+        metrics.inc("bot_coverage_recalculations_total")
+        exposure = exposure or self.orders.exposure
+        return exposure.hedge_price(asset or self.asset, balance, self.margen_cobertura, price, volume)
+
+    async def modificar_cobertura_pendiente(self, balance):
         order_info_tuple = await asyncio.to_thread(mt5.orders_get, ticket=self.orders.ticket_cobertura)
         
         if order_info_tuple is None or len(order_info_tuple) == 0: 
-            print(f"No se reconoció el ticket {self.orders.ticket_cobertura} para modificar su precio. No se realiza ninguna acción.")
+            log.error(f"No se reconoció el ticket {self.orders.ticket_cobertura} para modificar su precio. No se realiza ninguna acción.")
             return False
             
         order_info = order_info_tuple[0]
-        nuevo_precio_cobertura = self.calcular_cobertura(orders_list, balance)
+        nuevo_precio_cobertura = self.calcular_cobertura(balance)
         if nuevo_precio_cobertura != self.ultimo_precio_cobertura:
             self.ultimo_precio_cobertura = nuevo_precio_cobertura
             request = {
@@ -289,8 +414,8 @@ class Coverage:
                 "type_filling": order_info.type_filling,
                 "type_time": order_info.type_time,
             }
-            result = await asyncio.to_thread(mt5.order_send, request)
-            return True if result.retcode == mt5.TRADE_RETCODE_DONE else False
+            result = await modification_queue.submit(request) # Se fusiona con otras modificaciones del mismo ticket
+            return result is not None and result.retcode == mt5.TRADE_RETCODE_DONE
 
 
     async def gestionar_cobertura_activa(self):
@@ -298,7 +423,7 @@ class Coverage:
         position_info_tuple = await asyncio.to_thread(mt5.positions_get, ticket=self.orders.ticket_cobertura)
         
         if not position_info_tuple:
-            print("No se pudo obtener información de la cobertura activa con el ticket proporcionado. No podemos gestionarla.")
+            log.error("No se pudo obtener información de la cobertura activa con el ticket proporcionado. No podemos gestionarla.")
             return
             
         info_cobertura = position_info_tuple[0]
@@ -319,12 +444,12 @@ class Coverage:
                 "sl": precio_apertura,
                 "tp": info_cobertura.tp,
             }
-        result = await asyncio.to_thread(mt5.order_send, request)
+        result = await modification_queue.submit(request)
         
-        if result.retcode != mt5.TRADE_RETCODE_DONE:
-            print(f"Error al modificar el SL para el break even.\nCódigo del error: {result.retcode}\nMensaje: {result.comment}")
+        if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+            log.error("Error al modificar el SL para el break even", result=result)
         else:
-            print("Break Even de la cobertura implementado exitosamente!")
+            log.info("Break Even de la cobertura implementado exitosamente!")
 
     async def implementar_take_profit(self, info_cobertura):
         precio_cobertura = info_cobertura.price_open
@@ -336,12 +461,12 @@ class Coverage:
                 "sl": nuevo_stop_loss,
                 "tp": info_cobertura.tp,
             }
-        result = await asyncio.to_thread(mt5.order_send, request)
+        result = await modification_queue.submit(request)
         
-        if result.retcode != mt5.TRADE_RETCODE_DONE:
-            print(f"Error al modificar el SL para el trailing stop\nCódigo del error: {result.retcode}\nMensaje: {result.comment}")
+        if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+            log.error("Error al modificar el SL para el trailing stop", result=result)
         else:
-            print("Trailing Stop de la cobertura implementado exitosamente!")
+            log.info("Trailing Stop de la cobertura implementado exitosamente!")
 
 class Orders:
 
@@ -352,6 +477,13 @@ class Orders:
         self.cantidad_de_ordenes = 0
         self.cobertura_activa = False
         self.ticket_cobertura = 0
+        self.exposure = Exposure() # Sumas por activo para el stop out y la cobertura, sincronizadas en get_all_orders
+
+    def reset_counters(self):
+        """ Reinicia los acumulados antes de volver a leer las órdenes, para poder reutilizar la misma instancia. """
+        self.volumen_total = 0
+        self.cantidad_de_ordenes = 0
+        self.volumen_cobertura = 0
 
     async def get_all_orders(self)->dict:
         """
@@ -361,10 +493,13 @@ class Orders:
 
             {'Activo': [(Precio de apertura, Lotaje)], }
 
+        También sincroniza self.exposure con las órdenes leídas (solo cambian los tickets nuevos, modificados o cerrados).
         """
         all_orders = defaultdict(list)
-        active_orders = await self.get_active_orders()
-        pending_orders = await self.get_pending_orders()
+        entries = [] # (ticket, activo, precio, volumen) para self.exposure
+        active_orders = await self.get_active_orders(entries)
+        pending_orders = await self.get_pending_orders(entries)
+        self.exposure.sync(entries)
         
         for key, value_list in active_orders.items():
             all_orders[key].extend(value_list)
@@ -372,7 +507,7 @@ class Orders:
             all_orders[key].extend(value_list)
         return dict(all_orders)
 
-    async def get_active_orders(self):
+    async def get_active_orders(self, entries=None):
         group_active_orders = defaultdict(list)
         positions = await asyncio.to_thread(mt5.positions_get)
         
@@ -390,9 +525,10 @@ class Orders:
                     self.volumen_total += volume
                     self.cantidad_de_ordenes += 1
                     group_active_orders[position.symbol].append((position.price_open, volume))
+                    if entries is not None: entries.append((position.ticket, position.symbol, price, volume))
         return group_active_orders
 
-    async def get_pending_orders(self):
+    async def get_pending_orders(self, entries=None):
         group_pending_orders = defaultdict(list)
         orders = await asyncio.to_thread(mt5.orders_get)
         
@@ -410,4 +546,5 @@ class Orders:
                     self.volumen_total += volume
                     self.cantidad_de_ordenes += 1
                     group_pending_orders[order.symbol].append((order.price_open, volume))
+                    if entries is not None: entries.append((order.ticket, order.symbol, price, volume))
         return group_pending_orders  
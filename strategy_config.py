@@ -0,0 +1,244 @@
+import os
+import re
+import json
+import copy
+import asyncio
+import functools
+from event_log import log
+from channels import DEFAULT_ORDER_TEMPLATES, DEFAULT_MAGIC, default_magic, template_keywords
+
+# Valores por defecto. Son los que antes estaban escritos dentro de main(); se usan si no existe el archivo de configuración.
+DEFAULT_CONFIG = {
+    "utilizar_cobertura": False,
+    "account_type": "USD",
+    # Cambiar con sufijo "c" si estoy en cuenta Cent
+    "cobertura": {"asset": "BTCUSD", "margen_cobertura": 400, "balance": 0, "break_even": 200, "trailing_stop": 400},
+    "estrategia": {"distance": {"BTCUSD": 0}, "pessimistic_resistance": {"BTCUSD": 0},
+                   "risk": {"BTCUSD": 0.03}, "volume": {"BTCUSD": 0.01}, "asset_regex": r"BTCUSD"},
+    # Lista de canales a escuchar (ver channels.ChannelProfile). Vacía: el grupo VIP Trading y el chat de control.
+    "canales": [],
+}
+
+# Estos campos definen objetos que se crean una sola vez al inicio (la cuenta, la cobertura y su monitor).
+# Si cambian en el archivo, avisamos que hace falta reiniciar y conservamos el valor actual.
+RESTART_ONLY = (("utilizar_cobertura",), ("account_type",), ("cobertura", "asset"), ("canales",))
+
+# Campos que acepta cada canal de la sección "canales" (ver channels.ChannelRegistry.from_config).
+CANAL_KEYS = ("chat_id", "name", "order_templates", "keywords", "pending_marker", "control", "magic")
+
+class ConfigError(ValueError):
+    """ La configuración no es válida. La configuración activa no se modifica. """
+
+
+@functools.lru_cache(maxsize=32)
+def compile_order_patterns(asset_pattern: str = r"[A-Z0-9]+", templates: tuple = DEFAULT_ORDER_TEMPLATES) -> tuple:
+    """ Expresiones regulares de cada tipo de orden, ya compiladas para el patrón de activos dado.
+
+    Se calculan una sola vez por patrón y formato de canal (es decir, una vez por recarga de la configuración) y se
+    comparten entre todos los mensajes. Devuelve una tupla de (tipo_de_orden, regex_compilada) en orden de prioridad.
+    """
+    return tuple((order_type, re.compile(template.replace("{asset}", asset_pattern), re.IGNORECASE))
+                 for order_type, template in templates)
+
+
+# Precio de una línea del listado de órdenes pendientes: el primer número después del activo.
+GRID_PRICE_PATTERN = re.compile(r"\$?(\d+(\.\d+)?)")
+
+def grid_levels(text: str, templates: tuple = DEFAULT_ORDER_TEMPLATES, asset_pattern: str = r"[A-Z0-9]+") -> set:
+    """ Niveles Buy Limit de un listado de órdenes pendientes, como {(línea, activo, precio)}.
+
+    Cada línea se interpreta con las plantillas Buy Limit del canal, así un canal con otro formato no necesita
+    que sus líneas empiecen con "Buy Limit".
+    """
+    patterns = [order_match for order_type, order_match in compile_order_patterns(asset_pattern, templates)
+                if order_type.strip() == "Buy Limit"]
+    levels = set()
+    for line in text.splitlines():
+        line = line.strip()
+        for order_match in patterns:
+            order_search = order_match.search(line)
+            if not order_search: continue
+            price_search = GRID_PRICE_PATTERN.search(line, order_search.end())
+            if price_search: levels.add((line, order_search.group(1), float(price_search.group(1))))
+            break
+    return levels
+
+
+def validate(raw: dict) -> dict:
+    """ Completa con valores por defecto, valida y devuelve una copia independiente de la configuración. """
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    for section, value in raw.items():
+        if section not in config:
+            raise ConfigError(f"Sección desconocida: {section}")
+        if isinstance(config[section], dict):
+            if not isinstance(value, dict): raise ConfigError(f"La sección {section} debe ser un objeto")
+            # Una clave mal escrita no debe llegar a Strategy(**estrategia): se rechaza aquí con un mensaje claro
+            unknown = sorted(set(value) - set(config[section]))
+            if unknown: raise ConfigError(f"Claves desconocidas en {section}: {', '.join(map(str, unknown))}")
+            config[section] = {**config[section], **value}
+        else:
+            config[section] = value
+
+    if not isinstance(config["utilizar_cobertura"], bool):
+        raise ConfigError("utilizar_cobertura debe ser true o false")
+    if config["account_type"] not in ("USD", "USC"):
+        raise ConfigError("account_type debe ser USD o USC")
+
+    estrategia = config["estrategia"]
+    try:
+        re.compile(estrategia["asset_regex"])
+    except (re.error, TypeError) as e:
+        raise ConfigError(f"asset_regex no es una expresión regular válida: {e}")
+
+    assets = set(estrategia["volume"])
+    per_asset = ["distance", "risk", "volume"]
+    if estrategia["pessimistic_resistance"] is not None: per_asset.append("pessimistic_resistance")
+    for key in per_asset:
+        values = estrategia[key]
+        if not isinstance(values, dict): raise ConfigError(f"estrategia.{key} debe ser un objeto {{activo: valor}}")
+        # Exigimos los mismos activos en todos los diccionarios para que no haya KeyError al procesar una señal
+        if set(values) != assets:
+            raise ConfigError(f"estrategia.{key} debe definir los mismos activos que estrategia.volume: {sorted(assets)}")
+        for asset, value in values.items():
+            if not isinstance(value, (int, float)) or value < 0:
+                raise ConfigError(f"estrategia.{key}.{asset} debe ser un número mayor o igual a cero")
+    for asset, risk in estrategia["risk"].items():
+        if risk > 1: raise ConfigError(f"estrategia.risk.{asset} es una fracción del balance y no puede ser mayor a 1")
+
+    if not isinstance(config["canales"], list): raise ConfigError("canales debe ser una lista")
+    magics = {}
+    for canal in config["canales"]:
+        if not isinstance(canal, dict) or not isinstance(canal.get("chat_id"), int):
+            raise ConfigError("Cada canal debe ser un objeto con un chat_id numérico")
+        unknown = sorted(set(canal) - set(CANAL_KEYS))
+        if unknown: raise ConfigError(f"Claves desconocidas en el canal {canal['chat_id']}: {', '.join(map(str, unknown))}")
+        # Cada canal solo concilia las órdenes con su magic: dos canales con el mismo se borrarían las órdenes entre sí
+        magic = canal.get("magic", 0)
+        if not isinstance(magic, int) or isinstance(magic, bool) or magic < 0:
+            raise ConfigError(f"El magic del canal {canal['chat_id']} debe ser un entero positivo")
+        magic = magic or default_magic(canal["chat_id"])
+        if magic == DEFAULT_MAGIC: raise ConfigError(f"El magic {DEFAULT_MAGIC} está reservado para la cobertura")
+        if magic in magics: raise ConfigError(f"Los canales {magics[magic]} y {canal['chat_id']} tienen el mismo magic ({magic})")
+        magics[magic] = canal["chat_id"]
+        for template in canal.get("order_templates", {}).values():
+            if "{asset}" not in template: raise ConfigError(f"La plantilla {template!r} del canal {canal['chat_id']} no contiene {{asset}}")
+            try:
+                re.compile(template.replace("{asset}", estrategia["asset_regex"]))
+            except re.error as e:
+                raise ConfigError(f"La plantilla {template!r} del canal {canal['chat_id']} no es válida: {e}")
+        keywords = canal.get("keywords")
+        if keywords:
+            if not all(isinstance(keyword, str) and keyword.strip() for keyword in keywords):
+                raise ConfigError(f"Las keywords del canal {canal['chat_id']} deben ser textos no vacíos")
+        elif not canal.get("control", False):
+            try:
+                template_keywords(tuple(canal.get("order_templates", {}).items()) or DEFAULT_ORDER_TEMPLATES)
+            except ValueError as e:
+                raise ConfigError(f"{e}. Indica las \"keywords\" del canal {canal['chat_id']}")
+
+    cobertura = config["cobertura"]
+    for key in ("margen_cobertura", "balance", "break_even", "trailing_stop"):
+        if not isinstance(cobertura[key], (int, float)) or cobertura[key] < 0:
+            raise ConfigError(f"cobertura.{key} debe ser un número mayor o igual a cero")
+    return config
+
+
+def load_config(path: str) -> dict:
+    """ Lee y valida el archivo JSON. Si no existe, devuelve la configuración por defecto. """
+    if not os.path.exists(path):
+        return validate({})
+    with open(path, encoding="utf-8") as file:
+        try:
+            raw = json.load(file)
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"JSON inválido: {e}")
+    if not isinstance(raw, dict): raise ConfigError("El archivo debe contener un objeto JSON")
+    return validate(raw)
+
+
+class ConfigWatcher:
+    """ Vigila el archivo de configuración y aplica los cambios en caliente.
+
+    Cada `interval` segundos revisa la fecha de modificación del archivo. Si cambió, lo carga y valida fuera
+    del bucle de eventos; si es válido, llama a los suscriptores con la nueva configuración completa.
+    El cambio es todo o nada: primero cada suscriptor prepara sus objetos nuevos y, solo si todos lo lograron,
+    se aplican. Una configuración inválida (o que un suscriptor no pudo preparar) se reporta en el registro
+    y la activa se mantiene sin cambios en todos los suscriptores.
+    """
+
+    def __init__(self, path: str, config: dict, interval: float = 2.0):
+        self.path = path
+        self.config = config
+        self.interval = interval
+        self.subscribers = []
+        self.reloads = 0
+        self._signature = self._file_signature()
+
+    def subscribe(self, callback):
+        """ callback(config) se llama de forma síncrona, sin await de por medio, para que el cambio sea atómico.
+        Debe limitarse a asignar valores: si puede fallar, usar subscribe_prepared. """
+        self.subscribers.append(lambda config: functools.partial(callback, config))
+
+    def subscribe_prepared(self, prepare):
+        """ prepare(config) crea los objetos que dependen de la configuración sin modificar nada y devuelve una función
+        sin argumentos que los asigna. Si algún prepare falla, no se aplica ninguno. """
+        self.subscribers.append(prepare)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                signature = await asyncio.to_thread(self._file_signature)
+                if signature == self._signature or signature is None: continue
+                self._signature = signature
+                try:
+                    await self.reload()
+                except Exception as e: # Un error al recargar no debe detener la vigilancia (ni al bot con ella)
+                    log.error("No se pudo recargar la configuración, se mantiene la anterior", path=self.path, error=repr(e))
+        except asyncio.CancelledError:
+            log.info("Vigilancia de la configuración detenida.")
+
+    async def reload(self):
+        try:
+            new_config = await asyncio.to_thread(load_config, self.path)
+        except (ConfigError, OSError) as e:
+            log.error("Configuración inválida, se mantiene la anterior", path=self.path, error=str(e))
+            return False
+
+        for keys in RESTART_ONLY:
+            old_value, new_value = _get(self.config, keys), _get(new_config, keys)
+            if old_value != new_value:
+                log.warning("Este cambio requiere reiniciar el bot; se mantiene el valor actual",
+                            field=".".join(keys), actual=old_value, nuevo=new_value)
+                _set(new_config, keys, old_value)
+
+        try:
+            compile_order_patterns(new_config["estrategia"]["asset_regex"]) # Precompilamos antes del cambio
+            commits = [prepare(new_config) for prepare in self.subscribers]
+        except Exception as e:
+            log.error("No se pudo aplicar la configuración, se mantiene la anterior", path=self.path, error=repr(e))
+            return False
+        self.config = new_config
+        for commit in commits:
+            commit()
+        self.reloads += 1
+        log.info("Configuración recargada", path=self.path, estrategia=new_config["estrategia"])
+        return True
+
+
+def _get(config, keys):
+    for key in keys:
+        config = config[key]
+    return config
+
+def _set(config, keys, value):
+    for key in keys[:-1]:
+        config = config[key]
+    config[keys[-1]] = value
@@ -1,58 +1,133 @@
 import os
+import sys
+import time
 import asyncio
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from telethon import TelegramClient, events
 import MetaTrader5 as mt5
 import strategy
+from event_log import log
+from metrics import metrics, instrument_mt5, executor_gauges
+from loop_watchdog import LoopWatchdog
+from trade_journal import journal
+from strategy_config import ConfigWatcher, load_config, compile_order_patterns, grid_levels
+from modification_queue import modification_queue
+from account_state import account_state
+from gap_recovery import GapRecovery
+from channels import ChannelRegistry, DEFAULT_MAGIC, DEFAULT_ORDER_TEMPLATES
+from memory_telemetry import MemoryTelemetry
+from control_commands import ControlCommands
 
 class TelegramInput:
     """Clase que lee los mensajes de mi Telegram y los expone a través de una cola."""
 
-    def __init__(self, api_id: int, api_hash: str):
+    def __init__(self, api_id: int, api_hash: str, registry=None, recovery=None):
         self.api_id = api_id
         self.api_hash = api_hash
         self.session_name = "mi_sesion_trading"
+        self.registry = registry or ChannelRegistry.from_config([]) # Qué chats escuchamos y cómo se interpreta cada uno
+        self.chats = self.registry.chat_ids
         self.queue = asyncio.Queue()  # Cola para compartir mensajes
         self.client = TelegramClient(self.session_name, self.api_id, self.api_hash)
+        self.recovery = recovery or GapRecovery()
+        self.reconnect_delay = 5 # Segundos de espera entre intentos de reconexión
+        self._recovering = False
+        self._held_messages = [] # Mensajes en vivo que llegan mientras recuperamos el hueco
 
     async def handle_new_message(self, event: events.NewMessage.Event):
         """Maneja nuevos mensajes recibidos."""
-        sender = await event.get_sender()
-        message_text = event.raw_text
-        username = sender.username if sender else None
+        if self._recovering:
+            # Los encolamos después de los recuperados, para respetar el orden de llegada
+            self._held_messages.append(event.message)
+            return
+        await self.enqueue_message(event.message)
+
+    async def enqueue_message(self, message):
+        """ Pone en la cola un mensaje de Telethon, salvo que ya se haya recibido. Cuenta como procesado recién
+        cuando process_messages_loop llama a message_done. """
+        if self.recovery.seen(message.chat_id, message.id): return
+        # Prefiltro por palabras clave: la charla del canal no llega a la cola ni a las expresiones regulares
+        if not self.registry.accepts(message.chat_id, message.raw_text):
+            self.recovery.done(message.chat_id, message.id)
+            if self.recovery.needs_save(): await self.recovery.save_async()
+            return
+        self.recovery.hold(message.chat_id, message.id)
+        sender = await message.get_sender()
+        username = getattr(sender, "username", None) if sender else None
         mensaje = {
             "username": username,
-            "text": message_text,
-            "chat_id": event.chat_id,
+            "text": message.raw_text,
+            "chat_id": message.chat_id,
+            "channel": self.registry.get(message.chat_id).name,
+            "id": message.id,
+            "date": message.date.timestamp() if message.date else None,
         }
         await self.queue.put(mensaje)
 
+    async def recover_missed_messages(self):
+        """ Encola, en orden, los mensajes que llegaron mientras no estábamos conectados. """
+        self._recovering = True
+        try:
+            await self.recovery.catch_up(self.client, self.registry, self.enqueue_message)
+        except Exception as e:
+            log.error("No se pudieron recuperar los mensajes perdidos", error=str(e))
+        finally:
+            self._recovering = False
+            held, self._held_messages = self._held_messages, []
+            for message in held:
+                await self.enqueue_message(message)
+            await self.recovery.save_async()
+
     async def start_listening(self):
-        """Inicia la escucha de mensajes."""
+        """Inicia la escucha de mensajes y se reconecta si la conexión se cae."""
         
-        @self.client.on(events.NewMessage(chats=[-1003169821641, 6685390587]))
+        @self.client.on(events.NewMessage(chats=self.chats))
         async def new_message_listener(event):
             await self.handle_new_message(event)
 
-        print("Bot escuchando mensajes del grupo \"VIP Trading\"...")
-        # Usamos async with para manejar la conexión y desconexión
+        log.info("Bot escuchando mensajes...", canales=[profile.name for profile in self.registry.profiles.values()])
         try:
-            async with self.client:
+            await self.client.start()
+            while True:
+                await self.recover_missed_messages()
                 await self.client.run_until_disconnected()
+                log.warning("Conexión con Telegram perdida. Reconectando...")
+                while not self.client.is_connected():
+                    await asyncio.sleep(self.reconnect_delay)
+                    try:
+                        await self.client.connect()
+                    except (OSError, ConnectionError) as e:
+                        log.warning("Reintento de conexión con Telegram fallido", error=str(e))
         except asyncio.CancelledError:
-            print("Deteniendo la escucha de Telegram...")
+            log.info("Deteniendo la escucha de Telegram...")
+        except Exception as e:
+            log.error(f"Error en start_listening: {e}")
+        finally:
             if self.client.is_connected():
                 await self.client.disconnect()
-            print("Cliente de Telegram desconectado.")
-        except Exception as e:
-            print(f"Error en start_listening: {e}")
+                log.info("Cliente de Telegram desconectado.")
+            self.recovery.save()
+
 
+    async def reply(self, chat_id: int, text: str):
+        """ Envía un mensaje al chat. Un error al responder no debe detener el procesamiento de mensajes. """
+        try:
+            await self.client.send_message(chat_id, text)
+        except Exception as e:
+            log.warning("No se pudo responder en Telegram", chat_id=chat_id, error=str(e))
 
     async def get_message(self):
         """Obtiene el siguiente mensaje de la cola (espera hasta que haya uno)."""
         return await self.queue.get()
 
+    async def message_done(self, message: dict):
+        """ Avisa que el mensaje de get_message ya se procesó, para que no se recupere después de un reinicio. """
+        self.recovery.done(message["chat_id"], message["id"])
+        if self.recovery.needs_save():
+            await self.recovery.save_async()
+
 class TradingOrder:
     """ Clase que toma los mensajes de mi telegram y los 
     convierte en ordenes para Meta Trader 5.
@@ -61,151 +136,191 @@ class TradingOrder:
     def __init__(self, my_trading_account:object, cobertura:object, estrategia:dict):
         self.my_trading_account = my_trading_account
         self.cobertura = cobertura
-        self.estrategia = estrategia
-        
+        self.apply_config({"estrategia": estrategia})
+
+    def apply_config(self, config: dict):
+        """ Reemplaza la estrategia y su filtro sin await de por medio. Las órdenes en curso conservan la referencia anterior. """
+        self.prepare_config(config)()
+
+    def prepare_config(self, config: dict):
+        """ Crea el filtro de la nueva configuración sin tocar el actual y devuelve la función que los intercambia
+        (ver ConfigWatcher.subscribe_prepared). Si Strategy falla, la estrategia activa queda como estaba. """
+        estrategia = config["estrategia"]
+        order_filter = strategy.Strategy(self.cobertura, **estrategia) # Un solo filtro por configuración, no uno por mensaje
+        def commit():
+            self.estrategia, self.order_filter = estrategia, order_filter
+        return commit
         
-    def catch_order(self, telegram_message:str, order_type:str, order_match:str)->dict:
-        # Esta función es síncrona (solo regex)
+    async def catch_order(self, telegram_message:str, order_type:str, order_match, estrategia:dict=None, sized=True):
+        """ Devuelve un strategy.Signal con los valores ya convertidos a número, o None si el mensaje no es de este tipo.
+        Si sized es False no se calcula el volumen (queda en cero): lo hace Strategy.filter_batch para toda la grilla.
+        """
+        # Asíncrona: el precio de mercado y el volumen se consultan a MT5 fuera del bucle de eventos
         price_match = r"\$?(\d+(\.\d+)?)"
         stop_loss_match = r"Sl:\s?(\d+(\.\d+)?)"
         take_profit_match = r"Tp:\s?(\d+(\.\d+)?)"
         trailing_stop_match = r"SL [A-Z0-9]+ \$(\d+(\.\d+)?)"
-
-        # Calculamos el volumen mínimo por operación
-            
         
-        order_instruction = {}
-        order_search = re.search(order_match, telegram_message, re.IGNORECASE)
+        order_search = order_match.search(telegram_message) # order_match ya viene compilada (ver compile_order_patterns)
+        if not order_search: return None
+
+        asset_base = order_search.group(1)
+        asset = asset_base + "c" if self.my_trading_account.account_type == "USC" else asset_base
+        price_search = re.search(price_match, telegram_message)
+        stop_loss_search = re.search(stop_loss_match, telegram_message, re.IGNORECASE)
+        take_profit_search = re.search(take_profit_match, telegram_message, re.IGNORECASE)
+        trailing_stop_search = re.search(trailing_stop_match, telegram_message, re.IGNORECASE)     
         
-        if order_search:
-            asset_base = order_search.group(1)
-            asset = asset_base + "c" if self.my_trading_account.account_type == "USC" else asset_base
-            price_search = re.search(price_match, telegram_message)
-            stop_loss_search = re.search(stop_loss_match, telegram_message, re.IGNORECASE)
-            take_profit_search = re.search(take_profit_match, telegram_message, re.IGNORECASE)
-            trailing_stop_search = re.search(trailing_stop_match, telegram_message, re.IGNORECASE)     
-            
-            order_instruction["order_type"] = order_type.strip()
-            order_instruction["asset"] = asset         
-            if order_type != "Trailing Stop" and price_search:
-                # Si el precio es a mercado, debo calcularlo yo (puede ser muy distinto al de telegram por lag)
-                order_instruction["price"] = self.get_market_price(asset, price_search, order_type)
-                order_instruction["stop_loss"] = "0.0" if not stop_loss_search else stop_loss_search.group(1)
-                order_instruction["take_profit"] = "0.0" if not take_profit_search else take_profit_search.group(1)
-                order_instruction["volume"] = self.calculate_volume(asset, order_instruction["price"], order_instruction["stop_loss"])
-            elif order_type == "Trailing Stop" and trailing_stop_search or order_type == "Cierre": 
-                 order_instruction["price"] = "0"
-                 order_instruction["stop_loss"] = "0.0" if not trailing_stop_search else trailing_stop_search.group(1)
-
-        return order_instruction
+        order_type = order_type.strip()
+        if order_type != "Trailing Stop" and price_search:
+            # Si el precio es a mercado, debo calcularlo yo (puede ser muy distinto al de telegram por lag)
+            price = float(await self.get_market_price(asset, price_search, order_type))
+            stop_loss = float(stop_loss_search.group(1)) if stop_loss_search else 0.0
+            take_profit = float(take_profit_search.group(1)) if take_profit_search else 0.0
+            volume = await self.calculate_volume(asset, price, stop_loss, estrategia) if sized else 0.0
+            return strategy.Signal(order_type, asset, price, stop_loss, take_profit, volume, float(price_search.group(1)))
+        elif order_type == "Trailing Stop" and trailing_stop_search or order_type == "Cierre": 
+            stop_loss = float(trailing_stop_search.group(1)) if trailing_stop_search else 0.0
+            return strategy.Signal(order_type, asset, stop_loss=stop_loss)
+        return strategy.Signal(order_type, asset)
     
-    def catch_orders(self, telegram_message):
-        # Esta función es síncrona (solo regex)
-        try:
-            asset_pattern = self.estrategia["asset_regex"]
-        except KeyError:
-            asset_pattern = r"[A-Z0-9]+" # Si el usuario no especifica un activo, asumimos que los quiere todos.
-        orders = {
-            "Buy Limit": rf"Buy limit Creada ({asset_pattern})",
-            "Buy Limit ": rf"Buy Limit ({asset_pattern})",
-            "Compra": rf"Compra\s({asset_pattern})",
-            "Venta": rf"Venta\s({asset_pattern})",
-            "Trailing Stop": rf"SL\s({asset_pattern})",
-            "Cierre": rf"Cierre\s({asset_pattern})"
-        }
-        for order_type, order_match in orders.items():
-            order_call = self.catch_order(telegram_message, order_type, order_match)
-            if order_call: 
-                return order_call
-        return {}
-
-    async def execute_order(self, telegram_message):
-        order = self.catch_orders(telegram_message)
-        if not order:
-            print("No se detectó una orden válida en el mensaje.")
+    async def catch_orders(self, telegram_message, estrategia:dict=None, profile=None, sized=True):
+        estrategia = estrategia or self.estrategia
+        # Si el usuario no especifica un activo, asumimos que los quiere todos.
+        asset_regex = estrategia.get("asset_regex", r"[A-Z0-9]+")
+        # Cada canal puede tener su propio formato de mensaje (ver channels.ChannelProfile)
+        orders = compile_order_patterns(asset_regex, profile.order_templates) if profile else compile_order_patterns(asset_regex)
+        for order_type, order_match in orders:
+            signal = await self.catch_order(telegram_message, order_type, order_match, estrategia, sized)
+            if signal is not None: 
+                return signal
+        return None
+
+    async def execute_order(self, telegram_message, chat_id=0, message_ts=None, profile=None):
+        """
+        Interpreta, filtra y envía una orden. Para Buy Limit, Compra y Venta la solicitud se construye y se valida
+        con order_check mientras corre el filtro de la estrategia (son independientes), así la orden sale apenas
+        el filtro la acepta. Los tiempos de cada etapa quedan en bot_execute_stage_seconds.
+        """
+        started = time.perf_counter()
+        # Toda la orden usa la misma configuración aunque se recargue mientras tanto
+        estrategia, order_filter = self.estrategia, self.order_filter
+        signal = await self.catch_orders(telegram_message, estrategia, profile)
+        if signal is None:
+            log.warning("No se detectó una orden válida en el mensaje.")
             return
-        
-        accept_order = strategy.Strategy(self.cobertura, order, **self.estrategia)
+        timings = {"parse": time.perf_counter() - started}
 
-        if not await accept_order.filter_order():
-            print(f"Orden para {order.get('asset')} rechazada por filtros de riesgo/distancia.")
-            return
+        journal_row = self.journal_row(signal, chat_id, message_ts)
+        account = self.my_trading_account
+        prepare = None
+        if signal.order_type in account.ORDER_TYPES:
+            prepare = asyncio.create_task(account.prepare_order(signal, profile.magic if profile else DEFAULT_MAGIC))
 
-        print("Orden de trading: ", order)
-        order_type = order.get("order_type")
-        asset = order.get("asset")
-        
+        filter_started = time.perf_counter()
         try:
-            price = float(order.get("price", 0.0))
-            stop_loss = float(order.get("stop_loss", 0.0))
-            take_profit = float(order.get("take_profit", 0.0))
-            volume = float(order.get("volume", 0.0))
-        except ValueError:
-            print("Error al convertir datos numéricos.")
+            decision = await order_filter.filter_order(signal)
+        except BaseException:
+            if prepare: prepare.cancel()
+            raise
+        timings["filter"] = time.perf_counter() - filter_started
+
+        if not decision.accepted:
+            if prepare: prepare.cancel()
+            log.warning(f"Orden para {signal.asset} rechazada por filtros de riesgo/distancia.")
+            journal.record(volume=decision.volume, accepted=False, reason=decision.reason, **journal_row)
             return
-        
-        if accept_order.try_with_min_vol:
-            info_symbol = mt5.symbol_info(asset)
-            volume  = info_symbol.volume_min # Se puede refactorizar para que el volumen mínimo sea obtenido una sola vez.
 
-        if not order_type or not asset:
-            print("La orden detectada no tiene tipo o activo. Omitiendo.")
-            return
+        log.info("Orden de trading", order=signal)
+        order_type, asset = signal.order_type, signal.asset
+        volume = decision.volume # Puede ser el volumen mínimo del símbolo si el filtro lo redujo por riesgo
         
-        if order_type == "Buy Limit":
-            await self.my_trading_account.execute_buy_limit(asset, price, stop_loss, take_profit, volume)
-        elif order_type == "Compra":
-            await self.my_trading_account.execute_buy(asset, stop_loss, take_profit, volume)
-        elif order_type == "Venta":
-            await self.my_trading_account.execute_sell(asset, stop_loss, take_profit, volume)
+        result = None
+        if prepare:
+            request, check, timings["prepare"] = await prepare
+            if request is None:
+                journal.record(volume=volume, accepted=False, reason="request", **journal_row)
+                return
+            if volume != request["volume"]:
+                # El filtro bajó el volumen: la validación previa no sirve (por ejemplo, el margen requerido cambia)
+                request = {**request, "volume": volume}
+                check = await asyncio.to_thread(mt5.order_check, request)
+            if check is not None and check.retcode != 0:
+                # El broker la rechazaría igual (margen, stops, volumen...): no gastamos el envío
+                log.error("order_check rechazó la orden", retcode=check.retcode, comment=check.comment, request=request)
+                journal.record(volume=volume, accepted=False, reason="order_check", retcode=check.retcode, **journal_row)
+                return
+            send_started = time.perf_counter()
+            result = await account.send_order(request, account.ORDER_DESCRIPTIONS[order_type])
+            timings["send"] = time.perf_counter() - send_started
         elif order_type == "Trailing Stop":
-            await self.my_trading_account.execute_trailing_stop(asset, stop_loss)
+            await account.execute_trailing_stop(asset, signal.stop_loss)
         elif order_type == "Cierre":
-            await self.my_trading_account.close_profit_trades(asset, stop_loss)
+            await account.close_profit_trades(asset, signal.stop_loss)
+
+        self.record_execution(journal_row, decision, result)
+        timings["total"] = time.perf_counter() - started
+        if "prepare" in timings:
+            # Lo que habría tardado de más si la validación esperara al filtro
+            timings["overlap_saved"] = min(timings["filter"], timings["prepare"])
+        for stage, seconds in timings.items():
+            metrics.observe("bot_execute_stage_seconds", seconds, (("stage", stage),))
+        log.debug("Etapas de la orden", order_type=order_type, **{stage: round(seconds, 6) for stage, seconds in timings.items()})
         
         # Gestionamos la cobertura después de realizar la orden
         if self.cobertura:
             await self.cobertura.gestionar_cobertura()
     
-    def calculate_volume(self, asset, price, stop_loss):
-        default_volume = self.estrategia["volume"][asset]
+    @staticmethod
+    def journal_row(signal, chat_id=0, message_ts=None) -> dict:
+        """ Datos comunes de la fila de la bitácora para una señal. """
+        return {"asset": signal.asset, "order_type": signal.order_type, "signal_price": signal.signal_price,
+                "price": signal.price, "stop_loss": signal.stop_loss, "take_profit": signal.take_profit,
+                "chat_id": chat_id or 0, "message_ts": message_ts if message_ts is not None else float("nan")}
+
+    @staticmethod
+    def record_execution(journal_row, decision, result):
+        """ Registra en la bitácora una orden aceptada, con el resultado de MT5 si lo hubo. """
+        if result is None:
+            journal.record(volume=decision.volume, accepted=True, reason=decision.reason, **journal_row)
+        else:
+            journal.record(volume=decision.volume, accepted=True, reason=decision.reason, retcode=result.retcode, ticket=result.order,
+                           fill_price=result.price, fill_volume=result.volume, **journal_row)
+
+    async def calculate_volume(self, asset:str, price:float, stop_loss:float, estrategia:dict=None)->float:
+        estrategia = estrategia or self.estrategia
+        default_volume = estrategia["volume"][asset]
         if default_volume > 0:  return default_volume # Si el volumen es diferente de cero, asumimos que el usuario quiere utilizar ese volumen, sin calcularlo por el riesgo máximo.
-        risk = self.estrategia["risk"][asset]
-        try:
-            price = float(price)
-            stop_loss = float(stop_loss)
-        except ValueError:
-            print("No pudimos convertir el precio o stop loss a un valor numérico.")
-            return 0.0 # No podemos utilizar price o stop loss, por lo que no ejecutamos la orden
-
-        account_info = mt5.account_info()
-        balance = account_info.balance if account_info else 0
+        risk = estrategia["risk"][asset]
+        if price == stop_loss:
+            log.error("No podemos calcular el volumen: el precio y el stop loss son iguales.")
+            return 0.0 # No podemos dimensionar la orden por riesgo, por lo que no la ejecutamos
+
+        account = await account_state.get() # Misma lectura que usan el filtro de riesgo y la cobertura
+        balance = account.balance if account else 0
         volume = round((risk * balance) / abs(price - stop_loss), 2)
-        info_symbol = mt5.symbol_info(asset)
+        info_symbol = await asyncio.to_thread(mt5.symbol_info, asset)
         if info_symbol is None:
-                    print(f"Error: El símbolo {asset} no existe en el Market Watch de MT5.")
+                    log.error(f"Error: El símbolo {asset} no existe en el Market Watch de MT5.")
                     return 0.0
         min_volume  = info_symbol.volume_min
         if volume < min_volume:
-            print("El riesgo de esta operación es mayor al esperado.")
+            log.warning("El riesgo de esta operación es mayor al esperado.")
             return 0.0
         else:
             return volume
         
-    def get_market_price(self, symbol, price_search:str, order:str):
+    async def get_market_price(self, symbol, price_search:str, order:str):
         """ Obtenemos el precio as, bid o el precio desde telegram según sea el caso. 
         
         Ask: Precio cuando es una compra a mercado
         Bid: Precio cuando es una venta a mercado
         price_search: Match de precio realizado con regex
         """
-        last_tick = mt5.symbol_info_tick(symbol)
-        if order == "Compra":
-            return last_tick.ask
-        elif order == "Venta":
-            return last_tick.bid
-        else:
+        if order not in ("Compra", "Venta"):
             return price_search.group(1)
+        last_tick = await asyncio.to_thread(mt5.symbol_info_tick, symbol)
+        return last_tick.ask if order == "Compra" else last_tick.bid
 
         
 class PendingOperations(TradingOrder):
@@ -216,107 +331,151 @@ class PendingOperations(TradingOrder):
         self.pending_orders = None # Se cargará bajo demanda
         super().__init__(my_trading_account, cobertura, estrategia)
         
-    def get_pending_operations_in_message(self, telegram_message)->set:
+    def get_pending_operations_in_message(self, telegram_message, profile=None)->set:
         """
-        Devuelve un conjunto de strings. Cada string viene en la forma de activo>precio 
+        Devuelve un conjunto de (línea, (activo, precio)) con los niveles Buy Limit del listado, interpretados con
+        las plantillas del canal. El activo lleva el sufijo de la cuenta, igual que en MT5.
         """
-        assets_in_message = set()
-        split_orders = [line.strip() for line in telegram_message.splitlines() if line.strip().startswith("Buy Limit")]
-        for line in split_orders:
-            match = re.search(r"Buy Limit\s+([A-Z0-9]+)\s(\d+(\.\d+)?)", line)
-            if not match: continue
-            groups = match.groups()
-            if len(groups):
-                concat = groups[0] + ">" + groups[1]
-                assets_in_message.add((line, concat))
-        return assets_in_message
+        templates = profile.order_templates if profile else DEFAULT_ORDER_TEMPLATES
+        suffix = "c" if self.my_trading_account.account_type == "USC" else ""
+        return {(line, (asset + suffix, price)) for line, asset, price in grid_levels(telegram_message, templates)}
     
-    async def get_pending_operations_in_trading_account(self):
+    async def get_pending_operations_in_trading_account(self, profile=None):
+        """ Carga en self.pending_orders las órdenes pendientes del canal y devuelve sus (activo, precio).
+        Las órdenes de otros canales y la cobertura no se tocan: cada listado describe solo las de su canal.
+        Sin perfil se cargan todas, solo para no repetir niveles (delete_old_pending_orders no borra nada sin perfil).
+        """
         # Asíncrono, carga las órdenes solo cuando se necesita
         assets_in_account = set()
-        self.pending_orders = await asyncio.to_thread(mt5.orders_get)
+        pending_orders = await asyncio.to_thread(mt5.orders_get)
         
-        if self.pending_orders is None:
-            print("No se pudieron obtener órdenes pendientes de la cuenta.")
+        if pending_orders is None:
+            log.warning("No se pudieron obtener órdenes pendientes de la cuenta.")
             self.pending_orders = [] # Asegurar que sea iterable
             return assets_in_account
-            
+
+        self.pending_orders = [order for order in pending_orders if profile is None or profile.owns(order)]
         for order in self.pending_orders:
-            info_order = f"{order.symbol}>{order.price_open}"
-            assets_in_account.add(info_order)
+            assets_in_account.add((order.symbol, order.price_open))
         return assets_in_account
     
-    async def add_new_pending_orders(self, telegram_message):
-        message_orders_and_lines = self.get_pending_operations_in_message(telegram_message)
+    async def add_new_pending_orders(self, telegram_message, chat_id=0, message_ts=None, profile=None):
+        """
+        Envía los niveles de la grilla que aún no están en la cuenta. Todos los niveles nuevos se evalúan juntos
+        con Strategy.filter_batch (una sola lectura de la cuenta, sin depender del orden de las líneas) y los
+        aceptados se envían a MT5 de forma concurrente.
+        """
+        message_orders_and_lines = self.get_pending_operations_in_message(telegram_message, profile)
         message_orders = {i[1] for i in message_orders_and_lines}
-        account_orders = await self.get_pending_operations_in_trading_account()
+        account_orders = await self.get_pending_operations_in_trading_account(profile)
         
         new_orders = message_orders - account_orders
         if not new_orders: 
-            print("No hay ordenes pendientes nuevas para agregar.")
+            log.info("No hay ordenes pendientes nuevas para agregar.")
             return
-            
-        for new_order in new_orders:
-            asset, price = new_order.split(">")
-            message_lines = [l for l, o in message_orders_and_lines if asset in o and price in o]
-            for message in message_lines:
-                await self.execute_order(message) # execute_order ya es async
-
-    async def delete_old_pending_orders(self, telegram_message):
-        message_orders_and_lines = self.get_pending_operations_in_message(telegram_message)
+
+        estrategia, order_filter = self.estrategia, self.order_filter
+        new_lines = sorted({line for line, order in message_orders_and_lines if order in new_orders})
+        signals = []
+        for line in new_lines:
+            signal = await self.catch_orders(line, estrategia, profile, sized=False)
+            if signal is None or signal.order_type != "Buy Limit":
+                log.warning("No se detectó una orden Buy Limit válida en la línea.", line=line)
+                continue
+            signals.append(signal)
+        if not signals: return
+
+        decisions = await order_filter.filter_batch(signals)
+        submissions = []
+        magic = profile.magic if profile else DEFAULT_MAGIC
+        for signal, decision in zip(signals, decisions):
+            journal_row = self.journal_row(signal, chat_id, message_ts)
+            if not decision.accepted:
+                log.warning(f"Orden para {signal.asset} a {signal.price} rechazada por filtros de riesgo/distancia.", reason=decision.reason)
+                journal.record(volume=decision.volume, accepted=False, reason=decision.reason, **journal_row)
+                continue
+            submissions.append((journal_row, decision, self.my_trading_account.execute_buy_limit(
+                signal.asset, signal.price, signal.stop_loss, signal.take_profit, decision.volume, magic)))
+
+        log.info("Grilla de órdenes pendientes evaluada", nuevas=len(signals), aceptadas=len(submissions))
+        results = await asyncio.gather(*(send for _, _, send in submissions), return_exceptions=True)
+        for (journal_row, decision, _), result in zip(submissions, results):
+            if isinstance(result, Exception):
+                log.error("Error al enviar una orden de la grilla", asset=journal_row["asset"], price=journal_row["price"], error=str(result))
+                result = None
+            self.record_execution(journal_row, decision, result)
+
+        # Una sola gestión de la cobertura para toda la grilla
+        if self.cobertura and submissions:
+            await self.cobertura.gestionar_cobertura()
+
+    async def delete_old_pending_orders(self, telegram_message, profile=None):
+        """ Borra las órdenes pendientes del canal que ya no están en su listado. Nunca toca las de otros canales ni la cobertura. """
+        if profile is None:
+            log.warning("Listado de órdenes pendientes sin canal: no se borra ninguna orden.")
+            return
+        message_orders_and_lines = self.get_pending_operations_in_message(telegram_message, profile)
         message_orders = {i[1] for i in message_orders_and_lines}
-        account_orders = await self.get_pending_operations_in_trading_account()
+        account_orders = await self.get_pending_operations_in_trading_account(profile)
         
         delete_orders = account_orders - message_orders
         
-        # self.pending_orders fue cargado por get_pending_operations_in_trading_account()
+        # self.pending_orders fue cargado por get_pending_operations_in_trading_account(), solo con las órdenes del canal
         if self.pending_orders is None: return 
         
         for order in self.pending_orders:
-            info_order = f"{order.symbol}>{order.price_open}"
-            if info_order in delete_orders:
+            if (order.symbol, order.price_open) in delete_orders:
                 request = {
                     "action": mt5.TRADE_ACTION_REMOVE,
                     "order": order.ticket,
                 }
                 result = await asyncio.to_thread(mt5.order_send, request)
                 if result.retcode != mt5.TRADE_RETCODE_DONE:
-                    print(f"Error al eliminar orden {order.ticket}: {result.retcode}")
+                    log.error(f"Error al eliminar orden {order.ticket}: {result.retcode}")
                 else:
-                    print(f"Orden {order.ticket} eliminada con éxito")
+                    log.info(f"Orden {order.ticket} eliminada con éxito")
 
-    async def manage_pending_orders(self, telegram_message):
-        await self.delete_old_pending_orders(telegram_message)
-        await self.add_new_pending_orders(telegram_message)
+    async def manage_pending_orders(self, telegram_message, chat_id=0, message_ts=None, profile=None):
+        await self.delete_old_pending_orders(telegram_message, profile)
+        await self.add_new_pending_orders(telegram_message, chat_id, message_ts, profile)
 
 
 class TradingAccount:
     """ Clase para conectarse y operar en una cuenta de trading. """
 
+    # Señales que se convierten en una solicitud de order_send, y cómo se nombran en el registro
+    ORDER_TYPES = {"Buy Limit": mt5.ORDER_TYPE_BUY_LIMIT, "Compra": mt5.ORDER_TYPE_BUY, "Venta": mt5.ORDER_TYPE_SELL}
+    ORDER_DESCRIPTIONS = {"Buy Limit": "Buy Limit", "Compra": "de Compra", "Venta": "de Venta"}
+
     def __init__(self, account_type):
         # __init__ es síncrono. La inicialización de MT5 es bloqueante
         # pero se hace una sola vez al inicio, ANTES del bucle async.
         if not mt5.initialize():
-            print("initialize() falló, error code =", mt5.last_error())
+            error_code = mt5.last_error()
+            log.error("initialize() falló", error_code=error_code)
+            log.stop() # quit() mata al hilo escritor (es daemon): vaciamos el buffer antes para no perder este error
+            print(f"initialize() falló, código de error = {error_code}", file=sys.stderr)
             quit()
         else:
-            print("¡Conexión con MetaTrader 5 establecida con éxito!")
+            log.info("¡Conexión con MetaTrader 5 establecida con éxito!")
         self.account_type = account_type # Puede ser USD o USC
         self.crypto_symbols = ['BTCUSDc', 'ETHUSDc'] if account_type == "USC" else ['BTCUSD', 'ETHUSD']
+        self._background_tasks = set() # Referencias a las confirmaciones de trailing stop en curso
+        self._closing_tickets = set()
 
-    async def _get_trade_request(self, asset, order_type, volume, sl=0.0, tp=0.0, price=0.0):
+    async def _get_trade_request(self, asset, order_type, volume, sl=0.0, tp=0.0, price=0.0, magic=DEFAULT_MAGIC):
         """
-        Construye un diccionario de solicitud de trade (asíncrono).
+        Construye un diccionario de solicitud de trade (asíncrono). magic identifica al canal que envió la señal.
         """
         if not await self._check_and_enable_symbol(asset):
-            print(f"No se pudo obtener información para el símbolo {asset}")
+            log.error(f"No se pudo obtener información para el símbolo {asset}")
             return None
         
         filling_mode = mt5.ORDER_FILLING_IOC if asset in self.crypto_symbols else mt5.ORDER_FILLING_FOK
         
         request = {
             "symbol": asset, "volume": volume, "sl": sl, "tp": tp,
-            "magic": 1234, "deviation": 20,
+            "magic": magic, "deviation": 20,
             "type_time": mt5.ORDER_TIME_GTC, "type_filling": filling_mode,
         }
 
@@ -329,68 +488,66 @@ class TradingAccount:
             request["price"] = price
             request["comment"] = f"Orden Buy Limit {asset}"
         else:
-            print(f"Tipo de orden no soportado: {order_type}")
+            log.error(f"Tipo de orden no soportado: {order_type}")
             return None
 
         return request
 
-    async def execute_buy_limit(self, asset, price, stop_loss, take_profit, volume):
-        if not await self._check_and_enable_symbol(asset): return
-        request = await self._get_trade_request(asset, mt5.ORDER_TYPE_BUY_LIMIT, volume, sl=stop_loss, tp=take_profit, price=price)
-        if request is None: return
-        
+    async def prepare_order(self, signal, magic=DEFAULT_MAGIC):
+        """
+        Construye la solicitud de una señal (Buy Limit, Compra o Venta) y la valida con order_check, sin enviarla.
+        Devuelve (request, check, segundos). request es None si el símbolo no está disponible; check es None si
+        order_check no respondió.
+        """
+        started = time.perf_counter()
+        request = await self._get_trade_request(signal.asset, self.ORDER_TYPES[signal.order_type], signal.volume,
+                                                sl=signal.stop_loss, tp=signal.take_profit, price=signal.price, magic=magic)
+        check = await asyncio.to_thread(mt5.order_check, request) if request is not None else None
+        return request, check, time.perf_counter() - started
+
+    async def send_order(self, request, description):
         result = await asyncio.to_thread(mt5.order_send, request)
-        
         if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
-            print("Error al enviar la orden Buy Limit.")
+            log.error(f"Error al enviar la orden {description}.")
             await self.print_failed_operation(result)
         else:
-            print("¡Orden Buy Limit enviada exitosamente!")
-            print("Posición ticket: {}".format(result.order))
+            log.info(f"¡Orden {description} enviada exitosamente!", ticket=result.order)
+            account_state.invalidate() # El margen cambió: la próxima consulta lee la cuenta de nuevo
+        return result
 
-    async def execute_buy(self, asset, stop_loss, take_profit, volume):
-        if not await self._check_and_enable_symbol(asset): return
-        request = await self._get_trade_request(asset, mt5.ORDER_TYPE_BUY, volume, sl=stop_loss, tp=take_profit)
+    # _get_trade_request ya verifica y habilita el símbolo: no lo repetimos aquí
+    async def execute_buy_limit(self, asset, price, stop_loss, take_profit, volume, magic=DEFAULT_MAGIC):
+        request = await self._get_trade_request(asset, mt5.ORDER_TYPE_BUY_LIMIT, volume, sl=stop_loss, tp=take_profit, price=price, magic=magic)
         if request is None: return
-        
-        result = await asyncio.to_thread(mt5.order_send, request)
-        if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
-            print("Error al enviar la orden de Compra.")
-            await self.print_failed_operation(result)
-        else:
-            print("¡Orden de Compra enviada exitosamente!")
-            print("Posición ticket: {}".format(result.order))
+        return await self.send_order(request, self.ORDER_DESCRIPTIONS["Buy Limit"])
 
-    async def execute_sell(self, asset, stop_loss, take_profit, volume):
-        if not await self._check_and_enable_symbol(asset): return
-        request = await self._get_trade_request(asset, mt5.ORDER_TYPE_SELL, volume, sl=stop_loss, tp=take_profit)
+    async def execute_buy(self, asset, stop_loss, take_profit, volume, magic=DEFAULT_MAGIC):
+        request = await self._get_trade_request(asset, mt5.ORDER_TYPE_BUY, volume, sl=stop_loss, tp=take_profit, magic=magic)
         if request is None: return
-        
-        result = await asyncio.to_thread(mt5.order_send, request)
-        if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
-            print("Error al enviar la orden de Venta.")
-            await self.print_failed_operation(result)
-        else:
-            print("¡Orden de Venta enviada exitosamente!")
-            print("Posición ticket: {}".format(result.order))
+        return await self.send_order(request, self.ORDER_DESCRIPTIONS["Compra"])
+
+    async def execute_sell(self, asset, stop_loss, take_profit, volume, magic=DEFAULT_MAGIC):
+        request = await self._get_trade_request(asset, mt5.ORDER_TYPE_SELL, volume, sl=stop_loss, tp=take_profit, magic=magic)
+        if request is None: return
+        return await self.send_order(request, self.ORDER_DESCRIPTIONS["Venta"])
 
     async def execute_trailing_stop(self, asset, stop_loss):
         positions = await asyncio.to_thread(mt5.positions_get)
         position_found = False
         if positions is None:
-            print("No se encontraron posiciones, código de error =", await asyncio.to_thread(mt5.last_error))
+            log.error("No se encontraron posiciones", error_code=await asyncio.to_thread(mt5.last_error))
             return
         for position in positions:
             
-            position_profit, min_profit = self.check_position_profit(asset, position, stop_loss)
             if position.symbol != asset:
                 continue
-            elif position_profit > 0 and position_profit < min_profit:
-                print(f"{asset}:  ganancia mínima ({min_profit}) > ganancia esperada ({position_profit})")
+            position_profit, min_profit = await self.check_position_profit(asset, position, stop_loss)
+            if position_profit > 0 and position_profit < min_profit:
+                log.warning(f"{asset}:  ganancia mínima ({min_profit}) > ganancia esperada ({position_profit})")
 
             elif position_profit > min_profit:
                 position_found = True
-                print(f"Posición encontrada para {asset} con ticket {position.ticket} y ganancia de {position_profit:.2f}")
+                log.info(f"Posición encontrada para {asset} con ticket {position.ticket} y ganancia de {position_profit:.2f}")
                 position_type = position.type
                 modificar_sl_compra = (position_type == 0 and 
                                     position.sl < stop_loss and 
@@ -400,7 +557,7 @@ class TradingAccount:
                                     stop_loss < position.price_open)
                 
                 if modificar_sl_compra or modificar_sl_venta:
-                    print(f"  Modificando SL. Actual: {position.sl}, Nuevo: {stop_loss}")
+                    log.info(f"  Modificando SL. Actual: {position.sl}, Nuevo: {stop_loss}")
                     request = {
                         "action": mt5.TRADE_ACTION_SLTP,
                         "position": position.ticket,
@@ -408,32 +565,45 @@ class TradingAccount:
                         "tp": position.tp,
                         "comment": "Trailing Stop Update",
                     }
-                    result = await asyncio.to_thread(mt5.order_send, request)
-                    if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
-                        print(f"Error al modificar el Stop Loss al precio {stop_loss}. Cerramos posiciones de {asset} en positivo.")
-                        await self.close_order_with_profit(asset, position)
-                    else:
-                        print("  ¡Stop Loss modificado exitosamente!")
+                    # No esperamos el envío: si llega otro trailing stop antes de que salga, se fusiona con este
+                    future = modification_queue.submit(request)
+                    task = asyncio.create_task(self._confirm_trailing_stop(future, asset, position, stop_loss))
+                    self._background_tasks.add(task)
+                    task.add_done_callback(self._background_tasks.discard)
                 else:
-                    print(f"  No se requiere modificación de SL. Actual: {position.sl}, Propuesto: {stop_loss}")
+                    log.info(f"  No se requiere modificación de SL. Actual: {position.sl}, Propuesto: {stop_loss}")
         
         if not position_found:
-            print(f"No se encontró una posición abierta y rentable para {asset}.")
+            log.warning(f"No se encontró una posición abierta y rentable para {asset}.")
+
+    async def _confirm_trailing_stop(self, future, asset, position, stop_loss):
+        result = await future
+        if result is not None and result.retcode == mt5.TRADE_RETCODE_DONE:
+            log.info("  ¡Stop Loss modificado exitosamente!", ticket=position.ticket, sl=result.request.sl if result.request else stop_loss)
+            return
+        # Las modificaciones fusionadas comparten el resultado: cerramos la posición una sola vez
+        if position.ticket in self._closing_tickets: return
+        log.error(f"Error al modificar el Stop Loss al precio {stop_loss}. Cerramos posiciones de {asset} en positivo.")
+        self._closing_tickets.add(position.ticket)
+        try:
+            await self.close_order_with_profit(asset, position)
+        finally:
+            self._closing_tickets.discard(position.ticket)
 
     async def close_profit_trades(self, asset, stop_loss):
         positions = await asyncio.to_thread(mt5.positions_get)
         position_with_profit = False
         if positions is None:
-            print("No se encontraron posiciones, código de error =", await asyncio.to_thread(mt5.last_error))
+            log.error("No se encontraron posiciones", error_code=await asyncio.to_thread(mt5.last_error))
             return
                 
         for position in positions:
-            position_profit, min_profit = self.check_position_profit(asset, position, stop_loss)
+            position_profit, min_profit = await self.check_position_profit(asset, position, stop_loss)
             if position_profit > min_profit:
                 position_with_profit = True
                 await self.close_order_with_profit(asset, position)
         if not position_with_profit:
-            print("No hay posiciones con la ganancia suficiente para cerrarla.")
+            log.warning("No hay posiciones con la ganancia suficiente para cerrarla.")
 
 
     async def close_order_with_profit(self, asset, position):
@@ -446,7 +616,7 @@ class TradingAccount:
             "symbol": asset,
             "volume": position.volume,
             "type": order_type_close,
-            "deviation": 20, "magic": 1234,
+            "deviation": 20, "magic": DEFAULT_MAGIC,
             "comment": "Cierre con ganancia",
             "type_time": mt5.ORDER_TIME_GTC,
             "type_filling": filling_mode,
@@ -454,16 +624,17 @@ class TradingAccount:
         result = await asyncio.to_thread(mt5.order_send, request)
 
         if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
-            print(f"Error al cerrar la posición {position.ticket}.")
+            log.error(f"Error al cerrar la posición {position.ticket}.")
             await self.print_failed_operation(result)
         else:
-            print(f"¡Posición {position.ticket} para {asset} cerrada exitosamente!")
+            log.info(f"¡Posición {position.ticket} para {asset} cerrada exitosamente!")
+            account_state.invalidate()
             closed_any = True
                         
             if not closed_any:
-                print(f"No se encontraron posiciones con la rentabilidad deseada para {asset}.")
+                log.info(f"No se encontraron posiciones con la rentabilidad deseada para {asset}.")
 
-    def check_position_profit(self, asset, position, stop_loss)-> tuple:
+    async def check_position_profit(self, asset, position, stop_loss)-> tuple:
         """ Calculamos la ganancia mínima que estamos dispuestos a aceptar para cerrar la operación.
          La función devuelve una tupla, donde el primer valor es el profit de la posición y el
          segundo valor es la ganancia mínima que estoy dispuesto a aceptar.
@@ -478,7 +649,7 @@ class TradingAccount:
         else:
             position_profit = round((position_price - stop_loss) * position_volume, 2)
 
-        info_symbol = mt5.symbol_info(asset)
+        info_symbol = await asyncio.to_thread(mt5.symbol_info, asset)
         min_volume  = info_symbol.volume_min
         min_profit = min_profit * (position_volume / min_volume)
         return position_profit, min_profit
@@ -487,7 +658,7 @@ class TradingAccount:
     async def _check_and_enable_symbol(self, asset):
         symbol_info = await asyncio.to_thread(mt5.symbol_info, asset)
         if symbol_info is None:
-            print(f"El símbolo {asset} no fue encontrado.")
+            log.error(f"El símbolo {asset} no fue encontrado.")
             return False
         if not symbol_info.visible:
             if not await asyncio.to_thread(mt5.symbol_select, asset, True):
@@ -496,16 +667,10 @@ class TradingAccount:
 
     async def print_failed_operation(self, result):
         if result is None:
-            print("La operación falló antes de enviar la solicitud a MT5. Error:", await asyncio.to_thread(mt5.last_error))
+            log.error("La operación falló antes de enviar la solicitud a MT5", error_code=await asyncio.to_thread(mt5.last_error))
             return
-        print("Falló el envío de la orden, retcode={}".format(result.retcode))
-        result_dict = result._asdict()
-        for field, value in result_dict.items():
-            print(f"  {field}={value}")
-            if field == "request":
-                traderequest_dict = value._asdict()
-                for req_field, req_value in traderequest_dict.items():
-                    print(f"    traderequest: {req_field}={req_value}")
+        # Guardamos la referencia al TradeResult completo; el hilo del registro lo serializa fuera del bucle de eventos.
+        log.error("Falló el envío de la orden", retcode=result.retcode, result=result)
 
 # --- BUCLES ASÍNCRONOS Y LÓGICA PRINCIPAL ---
 
@@ -514,89 +679,108 @@ async def exit_gracefully():
     Cancela todas las tareas de asyncio excepto la actual,
     permitiendo un apagado limpio.
     """
-    print("Iniciando apagado elegante...")
+    log.info("Iniciando apagado elegante...")
     current_task = asyncio.current_task()
     tasks = [task for task in asyncio.all_tasks() if task is not current_task]
     
     if not tasks:
-        print("No hay otras tareas que cancelar.")
+        log.info("No hay otras tareas que cancelar.")
         return
 
-    print(f"Cancelando {len(tasks)} tareas pendientes...")
+    log.info(f"Cancelando {len(tasks)} tareas pendientes...")
     for task in tasks:
         task.cancel()
     
     await asyncio.sleep(0.1) # Dar tiempo a que se procesen las cancelaciones
-    print("Todas las tareas han sido señaladas para cancelación.")
+    log.info("Todas las tareas han sido señaladas para cancelación.")
 
 def limpiar_terminal():
     # 'cls' para Windows, 'clear' para Linux/macOS
     os.system('cls' if os.name == 'nt' else 'clear')
-    print("--- Terminal limpiado automáticamente ---")
+    log.info("--- Terminal limpiado automáticamente ---")
 
 async def daily_cleanup_loop(frequency_seconds=86400):
     """
     Bucle que limpia el terminal periódicamente.
-    Por defecto, cada 24 horas.
+    Por defecto, cada 24 horas. El historial completo queda en los archivos de logs/.
     """
     try:
         while True:
             await asyncio.sleep(frequency_seconds)
             limpiar_terminal()
     except asyncio.CancelledError:
-        print("Bucle de limpieza detenido.")
+        log.info("Bucle de limpieza detenido.")
 
-async def process_messages_loop(telegram_input, order_obj):
+async def process_messages_loop(telegram_input, order_obj, pending_obj=None, control=None):
     """
     Espera y procesa mensajes de Telegram.
+    pending_obj es el PendingOperations que procesa los mensajes de "ORDENES PENDIENTES". Si no se entrega, se crea uno.
+    control es el ControlCommands que atiende los mensajes que empiezan con "/" desde los chats de control.
     """
-    my_trading_account = order_obj.my_trading_account
+    if pending_obj is None:
+        pending_obj = PendingOperations(order_obj.my_trading_account, order_obj.cobertura, order_obj.estrategia)
     
     try:
         while True:
             message = await telegram_input.get_message()
-            print("\nMensaje recibido:", message)
+            log.info("Mensaje recibido", message=message)
             telegram_message = message["text"]
-            
-            if telegram_message.lower() == "quit":
-                print("Saliendo del programa. ¡Adiós! 👋")
+            profile = telegram_input.registry.get(message.get("chat_id"))
+
+            # Solo los chats de control pueden detener el bot
+            if profile.control and telegram_message.lower() == "quit":
+                await telegram_input.message_done(message)
+                log.info("Saliendo del programa. ¡Adiós! 👋")
                 await exit_gracefully()
                 break # Salir del bucle de mensajes
 
-            if "ORDENES PENDIENTES" in telegram_message:
-                pending_orders = PendingOperations(my_trading_account, order_obj.cobertura, order_obj.estrategia)
-                await pending_orders.manage_pending_orders(telegram_message)
-            else:
-                await order_obj.execute_order(telegram_message)
+            try:
+                if profile.control and control and control.is_command(telegram_message):
+                    await control.handle(telegram_message, message.get("chat_id"))
+                elif profile.pending_marker in telegram_message:
+                    await pending_obj.manage_pending_orders(telegram_message, message.get("chat_id"), message.get("date"), profile)
+                else:
+                    await order_obj.execute_order(telegram_message, message.get("chat_id"), message.get("date"), profile)
+            except Exception:
+                await telegram_input.message_done(message) # Repetirlo al reiniciar no arreglaría el error
+                raise
+            # Si el bot se apaga o se cae a mitad del mensaje, no llega aquí: queda sin marcar y se recupera al volver
+            await telegram_input.message_done(message)
 
     except asyncio.CancelledError:
-        print("Bucle de mensajes detenido limpiamente.")
+        log.info("Bucle de mensajes detenido limpiamente.")
     except Exception as e:
-        print(f"Error fatal en process_messages_loop: {e}")
+        log.error(f"Error fatal en process_messages_loop: {e}")
 
 async def monitor_coverage_loop(utilizar_cobertura, cobertura, frequency_seconds=15):
     """
-    Bucle independiente que gestiona la cobertura periódicamente.
+    Bucle independiente que gestiona la cobertura periódicamente, o antes si AccountState avisa que cambió el balance.
     """
     try:
         while utilizar_cobertura:
             try:
-                await asyncio.sleep(frequency_seconds) 
+                try:
+                    await asyncio.wait_for(cobertura.balance_changed.wait(), timeout=frequency_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                cobertura.balance_changed.clear()
                 await cobertura.gestionar_cobertura()
 
             except asyncio.CancelledError:
-                print("Monitor de cobertura detenido limpiamente.")
+                log.info("Monitor de cobertura detenido limpiamente.")
                 break 
             except Exception as e:
-                print(f"Error en el bucle de monitor_coverage_loop: {e}")
+                log.error(f"Error en el bucle de monitor_coverage_loop: {e}")
                 await asyncio.sleep(60) 
 
     except asyncio.CancelledError:
-        print("Monitor de cobertura detenido limpiamente.")
+        log.info("Monitor de cobertura detenido limpiamente.")
 
 
 async def main():
     """Función principal para iniciar el bot y los monitores."""
+    log.start() # El registro escribe en logs/ desde su propio hilo, nunca desde el bucle de eventos
+    journal.start() # Bitácora de señales y decisiones en journal/
     load_dotenv()
     api_id = int(os.getenv("TELEGRAM_API_ID"))
     api_hash = os.getenv("TELEGRAM_API_HASH")
@@ -606,24 +790,33 @@ async def main():
             "Asegúrate de que TELEGRAM_API_ID y TELEGRAM_API_HASH estén en .env"
         )
 
-    telegram_input = TelegramInput(api_id, api_hash)
+    # Executor explícito para asyncio.to_thread, así podemos medir su saturación
+    executor = ThreadPoolExecutor(thread_name_prefix="mt5")
+    asyncio.get_running_loop().set_default_executor(executor)
+    instrument_mt5(mt5)
+    executor_gauges(executor)
+
+    # Las preferencias de la estrategia se leen desde un archivo JSON que se puede editar con el bot corriendo.
+    # Puede que el usuario no quiera una cobertura, si no un stop-loss!
+    # Si el archivo no existe, se usan los valores por defecto de strategy_config.DEFAULT_CONFIG.
+    config_path = os.getenv("ESTRATEGIA_CONFIG", "estrategia.json")
+    config = load_config(config_path)
+
+    telegram_input = TelegramInput(api_id, api_hash, ChannelRegistry.from_config(config["canales"]))
+    metrics.gauge("bot_telegram_queue_depth", telegram_input.queue.qsize, "Mensajes de Telegram esperando ser procesados")
     
     # Iniciar la escucha de Telegram
     listener_task = asyncio.create_task(telegram_input.start_listening())
-    
-
-    # IMPORTANTE: En este punto, debemos descargar las preferencias del usuario para la estrategia
-    # Puede que el usuario no quiera una cobertura, si no un stop-loss!
-    # Estos parámetros están aquí mientras tanto. La idea es que se descarguen desde un campo rellenado por el usuario.
 
-    utilizar_cobertura = False
-    account_type = "USD"
+    utilizar_cobertura = config["utilizar_cobertura"]
+    account_type = config["account_type"]
+    exponer_metricas = False # Servidor HTTP local con métricas en formato Prometheus
+    puerto_metricas = 9108
+    vigilar_bucle = True # Mide el lag del bucle de eventos y captura el stack de los callbacks que lo bloquean
+    telemetria_memoria = False # Muestras periódicas de tracemalloc, RSS y objetos por tipo (tracemalloc agrega costo a cada asignación)
 
-    # Cambiar con sufijo "c" si estoy en cuenta Cent
-    parametros_cobertura = {"asset": "BTCUSD", "account_type": account_type, "margen_cobertura": 400, "balance": 0, 
-                            "break_even": 200, "trailing_stop": 400}
-    parametros_estrategia = {"distance":{"BTCUSD": 0}, "pessimistic_resistance":{"BTCUSD": 0}, 
-                             "risk": {"BTCUSD": 0.03}, "volume": {"BTCUSD": 0.01}, "asset_regex": r"BTCUSD"}
+    parametros_cobertura = {**config["cobertura"], "account_type": account_type}
+    parametros_estrategia = config["estrategia"]
     
     # Conectarse a la cuenta (esto es síncrono, se hace una vez)
     my_trading_account = TradingAccount(account_type)
@@ -631,10 +824,29 @@ async def main():
     # Configurar la cobertura (síncrono, se hace una vez)
     cobertura = strategy.Coverage(**parametros_cobertura) if utilizar_cobertura else None
     order_obj = TradingOrder(my_trading_account, cobertura, parametros_estrategia)
+    pending_obj = PendingOperations(my_trading_account, cobertura, parametros_estrategia)
+
+    # Recarga en caliente: la estrategia y los márgenes de la cobertura se reemplazan sin reiniciar
+    config_watcher = ConfigWatcher(config_path, config)
+    config_watcher.subscribe_prepared(order_obj.prepare_config)
+    config_watcher.subscribe_prepared(pending_obj.prepare_config)
+    if cobertura:
+        config_watcher.subscribe(cobertura.apply_config)
+        account_state.subscribe(cobertura.on_account_change)
+
+    # Comandos de diagnóstico (/profile, /stats) desde los chats de control
+    memory_telemetry = MemoryTelemetry(interval=600) if telemetria_memoria else None
+    control = ControlCommands(telegram_input.reply)
+    control.add_source("cola_telegram", lambda: {"depth": telegram_input.queue.qsize()})
+    control.add_source("canales", telegram_input.registry.stats)
+    control.add_source("modificaciones", modification_queue.stats)
+    control.add_source("configuracion", lambda: {"reloads": config_watcher.reloads})
+    if memory_telemetry:
+        control.add_source("memoria", memory_telemetry.stats)
 
     # --- Lanzamos las tareas concurrentes ---
     message_processor_task = asyncio.create_task(
-        process_messages_loop(telegram_input, order_obj)
+        process_messages_loop(telegram_input, order_obj, pending_obj, control)
     )
     
     coverage_monitor_task = asyncio.create_task(
@@ -642,16 +854,27 @@ async def main():
     )
 
     cleanup_task = asyncio.create_task(daily_cleanup_loop())
+    tasks = [listener_task, message_processor_task, coverage_monitor_task, cleanup_task,
+             asyncio.create_task(config_watcher.run()), asyncio.create_task(account_state.run())]
+
+    if exponer_metricas:
+        tasks.append(asyncio.create_task(metrics.serve(port=puerto_metricas)))
+    if vigilar_bucle:
+        tasks.append(asyncio.create_task(LoopWatchdog().run()))
+    if memory_telemetry:
+        tasks.append(asyncio.create_task(memory_telemetry.run()))
 
     # Esperar a que todas las tareas se completen (o sean canceladas)
     try:
-        await asyncio.gather(listener_task, message_processor_task, coverage_monitor_task, cleanup_task)
+        await asyncio.gather(*tasks)
     except asyncio.CancelledError:
-        print("El programa principal fue cancelado.")
+        log.info("El programa principal fue cancelado.")
     finally:
         # Asegurarse de que MT5 se apague limpiamente al final
         mt5.shutdown()
-        print("Conexión con MetaTrader 5 cerrada. Apagado completado.")
+        log.info("Conexión con MetaTrader 5 cerrada. Apagado completado.")
+        journal.stop()
+        log.stop()
 
 if __name__ == "__main__":
     try:
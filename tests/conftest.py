@@ -0,0 +1,50 @@
+import os
+import sys
+import types
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import MetaTrader5 # noqa: F401 (solo existe en Windows con la terminal instalada)
+except ImportError:
+    # Las pruebas no hablan con el broker: cada una reemplaza las funciones que usa con monkeypatch.
+    # Aquí solo dejamos las constantes que los módulos leen, para poder importarlos en cualquier sistema.
+    fake = types.ModuleType("MetaTrader5")
+    for name, value in {"TRADE_ACTION_DEAL": 1, "TRADE_ACTION_PENDING": 5, "TRADE_ACTION_SLTP": 6, "TRADE_ACTION_MODIFY": 7,
+                        "TRADE_ACTION_REMOVE": 8, "ORDER_TYPE_BUY": 0, "ORDER_TYPE_SELL": 1, "ORDER_TYPE_BUY_LIMIT": 2,
+                        "ORDER_TYPE_SELL_STOP": 5, "ORDER_FILLING_FOK": 0, "ORDER_FILLING_IOC": 1, "ORDER_TIME_GTC": 0,
+                        "TRADE_RETCODE_DONE": 10009, "DEAL_ENTRY_IN": 0}.items():
+        setattr(fake, name, value)
+    sys.modules["MetaTrader5"] = fake
+
+import pytest
+import MetaTrader5 as mt5
+from event_log import log
+
+AccountInfo = namedtuple("AccountInfo", "balance equity margin margin_free margin_level")
+SymbolInfo = namedtuple("SymbolInfo", "volume_min")
+Position = namedtuple("Position", "ticket symbol price_open volume sl comment")
+Order = namedtuple("Order", "ticket symbol price_open volume_initial sl comment")
+
+
+@pytest.fixture(autouse=True)
+def quiet_log(monkeypatch):
+    """ El registro no tiene el hilo escritor corriendo en las pruebas: que no acumule eventos entre pruebas. """
+    monkeypatch.setattr(log, "level", log.LEVELS["ERROR"] + 1)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    """ Estado de una cuenta simulada: posiciones, órdenes pendientes, balance e info del símbolo. """
+    from account_state import account_state
+
+    state = types.SimpleNamespace(positions=[], orders=[], balance=1000.0, volume_min=0.01, sent=[])
+    monkeypatch.setattr(mt5, "positions_get", lambda **kwargs: tuple(state.positions), raising=False)
+    monkeypatch.setattr(mt5, "orders_get", lambda **kwargs: tuple(state.orders), raising=False)
+    monkeypatch.setattr(mt5, "account_info", lambda: AccountInfo(state.balance, state.balance, 0.0, state.balance, 0.0), raising=False)
+    monkeypatch.setattr(mt5, "symbol_info", lambda symbol: None if state.volume_min is None else SymbolInfo(state.volume_min), raising=False)
+    monkeypatch.setattr(mt5, "last_error", lambda: (1, "ok"), raising=False)
+    monkeypatch.setattr(account_state, "snapshot", None)
+    account_state.invalidate()
+    return state
@@ -0,0 +1,57 @@
+from collections import namedtuple
+import pytest
+from channels import (KeywordPrefilter, ChannelRegistry, ChannelProfile, template_keywords, default_magic, DEFAULT_ORDER_TEMPLATES,
+                      DEFAULT_MAGIC)
+
+
+def test_prefilter_matches_any_keyword_ignoring_case():
+    prefilter = KeywordPrefilter(["compra", "venta", "ordenes pendientes"])
+    assert prefilter.search("COMPRA BTCUSD $100")
+    assert prefilter.search("hola\nOrdenes Pendientes:\nBuy Limit BTCUSD")
+    assert prefilter.search("revendimos: venta")
+    assert not prefilter.search("Buenos días a todos")
+    assert not prefilter.search("")
+
+
+def test_prefilter_follows_failure_links():
+    # Caso clásico de Aho-Corasick: "she" termina dentro de "ushers" y obliga a seguir los enlaces de falla
+    prefilter = KeywordPrefilter(["he", "she", "his", "hers"])
+    assert prefilter.search("ushers")
+    assert KeywordPrefilter(["abcd", "bce"]).search("xabce")
+    assert not KeywordPrefilter(["abcd", "bce"]).search("xabcx")
+
+
+def test_prefilter_without_keywords_rejects_everything():
+    assert not KeywordPrefilter([]).search("Compra BTCUSD")
+    assert not KeywordPrefilter([""]).search("Compra BTCUSD")
+
+
+def test_template_keywords_from_literal_prefix():
+    assert template_keywords(DEFAULT_ORDER_TEMPLATES) == ("buy limit", "buy limit creada", "cierre", "compra", "sl", "venta")
+
+
+@pytest.mark.parametrize("template", [r"^Compra\s({asset})", r"(?:Compra|Buy)\s({asset})", r"{asset} comprado", r"Compra.+({asset})"])
+def test_template_keywords_rejects_regex_prefixes(template):
+    with pytest.raises(ValueError):
+        template_keywords((("Compra", template),))
+
+
+def test_registry_counts_and_control_bypass():
+    registry = ChannelRegistry([ChannelProfile("vip", 1), ChannelProfile("control", 2, control=True)])
+    assert registry.accepts(1, "Compra BTCUSD $100")
+    assert not registry.accepts(1, "charla")
+    assert registry.accepts(2, "/stats")
+    assert not registry.accepts(3, "Compra BTCUSD") # Chat no registrado
+    assert registry.stats()["vip"] == {"received": 2, "rejected": 1, "reject_rate": 0.5}
+    assert registry.stats()["control"]["rejected"] == 0
+
+
+def test_orders_belong_to_the_channel_with_their_magic():
+    Order = namedtuple("Order", "ticket magic comment")
+    registry = ChannelRegistry.from_config([{"chat_id": -100123, "name": "a"}, {"chat_id": 7, "name": "b", "magic": 55}])
+    a, b = registry.get(-100123), registry.get(7)
+    assert a.magic == default_magic(-100123) and b.magic == 55
+    assert a.owns(Order(1, a.magic, "Orden Buy Limit BTCUSD"))
+    assert not a.owns(Order(2, b.magic, "Orden Buy Limit BTCUSD"))
+    assert not b.owns(Order(3, DEFAULT_MAGIC, "cobertura"))
+    assert not ChannelProfile("c", 8, magic=55).owns(Order(4, 55, "cobertura")) # La cobertura no es de nadie
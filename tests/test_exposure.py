@@ -0,0 +1,77 @@
+import pytest
+from exposure import Exposure
+
+
+def reference_stop_out(orders, balance):
+    """ La cuenta que hacía Coverage.calcular_stop_out recorriendo la lista. """
+    weighted = sum(price * volume for price, volume in orders)
+    volume = sum(volume for _, volume in orders)
+    return round(weighted / volume - balance / volume, 2)
+
+
+def test_add_and_remove_keep_running_sums():
+    exposure = Exposure()
+    exposure.add(1, "BTCUSD", 100.0, 1.0)
+    exposure.add(2, "BTCUSD", 90.0, 2.0)
+    exposure.add(3, "ETHUSD", 10.0, 0.5)
+    assert exposure.totals("BTCUSD") == (280.0, 3.0, 2)
+    assert exposure.totals("ETHUSD") == (5.0, 0.5, 1)
+
+    exposure.remove(1)
+    assert exposure.totals("BTCUSD") == (180.0, 2.0, 1)
+    exposure.remove(1) # Quitar dos veces no cambia nada
+    assert exposure.totals("BTCUSD") == (180.0, 2.0, 1)
+
+
+def test_removing_last_order_resets_asset():
+    exposure = Exposure()
+    exposure.add(1, "BTCUSD", 100.1, 0.3)
+    exposure.add(2, "BTCUSD", 99.7, 0.7)
+    exposure.remove(1)
+    exposure.remove(2)
+    assert exposure.totals("BTCUSD") == (0.0, 0.0, 0)
+    assert "BTCUSD" not in exposure.assets
+
+
+def test_add_existing_ticket_replaces_it():
+    exposure = Exposure()
+    exposure.add(1, "BTCUSD", 100.0, 1.0)
+    exposure.add(1, "BTCUSD", 95.0, 2.0)
+    assert exposure.totals("BTCUSD") == (190.0, 2.0, 1)
+
+
+def test_sync_applies_only_differences():
+    exposure = Exposure()
+    exposure.sync([(1, "BTCUSD", 100.0, 1.0), (2, "BTCUSD", 90.0, 2.0)])
+    exposure.sync([(2, "BTCUSD", 90.0, 1.0), (3, "ETHUSD", 10.0, 1.0)])
+    assert exposure.tickets == {2: ("BTCUSD", 90.0, 1.0), 3: ("ETHUSD", 10.0, 1.0)}
+    assert exposure.totals("BTCUSD") == (90.0, 1.0, 1)
+    exposure.sync([])
+    assert exposure.assets == {} and exposure.tickets == {}
+
+
+def test_stop_out_matches_list_formula_with_hypothetical_order():
+    orders = [(100.0, 1.0), (90.0, 2.0), (85.0, 0.5)]
+    exposure = Exposure()
+    for ticket, (price, volume) in enumerate(orders[:2]):
+        exposure.add(ticket, "BTCUSD", price, volume)
+    assert exposure.stop_out("BTCUSD", 50.0) == reference_stop_out(orders[:2], 50.0)
+    assert exposure.stop_out("BTCUSD", 50.0, 85.0, 0.5) == reference_stop_out(orders, 50.0)
+    assert exposure.stop_out("ETHUSD", 50.0) == 0 # Sin volumen no hay stop out
+
+
+def test_hedge_price_counts_hypothetical_order():
+    exposure = Exposure()
+    exposure.add(1, "BTCUSD", 100.0, 1.0)
+    exposure.add(2, "BTCUSD", 90.0, 2.0)
+    assert exposure.hedge_price("BTCUSD", 50.0, 5.0) == pytest.approx(exposure.stop_out("BTCUSD", 50.0) + 2 * 5.0)
+    assert exposure.hedge_price("BTCUSD", 50.0, 5.0, 85.0, 1.0) == pytest.approx(exposure.stop_out("BTCUSD", 50.0, 85.0, 1.0) + 3 * 5.0)
+
+
+def test_remaining_balance_at_resistance():
+    exposure = Exposure()
+    exposure.add(1, "BTCUSD", 100.0, 1.0)
+    exposure.add(2, "BTCUSD", 90.0, 2.0)
+    # Pérdida hasta 80: (100 - 80) * 1 + (90 - 80) * 2 + (85 - 80) * 1 = 45
+    assert exposure.remaining_balance("BTCUSD", 500.0, 80.0, 85.0, 1.0) == pytest.approx(455.0)
+    assert exposure.remaining_balance("ETHUSD", 500.0, 80.0) == 500.0
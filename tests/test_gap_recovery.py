@@ -0,0 +1,85 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from channels import ChannelRegistry
+from gap_recovery import GapRecovery
+
+
+def receive(recovery, chat_id, message_id, queued=True):
+    """ Lo que hace TelegramInput.enqueue_message: descarta duplicados y marca pendientes los que encola. """
+    if recovery.seen(chat_id, message_id): return False
+    if queued: recovery.hold(chat_id, message_id)
+    else: recovery.done(chat_id, message_id) # Descartado por el prefiltro
+    return True
+
+
+def test_queued_messages_are_not_processed_until_done(tmp_path):
+    recovery = GapRecovery(state_path=str(tmp_path / "state.json"))
+    for message_id in (1, 2, 3):
+        receive(recovery, 10, message_id)
+    assert recovery.last_ids == {}
+    assert recovery.seen(10, 2) # Duplicado aunque todavía no se procesó
+
+    recovery.done(10, 1)
+    assert recovery.last_ids == {10: 1}
+    recovery.save()
+    # Si el bot se cae ahora, al reiniciar se recuperan el 2 y el 3
+    assert json.loads((tmp_path / "state.json").read_text()) == {"10": 1}
+    restarted = GapRecovery(state_path=str(tmp_path / "state.json"))
+    assert not restarted.seen(10, 2)
+
+
+def test_skipped_messages_wait_for_older_pending_ones(tmp_path):
+    recovery = GapRecovery(state_path=str(tmp_path / "state.json"))
+    receive(recovery, 10, 1)
+    receive(recovery, 10, 2, queued=False) # Charla descartada mientras el 1 sigue en la cola
+    assert recovery.last_ids == {}
+    recovery.done(10, 1)
+    assert recovery.last_ids == {10: 2}
+    receive(recovery, 10, 3, queued=False)
+    assert recovery.last_ids == {10: 3}
+
+
+def test_done_out_of_order_advances_only_past_oldest_pending(tmp_path):
+    recovery = GapRecovery(state_path=str(tmp_path / "state.json"))
+    for message_id in (5, 6, 7):
+        receive(recovery, 10, message_id)
+    recovery.done(10, 6)
+    assert recovery.last_ids == {10: 4} # El 5 sigue pendiente: al reiniciar se recupera desde ahí
+    recovery.done(10, 5)
+    assert recovery.last_ids == {10: 6}
+    recovery.done(10, 7)
+    assert recovery.last_ids == {10: 7}
+
+
+def test_save_async_keeps_newer_changes_dirty(tmp_path):
+    recovery = GapRecovery(state_path=str(tmp_path / "state.json"))
+
+    async def scenario():
+        receive(recovery, 10, 1, queued=False)
+        saving = asyncio.ensure_future(recovery.save_async())
+        await asyncio.sleep(0) # La copia ya se tomó; la escritura corre en otro hilo
+        receive(recovery, 10, 2, queued=False)
+        await saving
+
+    asyncio.run(scenario())
+    assert recovery._dirty
+    assert json.loads((tmp_path / "state.json").read_text()) == {"10": 1}
+
+
+def test_select_uses_channel_profiles(tmp_path):
+    registry = ChannelRegistry.from_config([
+        {"chat_id": 1, "name": "vip"},
+        {"chat_id": 2, "name": "otro", "order_templates": {"Compra": r"BUY NOW ({asset})", "Buy Limit": r"LIMIT ({asset})"},
+         "pending_marker": "GRID"},
+        {"chat_id": 3, "name": "control", "control": True},
+    ])
+    old = datetime.now(timezone.utc) - timedelta(hours=1)
+    message = lambda chat_id, message_id, text: SimpleNamespace(chat_id=chat_id, id=message_id, date=old, raw_text=text)
+    messages = [message(1, 1, "Compra BTCUSD $100"), message(2, 2, "BUY NOW BTCUSD $100"),
+                message(2, 3, "GRID\nLIMIT BTCUSD 1"), message(2, 4, "GRID\nLIMIT BTCUSD 2"),
+                message(1, 5, "ORDENES PENDIENTES\nBuy Limit BTCUSD 1"), message(3, 6, "/profile start")]
+    replay, dropped = GapRecovery(state_path=str(tmp_path / "state.json")).select(messages, registry)
+    assert [m.id for m in replay] == [4, 5]
+    assert [m.id for m in dropped] == [1, 2, 3, 6]
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from collections import namedtuple
+import MetaTrader5 as mt5
+from modification_queue import ModificationQueue, TokenBucket
+
+Result = namedtuple("Result", "retcode request")
+
+
+def sltp(position, **fields):
+    return {"action": mt5.TRADE_ACTION_SLTP, "position": position, "symbol": "BTCUSD", **fields}
+
+
+def test_modifications_of_same_ticket_are_coalesced(monkeypatch):
+    sent = []
+    def order_send(request):
+        sent.append(dict(request))
+        return Result(mt5.TRADE_RETCODE_DONE, request)
+    monkeypatch.setattr(mt5, "order_send", order_send, raising=False)
+
+    async def scenario():
+        queue = ModificationQueue(rate=1000, burst=10)
+        futures = [queue.submit(sltp(1, sl=90.0, tp=120.0)), queue.submit(sltp(1, sl=95.0)),
+                   queue.submit(sltp(2, sl=50.0)),
+                   queue.submit({"action": mt5.TRADE_ACTION_MODIFY, "order": 1, "price": 80.0})]
+        results = await asyncio.gather(*futures)
+        queue._worker.cancel()
+        return queue, results
+
+    queue, results = asyncio.run(scenario())
+    # Una solicitud por (tipo, ticket), en orden de llegada y con los últimos valores de cada campo
+    assert [(request.get("position"), request.get("order")) for request in sent] == [(1, None), (2, None), (None, 1)]
+    assert sent[0]["sl"] == 95.0 and sent[0]["tp"] == 120.0
+    assert results[0] is results[1] # Las modificaciones fusionadas reciben el mismo resultado
+    assert queue.stats() == {"submitted": 4, "sent": 3, "pending": 0, "saved": 1}
+
+
+def test_token_bucket_allows_burst_then_limits_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=50, burst=3)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        burst_elapsed = time.monotonic() - started
+        for _ in range(5):
+            await bucket.acquire()
+        return burst_elapsed, time.monotonic() - started
+
+    burst_elapsed, total_elapsed = asyncio.run(scenario())
+    assert burst_elapsed < 0.02
+    assert total_elapsed >= 5 / 50 * 0.9 # Los 5 envíos posteriores a la ráfaga esperan 1/rate cada uno
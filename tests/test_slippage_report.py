@@ -0,0 +1,49 @@
+import time
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import MetaTrader5 as mt5
+import slippage_report
+from slippage_report import build_report, summarize, estimate_server_offset
+
+Tick = namedtuple("Tick", "time")
+HOUR = 3600.0
+
+
+def signals_and_deals():
+    signals = pd.DataFrame({
+        "ticket": [1, 2, 3], "chat_id": [1, 1, 1], "asset": ["BTCUSD"] * 3,
+        "order_type": ["Compra", "Venta", "Buy Limit"], "signal_price": [100.0, 100.0, 90.0],
+        "message_ts": [1000.0, 1000.0, 1000.0], "is_buy": [True, False, True],
+    })
+    server = 3 * HOUR # Servidor en UTC+3
+    deals = pd.DataFrame({
+        "order": [1, 2, 3, 3], "price": [101.0, 99.0, 90.0, 90.5], "volume": [1.0, 1.0, 1.0, 1.0],
+        "time_msc": [(1002 + server) * 1000, (1004 + server) * 1000, (1000 + 2 * 86400 + server) * 1000, (1000 + 3 * 86400 + server) * 1000],
+        "entry": [0, 0, 0, 0],
+    })
+    return signals, deals
+
+
+def test_delay_only_for_market_orders_and_in_utc():
+    report = build_report(*signals_and_deals(), server_offset=3).set_index("ticket")
+    assert report.loc[1, "delay"] == 2.0 and report.loc[2, "delay"] == 4.0
+    assert np.isnan(report.loc[3, "delay"]) # Un Buy Limit no mide la demora de la señal
+    assert report["slippage"].tolist() == [1.0, 1.0, 0.25] # Siempre positivo en contra; el Buy Limit promedia sus deals
+
+    summary = summarize(report.reset_index(), "asset")
+    assert summary.loc["BTCUSD", ("delay", "count")] == 2
+    assert summary.loc["BTCUSD", ("delay", "p99")] <= 4.0
+    assert summary.loc["BTCUSD", ("slippage", "count")] == 3
+
+
+def test_server_offset_estimate_rejects_stale_ticks(monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(slippage_report.time, "time", lambda: now)
+    monkeypatch.setattr(mt5, "symbol_info_tick", lambda asset: Tick(now + 3 * HOUR + 5), raising=False)
+    assert estimate_server_offset("BTCUSD") == 3
+    # Mercado cerrado desde el viernes: el último tick tiene dos días
+    monkeypatch.setattr(mt5, "symbol_info_tick", lambda asset: Tick(now + 2 * HOUR - 2 * 86400), raising=False)
+    assert estimate_server_offset("EURUSD") is None
+    monkeypatch.setattr(mt5, "symbol_info_tick", lambda asset: None, raising=False)
+    assert estimate_server_offset("EURUSD") is None
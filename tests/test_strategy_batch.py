@@ -0,0 +1,99 @@
+import asyncio
+from conftest import Position, Order
+from strategy import Strategy, Coverage, Signal
+
+ASSET = "BTCUSD"
+
+
+def make_strategy(cover=None, distance=5.0, resistance=None, risk=0.01, volume=1.0):
+    return Strategy(cover, {ASSET: distance}, None if resistance is None else {ASSET: resistance}, {ASSET: risk}, {ASSET: volume})
+
+
+def level(price, stop_loss=50.0, asset=ASSET):
+    return Signal("Buy Limit", asset, price, stop_loss, 0.0, 0.0, price)
+
+
+def run_batch(strategy, signals):
+    return asyncio.run(strategy.filter_batch(signals))
+
+
+def reasons(decisions):
+    return [decision.reason for decision in decisions]
+
+
+def test_decisions_follow_input_order_and_prioritize_higher_prices(broker):
+    decisions = run_batch(make_strategy(distance=5.0), [level(96.0), level(100.0), level(80.0)])
+    # 100 tiene prioridad sobre 96 (están a menos de 5): se rechaza 96 aunque venga primero
+    assert reasons(decisions) == ["distance", "filters_passed", "filters_passed"]
+    assert [decision.accepted for decision in decisions] == [False, True, True]
+    assert [decision.volume for decision in decisions] == [1.0, 1.0, 1.0]
+
+
+def test_distance_to_existing_orders(broker):
+    broker.orders = [Order(1, ASSET, 92.0, 1.0, 0.0, "")]
+    decisions = run_batch(make_strategy(distance=5.0), [level(100.0), level(90.0)])
+    assert reasons(decisions) == ["filters_passed", "distance"]
+
+
+def test_asset_regex_and_unknown_symbol(broker):
+    strategy = Strategy(None, {ASSET: 5.0}, None, {ASSET: 0.01}, {ASSET: 1.0}, asset_regex=r"BTC")
+    assert reasons(run_batch(strategy, [level(100.0, asset="ETHUSD")])) == ["asset_regex"]
+
+    broker.volume_min = None # symbol_info devuelve None
+    decisions = run_batch(make_strategy(resistance=0), [level(100.0), level(90.0)])
+    assert reasons(decisions) == ["symbol_info", "symbol_info"]
+    assert not any(decision.accepted for decision in decisions)
+
+
+def test_risk_sized_volume_below_minimum_is_rejected(broker):
+    broker.balance = 100.0
+    broker.volume_min = 0.1
+    # 1 % de 100 arriesgado hasta el stop loss: 1 / (100 - 50) = 0.02 lotes, menos que el mínimo
+    decisions = run_batch(make_strategy(volume=0), [level(100.0)])
+    assert reasons(decisions) == ["volume"]
+    assert not decisions[0].accepted
+
+
+def test_risk_cutoff_falls_back_to_min_volume(broker):
+    broker.balance = 100.0
+    # Pérdida hasta el stop loss (50) con 1 lote: 50 + 40 = 90; el tercer nivel (30 más) ya no entra con 1 lote
+    decisions = run_batch(make_strategy(resistance=0, distance=1.0), [level(100.0), level(90.0), level(80.0)])
+    assert reasons(decisions) == ["filters_passed", "filters_passed", "min_volume"]
+    assert [decision.volume for decision in decisions] == [1.0, 1.0, 0.01]
+    assert all(decision.accepted for decision in decisions)
+
+
+def test_risk_cutoff_rejects_when_min_volume_does_not_fit(broker):
+    broker.balance = 90.1
+    decisions = run_batch(make_strategy(resistance=0, distance=1.0), [level(100.0), level(90.0), level(80.0), level(70.0)])
+    # 90.1 - 90 - 0.3 < 0: desde el tercer nivel se rechaza todo, aunque el cuarto por sí solo entraría
+    assert reasons(decisions) == ["filters_passed", "filters_passed", "risk_exposure", "risk_exposure"]
+    assert [decision.accepted for decision in decisions] == [True, True, False, False]
+
+
+def test_risk_counts_existing_positions(broker):
+    broker.balance = 100.0
+    broker.positions = [Position(1, ASSET, 120.0, 1.0, 0.0, "")] # Pierde 70 hasta el stop loss de los niveles nuevos
+    decisions = run_batch(make_strategy(resistance=0, distance=1.0), [level(100.0), level(90.0)])
+    assert reasons(decisions) == ["min_volume", "min_volume"]
+
+
+def test_coverage_cutoff(broker):
+    broker.balance = 50.0
+    cover = Coverage(ASSET, "USD", margen_cobertura=5.0)
+    decisions = run_batch(make_strategy(cover=cover, distance=1.0), [level(100.0), level(90.0), level(80.0)])
+    # Cobertura tras cada nivel: 55, 80 y 88.33 (stop out + 5 por orden); el tercero queda por debajo
+    assert reasons(decisions) == ["filters_passed", "filters_passed", "coverage"]
+    assert [decision.accepted for decision in decisions] == [True, True, False]
+
+
+def test_coverage_uses_existing_orders(broker):
+    broker.balance = 50.0
+    broker.orders = [Order(1, ASSET, 100.0, 1.0, 0.0, ""), Order(2, ASSET, 90.0, 1.0, 0.0, "")]
+    cover = Coverage(ASSET, "USD", margen_cobertura=5.0)
+    # Con las dos órdenes existentes, el nivel de 80 es el tercero: igual que en test_coverage_cutoff
+    assert reasons(run_batch(make_strategy(cover=cover, distance=1.0), [level(80.0)])) == ["coverage"]
+    # La cobertura ignora la orden "cobertura" y las que tienen el stop loss en break even
+    broker.orders = [Order(1, ASSET, 100.0, 1.0, 0.0, ""), Order(2, ASSET, 90.0, 1.0, 90.0, ""),
+                     Order(3, ASSET, 40.0, 2.0, 0.0, "cobertura")]
+    assert reasons(run_batch(make_strategy(cover=cover, distance=1.0), [level(82.0)])) == ["filters_passed"]
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import pytest
+from strategy_config import ConfigError, ConfigWatcher, validate, grid_levels
+
+
+def test_validate_fills_defaults_and_rejects_unknown_keys():
+    config = validate({"estrategia": {"volume": {"BTCUSD": 0.02}}})
+    assert config["estrategia"]["volume"] == {"BTCUSD": 0.02}
+    assert config["estrategia"]["risk"] == {"BTCUSD": 0.03}
+
+    with pytest.raises(ConfigError, match="riesgo"):
+        validate({"estrategia": {"riesgo": {"BTCUSD": 0.03}}})
+    with pytest.raises(ConfigError, match="trailing"):
+        validate({"cobertura": {"trailing": 100}})
+    with pytest.raises(ConfigError, match="pending"):
+        validate({"canales": [{"chat_id": 1, "pending": "GRID"}]})
+    with pytest.raises(ConfigError, match="Sección desconocida"):
+        validate({"estrategias": {}})
+
+
+def test_validate_checks_values():
+    with pytest.raises(ConfigError, match="mismos activos"):
+        validate({"estrategia": {"risk": {"ETHUSD": 0.01}}})
+    with pytest.raises(ConfigError, match="mayor a 1"):
+        validate({"estrategia": {"risk": {"BTCUSD": 3}}})
+    with pytest.raises(ConfigError, match="asset_regex"):
+        validate({"estrategia": {"asset_regex": "BTC("}})
+    with pytest.raises(ConfigError, match="keywords"):
+        validate({"canales": [{"chat_id": 1, "order_templates": {"Compra": r"^Compra ({asset})"}}]})
+
+
+def test_validate_rejects_shared_or_reserved_magic():
+    validate({"canales": [{"chat_id": 1}, {"chat_id": 2, "magic": 10}]})
+    with pytest.raises(ConfigError, match="mismo magic"):
+        validate({"canales": [{"chat_id": 1, "magic": 10}, {"chat_id": 2, "magic": 10}]})
+    with pytest.raises(ConfigError, match="reservado"):
+        validate({"canales": [{"chat_id": 1, "magic": 1234}]})
+    with pytest.raises(ConfigError, match="entero"):
+        validate({"canales": [{"chat_id": 1, "magic": "10"}]})
+
+
+def test_grid_levels_use_channel_templates():
+    text = "ORDENES PENDIENTES\nBuy Limit BTCUSD 100 Sl: 90\nBuy Limit US30 39000.5\nCompra BTCUSD $120"
+    assert grid_levels(text) == {("Buy Limit BTCUSD 100 Sl: 90", "BTCUSD", 100.0), ("Buy Limit US30 39000.5", "US30", 39000.5)}
+    templates = (("Buy Limit", r"LIMIT ({asset})"), ("Compra", r"BUY NOW ({asset})"))
+    assert grid_levels("GRID\n  LIMIT BTCUSD @ $95.5\nBUY NOW BTCUSD 100\nPendiente BTCUSD 90", templates) == {("LIMIT BTCUSD @ $95.5", "BTCUSD", 95.5)}
+
+
+class Subscriber:
+    """ Suscriptor en dos fases que falla al preparar si se le pide. """
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.volume = None
+
+    def prepare_config(self, config):
+        if self.fail: raise TypeError("no se pudo crear la estrategia")
+        volume = config["estrategia"]["volume"]
+        def commit():
+            self.volume = volume
+        return commit
+
+
+def reload(tmp_path, raw, subscribers, plain=()):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({}))
+    watcher = ConfigWatcher(str(path), validate({}))
+    for subscriber in subscribers:
+        watcher.subscribe_prepared(subscriber.prepare_config)
+    for callback in plain:
+        watcher.subscribe(callback)
+    path.write_text(json.dumps(raw))
+    return watcher, asyncio.run(watcher.reload())
+
+
+def test_reload_applies_to_every_subscriber_or_none(tmp_path):
+    applied = []
+    first, second = Subscriber(), Subscriber()
+    watcher, reloaded = reload(tmp_path, {"estrategia": {"volume": {"BTCUSD": 0.05}}}, [first, second], [applied.append])
+    assert reloaded and watcher.reloads == 1
+    assert first.volume == second.volume == {"BTCUSD": 0.05}
+    assert applied == [watcher.config]
+
+    # El segundo suscriptor falla al preparar: el primero y los simples no se tocan
+    first, second = Subscriber(), Subscriber(fail=True)
+    applied = []
+    watcher, reloaded = reload(tmp_path, {"estrategia": {"volume": {"BTCUSD": 0.05}}}, [first, second], [applied.append])
+    assert not reloaded and watcher.reloads == 0
+    assert first.volume is None and applied == []
+    assert watcher.config["estrategia"]["volume"] == {"BTCUSD": 0.01}
+
+
+def test_reload_rejects_invalid_file_and_keeps_restart_only_fields(tmp_path):
+    subscriber = Subscriber()
+    watcher, reloaded = reload(tmp_path, {"estrategia": {"riesgo": {"BTCUSD": 0.03}}}, [subscriber])
+    assert not reloaded and subscriber.volume is None
+
+    watcher, reloaded = reload(tmp_path, {"account_type": "USC", "cobertura": {"break_even": 100}}, [subscriber])
+    assert reloaded
+    assert watcher.config["account_type"] == "USD" # Requiere reiniciar: se conserva el valor actual
+    assert watcher.config["cobertura"]["break_even"] == 100
+
+
+def test_watcher_survives_reload_errors(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({}))
+    watcher = ConfigWatcher(str(path), validate({}), interval=0.01)
+    calls = []
+    async def failing_reload():
+        calls.append(1)
+        raise RuntimeError("fallo inesperado")
+    monkeypatch.setattr(watcher, "reload", failing_reload)
+
+    async def scenario():
+        task = asyncio.create_task(watcher.run())
+        for size in (1, 2):
+            path.write_text(json.dumps({"account_type": "USD"}) + " " * size) # Cambia el tamaño: cambia la firma
+            await asyncio.sleep(0.1)
+        assert not task.done()
+        task.cancel()
+        await task
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+from trade_journal import TradeJournal, JOURNAL_DTYPE, would_be_pnl
+
+DAY = 86400.0
+
+
+def write(journal, ts, **fields):
+    """ Agrega una fila con la fecha indicada y la escribe como un segmento propio, como hace el hilo escritor. """
+    journal.record(**fields)
+    journal.buffer[-1] = (ts,) + journal.buffer[-1][1:]
+    journal._write_segment()
+
+
+def test_query_filters(tmp_path):
+    journal = TradeJournal(directory=str(tmp_path))
+    write(journal, 1000.0, asset="BTCUSD", order_type="Compra", accepted=True, reason="filters_passed", chat_id=1)
+    write(journal, 2000.0, asset="BTCUSD", order_type="Buy Limit", accepted=False, reason="distance", chat_id=1)
+    write(journal, 3000.0, asset="ETHUSD", order_type="Venta", accepted=True, reason="filters_passed", chat_id=2)
+
+    assert len(journal.query()) == 3
+    assert journal.query(asset="BTCUSD", accepted=False)["reason"].tolist() == [b"distance"]
+    assert journal.query(chat_id=2)["asset"].tolist() == [b"ETHUSD"]
+    assert journal.query(since=1500.0, until=2500.0)["ts"].tolist() == [2000.0]
+    assert journal.segments(since=2500.0) == [path for path in journal.segments() if "3000" in os.path.basename(path)]
+    assert len(journal.query(order_type="Cierre")) == 0
+
+
+def test_compact_merges_closed_days(tmp_path):
+    journal = TradeJournal(directory=str(tmp_path))
+    start = 10 * DAY # 00:00 UTC del 11/01/1970
+    for hour in range(0, 48, 2):
+        write(journal, start + hour * 3600, asset="BTCUSD", accepted=hour % 4 == 0)
+    today = start + 2 * DAY
+    write(journal, today + 60, asset="BTCUSD")
+    before = journal.query()
+
+    journal.compact(before="19700113")
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 3 # Un segmento por cada día cerrado y el de hoy sin tocar
+    after = journal.query()
+    assert np.array_equal(np.sort(after["ts"]), np.sort(before["ts"]))
+    assert len(journal.query(accepted=True)) == 12
+
+    # Un segmento tardío del mismo día se suma al compactado sin duplicar filas
+    write(journal, start + 3600, asset="ETHUSD")
+    journal.compact(before="19700113")
+    assert len(os.listdir(tmp_path)) == 3
+    assert len(journal.query()) == len(before) + 1
+
+
+def test_would_be_pnl_sign_by_direction():
+    journal_rows = np.zeros(2, dtype=JOURNAL_DTYPE)
+    journal_rows["order_type"] = [b"Compra", b"Venta"]
+    journal_rows["price"] = [100.0, 100.0]
+    journal_rows["volume"] = [2.0, 2.0]
+    assert would_be_pnl(journal_rows, 110.0).tolist() == [20.0, -20.0]
+
+
+def test_query_relists_when_compaction_removes_a_segment(tmp_path, monkeypatch):
+    journal = TradeJournal(directory=str(tmp_path))
+    start = 10 * DAY
+    for hour in range(4):
+        write(journal, start + hour * 3600, asset="BTCUSD")
+
+    listed = journal.segments
+    calls = []
+    def segments_then_compact(since=None, until=None):
+        paths = listed(since, until)
+        if not calls: journal.compact(before="19700112") # Compacta entre el listado y la lectura
+        calls.append(paths)
+        return paths
+    monkeypatch.setattr(journal, "segments", segments_then_compact)
+
+    assert len(journal.query()) == 4
+    assert len(calls) == 2
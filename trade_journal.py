@@ -0,0 +1,216 @@
+import os
+import glob
+import time
+import threading
+from datetime import datetime, timezone
+from collections import deque
+import numpy as np
+from event_log import log
+
+# Una fila por señal procesada. Los textos se guardan como bytes de largo fijo para que cada segmento
+# sea un arreglo NumPy contiguo que se puede abrir con memmap y filtrar de forma vectorizada.
+JOURNAL_DTYPE = np.dtype([
+    ("ts", "f8"),            # Momento de la decisión (epoch en segundos)
+    ("message_ts", "f8"),    # Fecha del mensaje de Telegram (epoch). NaN si no se conoce
+    ("chat_id", "i8"),       # Chat de origen de la señal
+    ("asset", "S12"),
+    ("order_type", "S16"),
+    ("signal_price", "f8"),  # Precio escrito en el mensaje de Telegram
+    ("price", "f8"),         # Precio usado para la orden (ask/bid en órdenes a mercado)
+    ("stop_loss", "f8"),
+    ("take_profit", "f8"),
+    ("volume", "f8"),        # Volumen enviado a MT5
+    ("accepted", "?"),       # Veredicto de Strategy.filter_order
+    ("reason", "S16"),       # Motivo del veredicto
+    ("retcode", "i4"),       # Retcode de order_send. -1 si la orden no se envió
+    ("ticket", "i8"),
+    ("fill_price", "f8"),
+    ("fill_volume", "f8"),
+])
+
+# Tipos de orden que abren posiciones de compra. El resto (Venta) se considera venta al calcular P&L.
+BUY_ORDER_TYPES = (b"Compra", b"Buy Limit")
+
+class TradeJournal:
+    """ Bitácora columnar, de solo agregado, de todas las señales y sus decisiones.
+
+    record() solo agrega una tupla a un buffer en memoria; un hilo en segundo plano convierte el buffer en un
+    arreglo estructurado y lo guarda como un segmento .npy. Los segmentos nunca se modifican, y su nombre
+    incluye el rango de tiempo que cubren, de modo que las consultas por fecha se saltan los que no aplican.
+
+    Como se escribe un segmento por intervalo, los de cada día UTC ya cerrado se compactan en uno solo
+    (ver compact), así una consulta de un mes abre unos 30 archivos en vez de decenas de miles.
+
+    Argumentos:
+    - directory: Carpeta donde se guardan los segmentos.
+    - segment_rows: Cantidad de filas a partir de la cual escribimos un segmento sin esperar al intervalo.
+    - flush_interval: Cada cuántos segundos escribimos lo acumulado, aunque sean pocas filas.
+    """
+
+    def __init__(self, directory="journal", segment_rows=4096, flush_interval=30.0):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.flush_interval = flush_interval
+        self.buffer = deque()
+        self._sequence = 0
+        self._compacted_day = None # Último día para el que ya corrió compact()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Escritura ---
+
+    def record(self, asset="", order_type="", signal_price=np.nan, price=np.nan, stop_loss=0.0, take_profit=0.0,
+               volume=0.0, accepted=False, reason="", retcode=-1, ticket=0, fill_price=np.nan, fill_volume=0.0,
+               chat_id=0, message_ts=np.nan):
+        """ Agrega una fila. Los valores deben venir ya convertidos; aquí no se valida nada para no frenar al llamador. """
+        self.buffer.append((time.time(), message_ts, chat_id, asset.encode(), order_type.encode(), signal_price, price,
+                            stop_loss, take_profit, volume, accepted, reason.encode(), retcode, ticket, fill_price,
+                            fill_volume))
+        if len(self.buffer) >= self.segment_rows: self._wakeup.set()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive(): return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trade-journal-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if self._thread is None: return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._write_segment()
+            today = _day(time.time())
+            if today != self._compacted_day: # Una vez por día (y al iniciar), después de escribir lo pendiente
+                self._compacted_day = today
+                self.compact()
+        self._write_segment()
+
+    def compact(self, before=None):
+        """ Une los segmentos de cada día UTC anterior a `before` (por defecto, hoy) en un solo segmento del día.
+
+        El segmento del día se escribe antes de borrar los originales, y segments() ignora los originales de un día
+        ya compactado, así que una consulta concurrente no ve filas repetidas. Si un segmento que la consulta ya
+        listó se borra antes de abrirlo, query() vuelve a listar y empieza de nuevo, así que tampoco le faltan filas.
+        """
+        before = before or _day(time.time())
+        by_day = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.npy"))):
+            parts = os.path.basename(path)[:-4].split("-")
+            if len(parts) != 4: continue # Ya es un segmento diario
+            day = _day(float(parts[0]))
+            if day < before: by_day.setdefault(day, []).append(path)
+
+        for day, paths in by_day.items():
+            try:
+                existing = glob.glob(os.path.join(self.directory, f"*-{day}.npy"))
+                segment = np.concatenate([np.load(path) for path in existing + paths])
+                segment = segment[np.argsort(segment["ts"], kind="stable")]
+                name = f"{segment['ts'][0]:.0f}-{segment['ts'][-1]:.0f}-{day}.npy"
+                temporary = os.path.join(self.directory, name + ".tmp")
+                with open(temporary, "wb") as file:
+                    np.save(file, segment)
+                os.replace(temporary, os.path.join(self.directory, name))
+                for path in existing + paths:
+                    if os.path.basename(path) != name: os.remove(path)
+                log.info("Bitácora compactada", day=day, segments=len(paths), rows=len(segment))
+            except Exception as e:
+                log.error("No se pudo compactar la bitácora", day=day, error=str(e))
+
+    def _write_segment(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self.buffer.popleft())
+            except IndexError:
+                break
+        if not rows: return
+        try:
+            segment = np.array(rows, dtype=JOURNAL_DTYPE)
+            self._sequence += 1
+            name = f"{segment['ts'][0]:.0f}-{segment['ts'][-1]:.0f}-{os.getpid()}-{self._sequence:06d}.npy"
+            # Escribimos en un temporal y renombramos, así un lector nunca abre un segmento a medio escribir
+            temporary = os.path.join(self.directory, name + ".tmp")
+            with open(temporary, "wb") as file:
+                np.save(file, segment)
+            os.replace(temporary, os.path.join(self.directory, name))
+        except Exception as e:
+            log.error("No se pudo escribir el segmento de la bitácora", rows=len(rows), error=str(e))
+
+    # --- Lectura ---
+
+    def segments(self, since=None, until=None) -> list:
+        """ Rutas de los segmentos cuyo rango de tiempo se cruza con [since, until]. """
+        paths = []
+        names = [os.path.basename(path)[:-4].split("-") for path in sorted(glob.glob(os.path.join(self.directory, "*.npy")))]
+        # Un segmento por día compactado: si al recompactar quedaron dos por un instante, el nuevo cubre al viejo
+        compacted = {}
+        for parts in names:
+            if len(parts) == 3 and (parts[2] not in compacted or float(parts[1]) > float(compacted[parts[2]][1])):
+                compacted[parts[2]] = parts
+        for parts in names:
+            first, last = parts[:2]
+            if len(parts) == 3 and compacted[parts[2]] is not parts: continue
+            # Originales que quedaron de un día ya compactado (compact los borra justo después)
+            if len(parts) == 4 and _day(float(first)) in compacted: continue
+            path = os.path.join(self.directory, "-".join(parts) + ".npy")
+            if since is not None and float(last) + 1 < since: continue
+            if until is not None and float(first) > until: continue
+            paths.append(path)
+        return paths
+
+    def query(self, asset=None, order_type=None, accepted=None, reason=None, chat_id=None, since=None, until=None) -> np.ndarray:
+        """ Devuelve las filas que cumplen todos los filtros indicados como un arreglo estructurado.
+
+        Cada segmento se abre con memmap y se filtra con una máscara vectorizada; solo se copian las filas que coinciden.
+        Si compact() borra un segmento entre que se lista y se abre, la consulta vuelve a empezar con la lista nueva
+        (el segmento diario que lo reemplazó ya tiene sus filas).
+        Ejemplo: journal.query(asset="BTCUSD", accepted=False, since=time.time() - 30 * 86400)
+        """
+        for attempt in range(3):
+            try:
+                return self._scan(self.segments(since, until), asset, order_type, accepted, reason, chat_id, since, until)
+            except FileNotFoundError:
+                if attempt == 2: raise
+
+    def _scan(self, paths, asset, order_type, accepted, reason, chat_id, since, until) -> np.ndarray:
+        matches = []
+        for path in paths:
+            segment = np.load(path, mmap_mode="r")
+            mask = np.ones(len(segment), dtype=bool)
+            if asset is not None: mask &= segment["asset"] == asset.encode()
+            if order_type is not None: mask &= segment["order_type"] == order_type.encode()
+            if accepted is not None: mask &= segment["accepted"] == accepted
+            if reason is not None: mask &= segment["reason"] == reason.encode()
+            if chat_id is not None: mask &= segment["chat_id"] == chat_id
+            if since is not None: mask &= segment["ts"] >= since
+            if until is not None: mask &= segment["ts"] <= until
+            if mask.any(): matches.append(np.asarray(segment[mask]))
+        if not matches: return np.empty(0, dtype=JOURNAL_DTYPE)
+        return np.concatenate(matches)
+
+
+def _day(timestamp: float) -> str:
+    """ Día UTC del instante, como AAAAMMDD. """
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m%d")
+
+
+def would_be_pnl(rows: np.ndarray, exit_price) -> np.ndarray:
+    """ P&L que habría tenido cada fila si se hubiese cerrado a exit_price (escalar o arreglo del mismo largo).
+
+    Para las filas rechazadas, el volumen guardado es el que se habría enviado de aceptarse la orden.
+    """
+    direction = np.where(np.isin(rows["order_type"], BUY_ORDER_TYPES), 1.0, -1.0)
+    return (np.asarray(exit_price, dtype="f8") - rows["price"]) * rows["volume"] * direction
+
+
+# Instancia compartida por todos los módulos del bot. main() la inicia y la detiene.
+journal = TradeJournal()